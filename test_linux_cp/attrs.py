@@ -0,0 +1,125 @@
+"""
+File attributes of test structures, set with `chattr`.
+
+Attributes like i (immutable) and a (append only) need CAP_LINUX_IMMUTABLE,
+so `chattr` runs through `sudo -n` unless the process runs as root; sudo
+must allow it w/o a password (see README.md). Besides, the filesystem has to
+support the attribute: tmpfs, for one, ignores most of them.
+
+`chattr` takes any amount of files, so attributes are applied to many files
+in one privileged call. `probe_attrs` finds out once per filesystem which
+attributes can be set at all.
+"""
+
+import os
+import subprocess
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple, Union
+
+# Attributes tests rely on.
+ATTRS = "iaA"
+# Files per `chattr` call, to stay far from the argument size limit.
+BATCH_SIZE = 4096
+
+_probed: Dict[Tuple[int, str], "AttrSupport"] = {}
+
+
+def privilege_prefix() -> List[str]:
+    """
+    Command prefix to run `chattr` with enough privileges.
+    """
+    return [] if os.geteuid() == 0 else ["sudo", "-n"]
+
+
+def run_chattr(
+    attr: str, files: Sequence[Union[str, Path]], env=None
+) -> subprocess.CompletedProcess:
+    """
+    Apply <attr> (e.g. "+i", "-a") to all <files>, in as few `chattr` calls
+    as possible. The result has the exit code of the worst call and the
+    output of all of them.
+    """
+    prefix = privilege_prefix() + ["chattr", attr, "--"]
+    files = [os.fspath(x) for x in files]
+    returncode, stdout, stderr = 0, b"", b""
+    for start in range(0, len(files), BATCH_SIZE):
+        argv = prefix + files[start : start + BATCH_SIZE]
+        try:
+            subp = subprocess.run(
+                argv, env=env, capture_output=True, check=False
+            )
+        except FileNotFoundError as err:
+            return subprocess.CompletedProcess(
+                argv, 127, stdout, stderr + f"{err}\n".encode()
+            )
+        returncode = max(returncode, subp.returncode)
+        stdout += subp.stdout
+        stderr += subp.stderr
+    return subprocess.CompletedProcess(prefix, returncode, stdout, stderr)
+
+
+@dataclass(frozen=True)
+class AttrSupport:
+    """
+    Attributes `chattr` can set on a filesystem: <attrs>, and why it can't
+    set the others (<reasons>, by attribute).
+    """
+
+    attrs: FrozenSet[str]
+    reasons: Dict[str, str] = field(default_factory=dict)
+
+    def missing(self, attrs: str) -> Optional[str]:
+        """
+        Why some of <attrs> can't be set, None if all of them can.
+        """
+        for attr in attrs:
+            if attr not in self.attrs:
+                return f"chattr +{attr}: {self.reasons.get(attr, 'unknown')}"
+        return None
+
+
+def probe_attrs(
+    directory: Union[str, Path], attrs: str = ATTRS, env=None
+) -> AttrSupport:
+    """
+    Find out which of <attrs> can be set on files in <directory>, by setting
+    and clearing them on a scratch file. Results are cached per filesystem.
+
+    If the privileged call itself fails (no sudo, a password required),
+    the rest of attributes aren't tried.
+    """
+    key = (os.stat(directory).st_dev, attrs)
+    if key in _probed:
+        return _probed[key]
+
+    supported, reasons = set(), {}
+    fd, probe = tempfile.mkstemp(prefix=".chattr-probe-", dir=directory)
+    os.close(fd)
+    try:
+        for attr in attrs:
+            result = run_chattr(f"+{attr}", [probe], env=env)
+            if result.returncode == 0:
+                run_chattr(f"-{attr}", [probe], env=env)
+                supported.add(attr)
+                continue
+            reason = result.stderr.decode(errors="replace").strip()
+            reasons[attr] = reason or f"exit code {result.returncode}"
+            if not _reached_chattr(result):
+                reasons.update(
+                    {x: reasons[attr] for x in attrs if x not in supported}
+                )
+                break
+    finally:
+        os.unlink(probe)
+    _probed[key] = AttrSupport(frozenset(supported), reasons)
+    return _probed[key]
+
+
+def _reached_chattr(result: subprocess.CompletedProcess) -> bool:
+    """
+    Whether the failure of a `run_chattr` call comes from `chattr` itself,
+    rather than from getting privileges to run it.
+    """
+    return result.returncode != 127 and result.stderr.startswith(b"chattr")
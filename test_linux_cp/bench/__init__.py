@@ -0,0 +1,5 @@
+"""
+Performance benchmarks of the `cp` command, built on DirStructure.
+
+Run `python -m test_linux_cp.bench --help` for the list of benchmarks.
+"""
@@ -0,0 +1,9 @@
+"""
+Entry point of `python -m test_linux_cp.bench`.
+"""
+
+import sys
+
+from test_linux_cp.bench.cli import main
+
+sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Cost of `cp --backup=numbered` with many backups already in place.
+
+To pick the next backup number, `cp` reads the whole destination directory
+looking for `<dst>.~N~` names, so every copy costs time linear in the size
+of the directory. The destination gets N empty backups, and the latency of
+a copy over it is measured as N grows; the backup made by a measured copy
+is removed right away, so N stays fixed within a point.
+"""
+
+import os
+import statistics
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+from test_linux_cp.bench.runner import (
+    BenchError,
+    BenchResult,
+    bench_result,
+    bench_root,
+)
+from test_linux_cp.dir_structure import DirStructure
+from test_linux_cp.process import ResourceUsage
+from test_linux_cp.storage import Storage
+
+BACKUP_COUNTS = [0, 10, 100, 1000, 10000, 100000]
+FLAGS = "--backup=numbered"
+# Default bound of the latency growth per existing backup, seconds.
+PER_ENTRY_BOUND = 2e-6
+# Points with fewer backups are too noisy to check against the bound.
+MIN_CHECKED = 1000
+_SRC = "srcA"
+_DST = "Backups/dst"
+
+
+def measure_backups(
+    structure: DirStructure, count: int, repeat: int = 20, warmup: int = 2
+) -> List[ResourceUsage]:
+    """
+    Copy over a destination with <count> existing backups <warmup> +
+    <repeat> times, return resources used by the last <repeat> runs.
+    """
+    backup = structure.root_dir / f"{_DST}.~{count + 1}~"
+    usages = []
+    for run in range(warmup + repeat):
+        structure.prepare_copy()
+        result = structure.call_copy(
+            _SRC, _DST, FLAGS, timeout=None, instrument=True
+        )
+        if result.returncode != 0:
+            raise BenchError(
+                f"cp {FLAGS} {_SRC} {_DST} failed: "
+                f"{result.stderr.decode(errors='replace').strip()}"
+            )
+        try:
+            backup.unlink()
+        except FileNotFoundError:
+            raise BenchError(
+                f"cp {FLAGS} didn't create {backup.name} over {count} backups"
+            ) from None
+        if run >= warmup:
+            usages.append(result.usage)
+    return usages
+
+
+def run_backups(
+    counts: Sequence[int] = tuple(BACKUP_COUNTS),
+    repeat: int = 20,
+    warmup: int = 2,
+    storage: Optional[Storage] = None,
+) -> List[BenchResult]:
+    """
+    Measure copies over destinations with every amount of backups of
+    <counts>. Backups are added to the same directory, in increasing order.
+    """
+    results = []
+    with bench_root(storage) as (backend, base_dir):
+        structure = DirStructure(base_dir / "backups", storage=backend)
+        (structure.root_dir / _DST).parent.mkdir()
+        structure.call_copy(_SRC, _DST)
+        existing = 0
+        for count in sorted(counts):
+            structure.make_backups(_DST, count - existing, start=existing + 1)
+            existing = count
+            usages = measure_backups(structure, count, repeat, warmup)
+            results.append(
+                bench_result(
+                    f"backups-{count}",
+                    FLAGS,
+                    (structure.root_dir / _SRC).stat().st_size,
+                    1,
+                    usages,
+                    backups=count,
+                    storage=backend.name,
+                )
+            )
+        structure.clean()
+    return results
+
+
+@dataclass(frozen=True)
+class EntryCost:
+    """
+    Latency growth per existing backup, seconds: <slope> of the least
+    squares line over all points, and the <worst> growth of a point with
+    at least MIN_CHECKED backups over the point with the fewest ones.
+    """
+
+    slope: float
+    worst: float
+    worst_count: int
+
+    def within(self, bound: float) -> bool:
+        """
+        Whether no point grew faster than <bound> per backup.
+        """
+        return self.worst <= bound
+
+
+def entry_cost(results: Sequence[BenchResult]) -> EntryCost:
+    """
+    Per-backup cost of copies measured by `run_backups`.
+    """
+    points = sorted((x.extra["backups"], x.summary.p50) for x in results)
+    if len(points) < 2:
+        raise ValueError("At least two amounts of backups are needed")
+    slope, _ = statistics.linear_regression(*zip(*points))
+    base_count, base_time = points[0]
+    checked = [x for x in points[1:] if x[0] >= MIN_CHECKED] or points[1:]
+    worst, worst_count = max(
+        ((t - base_time) / (n - base_count), n) for n, t in checked
+    )
+    return EntryCost(slope, worst, worst_count)
+
+
+def format_backups(
+    results: Sequence[BenchResult], bound: float = PER_ENTRY_BOUND
+) -> str:
+    """
+    Human-readable table of latencies and per-backup costs.
+    """
+    header = (
+        f"{'backups':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+        f"{'cpu ms':>9} {'ns/backup':>10}"
+    )
+    lines = [header, "-" * len(header)]
+    base = min(results, key=lambda x: x.extra["backups"])
+    for res in sorted(results, key=lambda x: x.extra["backups"]):
+        count = res.extra["backups"] - base.extra["backups"]
+        growth = (res.summary.p50 - base.summary.p50) / count if count else 0
+        lines.append(
+            f"{res.extra['backups']:>8} {res.summary.p50 * 1e3:>9.2f} "
+            f"{res.summary.p95 * 1e3:>9.2f} {res.summary.p99 * 1e3:>9.2f} "
+            f"{res.cpu_time * 1e3:>9.2f} {growth * 1e9:>10.1f}"
+        )
+    if len(results) > 1:
+        cost = entry_cost(results)
+        lines.append("")
+        lines.append(
+            f"Per backup: {cost.slope * 1e9:.1f} ns (fit), "
+            f"{cost.worst * 1e9:.1f} ns worst at {cost.worst_count}, "
+            f"bound {bound * 1e9:.1f} ns: "
+            f"{'ok' if cost.within(bound) else 'EXCEEDED'}"
+        )
+    return os.linesep.join(lines)
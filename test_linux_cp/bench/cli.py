@@ -0,0 +1,501 @@
+"""
+Command line interface of the benchmarks.
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+from test_linux_cp.bench import (
+    backups,
+    hardlinks,
+    reference,
+    scaling,
+    sparse,
+    startup,
+    store,
+    throughput,
+)
+from test_linux_cp.bench.runner import format_table
+from test_linux_cp.sparse import LAYOUTS
+from test_linux_cp.storage import STORAGES, get_storage
+
+DEFAULT_COMMAND = "throughput"
+
+
+def _size_list(value: str):
+    return [throughput.parse_size(x) for x in value.split(",") if x]
+
+
+def _name_list(value: str):
+    return [x for x in value.split(",") if x]
+
+
+def _add_common(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--repeat", type=int, default=10, help="measured runs per scenario"
+    )
+    parser.add_argument(
+        "--warmup", type=int, default=2, help="discarded runs per scenario"
+    )
+    parser.add_argument(
+        "--storage",
+        choices=sorted(STORAGES),
+        default="tmp",
+        help="storage backend of workloads; disk-cold evicts them from the "
+        "page cache before every measured copy (default: tmp)",
+    )
+    parser.add_argument(
+        "--dir",
+        type=Path,
+        default=None,
+        help="where to create workloads (default: the backend's own place)",
+    )
+    parser.add_argument(
+        "--json", type=Path, default=None, help="also write results here"
+    )
+    _add_store(parser)
+    parser.add_argument(
+        "--no-store",
+        action="store_true",
+        help="don't append results to the results store",
+    )
+
+
+def _add_store(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--store",
+        dest="store_path",
+        type=Path,
+        default=store.DEFAULT_STORE,
+        help=f"results store (default: {store.DEFAULT_STORE})",
+    )
+
+
+def _write_results(args, results, formatter=format_table):
+    print(formatter(results))
+    if args.json is not None:
+        args.json.write_text(
+            json.dumps([x.to_dict() for x in results], indent=2)
+        )
+    if not args.no_store:
+        run_id = store.ResultStore(args.store_path).add_run(results)
+        print(f"Stored as run {run_id} in {args.store_path}")
+
+
+def cmd_throughput(args) -> int:
+    """
+    MB/s, files/s and latency percentiles for various workloads and flags.
+    """
+    workloads = throughput.default_workloads(
+        sizes=args.sizes,
+        small_files=args.small_files,
+        deep_depth=args.deep_depth,
+    )
+    results = throughput.run_throughput(
+        workloads,
+        flag_sets=args.flags or throughput.FLAG_SETS,
+        repeat=args.repeat,
+        warmup=args.warmup,
+        storage=get_storage(args.storage, args.dir),
+    )
+    _write_results(args, results)
+    return 0
+
+
+def cmd_startup(args) -> int:
+    """
+    Startup latency of cp on tiny files per locale and flag set, with the
+    harness overhead subtracted.
+    """
+    locales = args.locales or startup.LOCALES
+    missing = startup.missing_locales(locales)
+    if missing:
+        print(
+            f"Skipped missing locales: {', '.join(missing)}", file=sys.stderr
+        )
+    results = startup.run_startup(
+        locales=[x for x in locales if x not in missing],
+        flag_sets=args.flags or startup.FLAG_SETS,
+        iterations=args.repeat,
+        warmup=args.warmup,
+        storage=get_storage(args.storage, args.dir),
+    )
+    _write_results(args, results, startup.format_startup)
+    return 0
+
+
+def cmd_scaling(args) -> int:
+    """
+    Time, CPU and RSS of recursive copies as file count, depth and fan-out
+    grow, with fitted growth curves. Exit with 1 if a curve grows faster
+    than --max-exponent.
+    """
+    results = scaling.run_scaling(
+        scaling.sweep(
+            axes=args.axes,
+            max_files=args.max_files,
+            max_depth=args.max_depth,
+            max_fanout=args.max_fanout,
+        ),
+        flag_sets=args.flags or scaling.FLAG_SETS,
+        repeat=args.repeat,
+        warmup=args.warmup,
+        storage=get_storage(args.storage, args.dir),
+    )
+    _write_results(args, results, scaling.format_scaling)
+    if args.max_exponent is None:
+        return 0
+    fits = scaling.fit_curves(results)
+    return 1 if any(x.exponent > args.max_exponent for x in fits) else 0
+
+
+def cmd_backups(args) -> int:
+    """
+    Latency of cp --backup=numbered as backups pile up in the destination.
+    Exit with 1 if it grows faster than --per-entry-ns per backup.
+    """
+    results = backups.run_backups(
+        counts=[x for x in backups.BACKUP_COUNTS if x <= args.max_backups],
+        repeat=args.repeat,
+        warmup=args.warmup,
+        storage=get_storage(args.storage, args.dir),
+    )
+    bound = args.per_entry_ns * 1e-9
+    _write_results(args, results, lambda x: backups.format_backups(x, bound))
+    if len(results) < 2:
+        return 0
+    return 0 if backups.entry_cost(results).within(bound) else 1
+
+
+def cmd_sparse(args) -> int:
+    """
+    Time, bytes read and blocks allocated by cp --sparse=MODE on files with
+    various layouts of holes. Exit with 1 if holes were materialized or
+    read where the mode should avoid it.
+    """
+    results = sparse.run_sparse(
+        sparse.default_sources(args.sizes, args.layouts),
+        modes=args.modes,
+        repeat=args.repeat,
+        warmup=args.warmup,
+        storage=get_storage(args.storage, args.dir),
+    )
+    _write_results(args, results, sparse.format_sparse)
+    return 1 if any(x.extra["issues"] for x in results) else 0
+
+
+def cmd_hardlinks(args) -> int:
+    """
+    Peak RSS and time of cp -a as the amount of multiply-linked inodes
+    grows. Exit with 1 if a copy preserving links broke the link topology.
+    """
+    results = hardlinks.run_hardlinks(
+        [x for x in hardlinks.LINKED_INODES if x <= args.max_inodes],
+        group_size=args.group_size,
+        flag_sets=args.flags or hardlinks.FLAG_SETS,
+        repeat=args.repeat,
+        warmup=args.warmup,
+        storage=get_storage(args.storage, args.dir),
+        verify=not args.no_verify,
+    )
+    _write_results(args, results, hardlinks.format_hardlinks)
+    return 1 if any(x.extra["broken_links"] for x in results) else 0
+
+
+def cmd_reference(args) -> int:
+    """
+    MB/s and CPU per GB of cp side by side with reference copiers
+    (copy_file_range, sendfile, mmap, buffered) on the same workloads.
+    """
+    workloads = throughput.default_workloads(
+        sizes=args.sizes,
+        small_files=args.small_files,
+        deep_depth=args.deep_depth,
+    )
+    results = reference.run_reference(
+        workloads,
+        copiers=args.copiers,
+        block_size=args.block_size,
+        flags=args.flags,
+        repeat=args.repeat,
+        warmup=args.warmup,
+        storage=get_storage(args.storage, args.dir),
+    )
+    _write_results(args, results, reference.format_reference)
+    return 0
+
+
+def cmd_compare(args) -> int:
+    """
+    Compare two stored runs, exit with 1 if any scenario regressed.
+    """
+    try:
+        comparisons = store.compare_runs(
+            store.ResultStore(args.store_path),
+            baseline=args.baseline,
+            candidate=args.candidate,
+            threshold=args.threshold,
+            alpha=args.alpha,
+        )
+    except ValueError as err:
+        print(f"Can't compare: {err}", file=sys.stderr)
+        return 2
+    print(store.format_comparisons(comparisons))
+    return 1 if any(x.regression for x in comparisons) else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Parser with a subcommand per benchmark.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m test_linux_cp.bench",
+        description="Benchmarks of the cp command.",
+    )
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+
+    sub = commands.add_parser("throughput", help=cmd_throughput.__doc__)
+    _add_common(sub)
+    sub.add_argument(
+        "--sizes",
+        type=_size_list,
+        default=throughput.DEFAULT_SIZES,
+        help="comma-separated single file sizes, e.g. 1M,64M,8G",
+    )
+    sub.add_argument(
+        "--small-files",
+        type=int,
+        default=10000,
+        help="amount of files in the small files tree, 0 to skip",
+    )
+    sub.add_argument(
+        "--deep-depth",
+        type=int,
+        default=500,
+        help="depth of the deep tree, 0 to skip",
+    )
+    sub.add_argument(
+        "--flags",
+        action="append",
+        default=None,
+        help="flag set to measure, e.g. --flags=-a; may be repeated "
+        f"(default: {throughput.FLAG_SETS})",
+    )
+    sub.set_defaults(func=cmd_throughput)
+
+    sub = commands.add_parser("startup", help=cmd_startup.__doc__)
+    _add_common(sub)
+    sub.set_defaults(repeat=2000, warmup=20)
+    sub.add_argument(
+        "--locales",
+        type=_name_list,
+        default=None,
+        help=f"comma-separated locales (default: {','.join(startup.LOCALES)})",
+    )
+    sub.add_argument(
+        "--flags",
+        action="append",
+        default=None,
+        help="flag set to measure; may be repeated "
+        f"(default: {startup.FLAG_SETS})",
+    )
+    sub.set_defaults(func=cmd_startup)
+
+    sub = commands.add_parser("scaling", help=cmd_scaling.__doc__)
+    _add_common(sub)
+    sub.set_defaults(repeat=3, warmup=1)
+    sub.add_argument(
+        "--axes",
+        type=_name_list,
+        default=scaling.AXES,
+        help=f"comma-separated axes to sweep (default: "
+        f"{','.join(scaling.AXES)})",
+    )
+    sub.add_argument(
+        "--max-files",
+        type=lambda x: int(float(x)),
+        default=100000,
+        help=f"largest file count of {scaling.FILE_COUNTS} (default: 1e5)",
+    )
+    sub.add_argument(
+        "--max-depth",
+        type=int,
+        default=2000,
+        help=f"largest depth of {scaling.DEPTHS} (default: 2000)",
+    )
+    sub.add_argument(
+        "--max-fanout",
+        type=int,
+        default=32,
+        help=f"largest fan-out of {scaling.FANOUTS} (default: 32)",
+    )
+    sub.add_argument(
+        "--max-exponent",
+        type=float,
+        default=None,
+        help="fail if an empirical growth exponent exceeds it, e.g. 1.2",
+    )
+    sub.add_argument(
+        "--flags",
+        action="append",
+        default=None,
+        help="flag set to measure; may be repeated "
+        f"(default: {scaling.FLAG_SETS})",
+    )
+    sub.set_defaults(func=cmd_scaling)
+
+    sub = commands.add_parser("backups", help=cmd_backups.__doc__)
+    _add_common(sub)
+    sub.set_defaults(repeat=20)
+    sub.add_argument(
+        "--max-backups",
+        type=lambda x: int(float(x)),
+        default=100000,
+        help=f"largest amount of backups of {backups.BACKUP_COUNTS} "
+        "(default: 1e5)",
+    )
+    sub.add_argument(
+        "--per-entry-ns",
+        type=float,
+        default=backups.PER_ENTRY_BOUND * 1e9,
+        help="bound of the latency growth per existing backup, ns "
+        f"(default: {backups.PER_ENTRY_BOUND * 1e9:g})",
+    )
+    sub.set_defaults(func=cmd_backups)
+
+    sub = commands.add_parser("sparse", help=cmd_sparse.__doc__)
+    _add_common(sub)
+    sub.set_defaults(repeat=5, warmup=1)
+    sub.add_argument(
+        "--sizes",
+        type=_size_list,
+        default=sparse.DEFAULT_SIZES,
+        help="comma-separated apparent file sizes (default: 64M,1G)",
+    )
+    sub.add_argument(
+        "--layouts",
+        type=_name_list,
+        default=list(LAYOUTS),
+        help=f"comma-separated layouts (default: {','.join(LAYOUTS)})",
+    )
+    sub.add_argument(
+        "--modes",
+        type=_name_list,
+        default=sparse.MODES,
+        help=f"comma-separated --sparse modes (default: "
+        f"{','.join(sparse.MODES)})",
+    )
+    sub.set_defaults(func=cmd_sparse)
+
+    sub = commands.add_parser("hardlinks", help=cmd_hardlinks.__doc__)
+    _add_common(sub)
+    sub.set_defaults(repeat=3, warmup=1)
+    sub.add_argument(
+        "--max-inodes",
+        type=lambda x: int(float(x)),
+        default=100000,
+        help=f"largest amount of linked inodes of {hardlinks.LINKED_INODES} "
+        "(default: 1e5)",
+    )
+    sub.add_argument(
+        "--group-size",
+        type=int,
+        default=2,
+        help="names per linked inode (default: 2)",
+    )
+    sub.add_argument(
+        "--no-verify",
+        action="store_true",
+        help="don't verify the link topology of copies",
+    )
+    sub.add_argument(
+        "--flags",
+        action="append",
+        default=None,
+        help="flag set to measure; may be repeated "
+        f"(default: {hardlinks.FLAG_SETS})",
+    )
+    sub.set_defaults(func=cmd_hardlinks)
+
+    sub = commands.add_parser("reference", help=cmd_reference.__doc__)
+    _add_common(sub)
+    sub.set_defaults(repeat=5, warmup=1)
+    sub.add_argument(
+        "--sizes",
+        type=_size_list,
+        default=throughput.DEFAULT_SIZES,
+        help="comma-separated single file sizes, e.g. 1M,64M,8G",
+    )
+    sub.add_argument(
+        "--small-files",
+        type=int,
+        default=10000,
+        help="amount of files in the small files tree, 0 to skip",
+    )
+    sub.add_argument(
+        "--deep-depth",
+        type=int,
+        default=500,
+        help="depth of the deep tree, 0 to skip",
+    )
+    sub.add_argument(
+        "--copiers",
+        type=_name_list,
+        default=list(reference.COPIERS),
+        help=f"comma-separated reference copiers (default: "
+        f"{','.join(reference.COPIERS)})",
+    )
+    sub.add_argument(
+        "--block-size",
+        type=throughput.parse_size,
+        default=reference.BLOCK_SIZE,
+        help="block size of the buffered and mmap copiers (default: "
+        f"{throughput.format_size(reference.BLOCK_SIZE)})",
+    )
+    sub.add_argument(
+        "--flags",
+        default="",
+        help="flags of cp, e.g. --flags=--reflink=never (default: none)",
+    )
+    sub.set_defaults(func=cmd_reference)
+
+    sub = commands.add_parser("compare", help=cmd_compare.__doc__)
+    _add_store(sub)
+    sub.add_argument(
+        "--baseline",
+        default=None,
+        help="run id of the baseline (default: the latest one before the "
+        "candidate with a scenario in common)",
+    )
+    sub.add_argument(
+        "--candidate",
+        default=None,
+        help="run id of the candidate (default: the last one)",
+    )
+    sub.add_argument(
+        "--threshold",
+        type=float,
+        default=0.05,
+        help="relative slowdown of the median tolerated (default: 0.05)",
+    )
+    sub.add_argument(
+        "--alpha",
+        type=float,
+        default=0.05,
+        help="significance level of the Mann-Whitney test (default: 0.05)",
+    )
+    sub.set_defaults(func=cmd_compare)
+    return parser
+
+
+def main(argv=None) -> int:
+    """
+    Run the benchmark requested by <argv>, `throughput` by default.
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0].startswith("-") and argv[0] not in ("-h", "--help"):
+        argv.insert(0, DEFAULT_COMMAND)
+    args = build_parser().parse_args(argv)
+    return args.func(args)
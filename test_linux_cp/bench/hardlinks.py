@@ -0,0 +1,161 @@
+"""
+Memory and time of `cp -a` on trees where many inodes have several names.
+
+To keep hardlinks, `cp` remembers every multiply-linked inode it copied in a
+hash table, so its memory grows with their amount. Trees with N hardlink
+groups are copied with and w/o link preservation, and the peak RSS and time
+are tracked as N grows; copies which have to preserve links are verified to
+keep the link topology.
+
+The peak RSS of a child can't be lower than the one of this process when it
+spawned the child (Linux carries it over execve). So trees are generated and
+verified in a forked worker, keeping this process small, and the peak RSS of
+`true` spawned the same way is reported as the floor.
+"""
+
+import functools
+import os
+from dataclasses import asdict
+from typing import List, Optional, Sequence, Tuple
+
+from test_linux_cp.bench.runner import (
+    BenchResult,
+    bench_result,
+    bench_root,
+    isolated,
+    measure,
+    rss_floor,
+)
+from test_linux_cp.dir_structure import DirStructure
+from test_linux_cp.storage import Storage
+from test_linux_cp.tree_diff import diff_trees
+from test_linux_cp.tree_spec import TreeSpec, materialize
+
+LINKED_INODES = [1000, 10000, 100000, 1000000, 2000000]
+FLAG_SETS = ["-a", "-r --preserve=links", "-r"]
+
+
+def link_spec(inodes: int, group_size: int = 2) -> TreeSpec:
+    """
+    Tree of <inodes> empty files, each with <group_size> names spread over
+    1 + 32 + 32^2 directories.
+    """
+    return TreeSpec(
+        depth=2,
+        fanout=32,
+        files=inodes,
+        sizes=("fixed", 0),
+        hardlink_groups=inodes,
+        hardlink_group_size=group_size,
+    )
+
+
+def preserves_links(flags: str) -> bool:
+    """
+    Whether cp has to keep hardlinks with <flags>.
+    """
+    for word in flags.split():
+        if word in ("-a", "--archive"):
+            return True
+        if word.startswith("--preserve="):
+            kept = word.partition("=")[2].split(",")
+            if "links" in kept or "all" in kept:
+                return True
+    return False
+
+
+def _link_topology(src: str, dst: str) -> Tuple[int, List[str]]:
+    """
+    Amount of names whose link group differs in <dst>, and a few of them.
+    """
+    diffs = diff_trees(src, dst, checks=("type", "hardlinks"), cache=None)
+    return len(diffs), [x.path for x in diffs[:5]]
+
+
+def _verify_once(topology: list, src: str, dst: str):
+    """
+    Check the link topology of <dst>, unless it is already in <topology>.
+    """
+    if not topology:
+        topology.append(isolated(_link_topology, src, dst))
+
+
+def run_hardlinks(
+    inode_counts: Sequence[int],
+    group_size: int = 2,
+    flag_sets: Sequence[str] = tuple(FLAG_SETS),
+    repeat: int = 3,
+    warmup: int = 1,
+    storage: Optional[Storage] = None,
+    verify: bool = True,
+) -> List[BenchResult]:
+    """
+    Measure copies of trees with every amount of linked inodes.
+    """
+    results = []
+    with bench_root(storage) as (backend, base_dir):
+        for idx, inodes in enumerate(inode_counts):
+            spec = link_spec(inodes, group_size)
+            structure = DirStructure(base_dir / str(idx), storage=backend)
+            stats = isolated(materialize, spec, structure.tree_root)
+            src = structure.tree_root
+            dst = structure.root_dir / "DstCopy"
+            floor = rss_floor(structure)
+            for flags in flag_sets:
+                topology = []
+                after = None
+                if verify and preserves_links(flags):
+                    after = functools.partial(_verify_once, topology, src, dst)
+                usages = measure(
+                    structure,
+                    src,
+                    dst,
+                    flags,
+                    repeat=repeat,
+                    warmup=warmup,
+                    after=after,
+                )
+                broken, examples = topology[0] if topology else (None, [])
+                results.append(
+                    bench_result(
+                        f"hardlinks-{inodes}",
+                        flags,
+                        stats.bytes,
+                        stats.entries,
+                        usages,
+                        linked_inodes=inodes,
+                        group_size=group_size,
+                        rss_floor=floor,
+                        broken_links=broken,
+                        broken_examples=examples,
+                        tree_spec=asdict(spec),
+                        storage=backend.name,
+                    )
+                )
+            structure.clean()
+    return results
+
+
+def format_hardlinks(results: Sequence[BenchResult]) -> str:
+    """
+    Human-readable table of hardlink results.
+    """
+    header = (
+        f"{'inodes':>8} {'flags':<20} {'p50 ms':>10} {'cpu ms':>10} "
+        f"{'rss MiB':>8} {'+floor':>8} {'B/inode':>8}  topology"
+    )
+    lines = [header, "-" * len(header)]
+    for res in results:
+        growth = max(res.max_rss - res.extra["rss_floor"], 0) * 1024
+        broken = res.extra["broken_links"]
+        if broken is None:
+            topology = "not checked"
+        else:
+            topology = f"BROKEN ({broken} names)" if broken else "ok"
+        lines.append(
+            f"{res.extra['linked_inodes']:>8} {res.flags:<20} "
+            f"{res.summary.p50 * 1e3:>10.1f} {res.cpu_time * 1e3:>10.1f} "
+            f"{res.max_rss / 1024:>8.1f} {growth / (1 << 20):>8.1f} "
+            f"{growth / res.extra['linked_inodes']:>8.0f}  {topology}"
+        )
+    return os.linesep.join(lines)
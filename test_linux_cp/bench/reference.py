@@ -0,0 +1,346 @@
+"""
+`cp` side by side with reference copiers on the same workloads.
+
+A slow `cp` and slow hardware look the same in absolute numbers. Reference
+copiers move the same data with the plain mechanisms the kernel offers:
+
+    copy_file_range  in-kernel copy, may be offloaded by the filesystem
+    sendfile         in-kernel copy through the page cache
+    mmap             source mapped to memory and written out
+    buffered         read/write loop with a configurable block size
+
+They run in this process, so they are free of process startup, and their
+CPU time and I/O are accounted with `getrusage` and `/proc/self/io`. The
+fastest of them tells how much headroom `cp` leaves on the workload. A
+copier the kernel or the filesystem doesn't support is reported as
+unavailable.
+
+The amount of read and write syscalls of `cp` tells which of its code paths
+a workload hits: it is compared with the ones of the reference copiers,
+and the closest one is reported. `cp` writing no data at all means it
+cloned the files (reflink), or found nothing but holes in them.
+"""
+
+import errno
+import math
+import mmap
+import os
+import resource
+import stat
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from test_linux_cp.bench.runner import (
+    BenchResult,
+    bench_result,
+    measure_flag_sets,
+    remove,
+)
+from test_linux_cp.bench.stats import percentile
+from test_linux_cp.bench.throughput import Workload, deploy_each, format_size
+from test_linux_cp.dir_structure import DirStructure
+from test_linux_cp.process import ResourceUsage, read_proc_io
+from test_linux_cp.storage import Storage
+
+BLOCK_SIZE = 128 << 10
+# Bytes requested from the kernel per in-kernel copy call.
+_KERNEL_CHUNK = 1 << 30
+CP = "cp"
+# Code path of `cp`, which wrote no data.
+NO_WRITES = "clone/holes"
+# Errors of a copier the kernel or the filesystem doesn't support.
+_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOSYS}
+
+
+def _write_all(fd: int, data: memoryview):
+    while data:
+        data = data[os.write(fd, data) :]
+
+
+def copy_file_range(src_fd: int, dst_fd: int, _size: int, _block_size: int):
+    """
+    Copy with `copy_file_range`, which lets the filesystem offload it.
+    """
+    while os.copy_file_range(src_fd, dst_fd, _KERNEL_CHUNK):
+        pass
+
+
+def sendfile(src_fd: int, dst_fd: int, _size: int, _block_size: int):
+    """
+    Copy with `sendfile`, page cache to page cache.
+    """
+    while os.sendfile(dst_fd, src_fd, None, _KERNEL_CHUNK):
+        pass
+
+
+def mmap_write(src_fd: int, dst_fd: int, size: int, block_size: int):
+    """
+    Map the source and write it out by <block_size> pieces.
+    """
+    if not size:
+        return
+    with mmap.mmap(src_fd, size, access=mmap.ACCESS_READ) as mapped:
+        with memoryview(mapped) as view:
+            for offset in range(0, size, block_size):
+                _write_all(dst_fd, view[offset : offset + block_size])
+
+
+def buffered(src_fd: int, dst_fd: int, _size: int, block_size: int):
+    """
+    Read and write by <block_size> pieces through a reused buffer.
+    """
+    buffer = bytearray(block_size)
+    with memoryview(buffer) as view:
+        while True:
+            length = os.readv(src_fd, [buffer])
+            if not length:
+                break
+            _write_all(dst_fd, view[:length])
+
+
+COPIERS: Dict[str, Callable[[int, int, int, int], None]] = {
+    "copy_file_range": copy_file_range,
+    "sendfile": sendfile,
+    "mmap": mmap_write,
+    "buffered": buffered,
+}
+
+
+def copy_file(src: str, dst: str, copier: Callable, block_size: int):
+    """
+    Copy the regular file <src> to <dst> with <copier>.
+    """
+    src_fd = os.open(src, os.O_RDONLY)
+    try:
+        info = os.fstat(src_fd)
+        dst_fd = os.open(
+            dst,
+            os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+            stat.S_IMODE(info.st_mode),
+        )
+        try:
+            copier(src_fd, dst_fd, info.st_size, block_size)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+
+def copy_tree(src: str, dst: str, copier: Callable, block_size: int):
+    """
+    Copy <src> to <dst> as `cp -r` does, files with <copier>.
+    """
+    if not os.path.isdir(src):
+        copy_file(src, dst, copier, block_size)
+        return
+    pending = [(src, dst)]
+    while pending:
+        src_dir, dst_dir = pending.pop()
+        os.mkdir(dst_dir)
+        with os.scandir(src_dir) as entries:
+            for entry in entries:
+                target = os.path.join(dst_dir, entry.name)
+                if entry.is_symlink():
+                    os.symlink(os.readlink(entry.path), target)
+                elif entry.is_dir():
+                    pending.append((entry.path, target))
+                else:
+                    copy_file(entry.path, target, copier, block_size)
+
+
+def run_copier(
+    copier: Callable, src: str, dst: str, block_size: int
+) -> ResourceUsage:
+    """
+    Copy <src> to <dst> with <copier> in this process, and account
+    resources the copy used.
+    """
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    io_before = read_proc_io(os.getpid())
+    start = time.perf_counter()
+    copy_tree(src, dst, copier, block_size)
+    wall_time = time.perf_counter() - start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    io_after = read_proc_io(os.getpid())
+
+    def delta(name):
+        return io_after.get(name, 0) - io_before.get(name, 0)
+
+    return ResourceUsage(
+        wall_time=wall_time,
+        user_time=usage.ru_utime - usage_before.ru_utime,
+        sys_time=usage.ru_stime - usage_before.ru_stime,
+        max_rss=usage.ru_maxrss,
+        major_faults=usage.ru_majflt - usage_before.ru_majflt,
+        minor_faults=usage.ru_minflt - usage_before.ru_minflt,
+        block_in=usage.ru_inblock - usage_before.ru_inblock,
+        block_out=usage.ru_oublock - usage_before.ru_oublock,
+        rchar=delta("rchar"),
+        wchar=delta("wchar"),
+        read_bytes=delta("read_bytes"),
+        write_bytes=delta("write_bytes"),
+        read_calls=delta("syscr"),
+        write_calls=delta("syscw"),
+    )
+
+
+def measure_copier(
+    structure: DirStructure,
+    name: str,
+    src: Path,
+    dst: Path,
+    block_size: int = BLOCK_SIZE,
+    repeat: int = 5,
+    warmup: int = 1,
+) -> List[ResourceUsage]:
+    """
+    Counterpart of `runner.measure` for the reference copier <name>.
+    """
+    usages = []
+    for run in range(warmup + repeat):
+        remove(dst)
+        structure.prepare_copy()
+        usage = run_copier(COPIERS[name], str(src), str(dst), block_size)
+        if run >= warmup:
+            usages.append(usage)
+    remove(dst)
+    return usages
+
+
+def copier_label(name: str, block_size: int) -> str:
+    """
+    Name of a copier as it appears in results.
+    """
+    if name in ("buffered", "mmap"):
+        return f"{name} bs={format_size(block_size)}"
+    return name
+
+
+def closest_copier(cp: BenchResult, references: Sequence[BenchResult]):
+    """
+    Label of the reference copier whose read and write syscalls are the
+    closest to the ones of <cp>, NO_WRITES if `cp` wrote no data, None if
+    there is nothing to compare with.
+    """
+    if cp.bytes and percentile([x.wchar for x in cp.usages], 50) == 0:
+        return NO_WRITES
+
+    def calls(res: BenchResult):
+        return (
+            percentile([x.read_calls for x in res.usages], 50),
+            percentile([x.write_calls for x in res.usages], 50),
+        )
+
+    def distance(res: BenchResult) -> float:
+        return sum(
+            abs(math.log1p(x) - math.log1p(y))
+            for x, y in zip(calls(cp), calls(res))
+        )
+
+    if not references:
+        return None
+    return min(references, key=distance).extra["copier"]
+
+
+def run_reference(
+    workloads: Sequence[Workload],
+    copiers: Sequence[str] = tuple(COPIERS),
+    block_size: int = BLOCK_SIZE,
+    flags: str = "",
+    repeat: int = 5,
+    warmup: int = 1,
+    storage: Optional[Storage] = None,
+) -> List[BenchResult]:
+    """
+    Measure `cp` with <flags> and every reference copier on every workload.
+    """
+    results = []
+    for workload, backend, deployed in deploy_each(workloads, storage):
+        structure, src, nbytes, files = deployed
+        dst = structure.root_dir / "DstCopy"
+        cp_result = measure_flag_sets(
+            structure,
+            src,
+            dst,
+            workload.name,
+            [workload.flags(flags)],
+            (nbytes, files),
+            repeat,
+            warmup,
+            copier=CP,
+            tree_spec=workload.describe(),
+            storage=backend.name,
+        )[0]
+        references = []
+        unavailable = {}
+        for name in copiers:
+            label = copier_label(name, block_size)
+            try:
+                usages = measure_copier(
+                    structure, name, src, dst, block_size, repeat, warmup
+                )
+            except OSError as err:
+                if err.errno not in _UNSUPPORTED_ERRNOS:
+                    raise
+                unavailable[label] = os.strerror(err.errno)
+                continue
+            references.append(
+                bench_result(
+                    workload.name,
+                    f"[{label}]",
+                    nbytes,
+                    files,
+                    usages,
+                    copier=label,
+                    block_size=block_size,
+                    tree_spec=workload.describe(),
+                    storage=backend.name,
+                )
+            )
+        cp_result.extra["closest"] = closest_copier(cp_result, references)
+        cp_result.extra["unavailable"] = unavailable
+        results.append(cp_result)
+        results.extend(references)
+    return results
+
+
+def _path(res: BenchResult) -> str:
+    closest = res.extra.get("closest")
+    if closest is None:
+        return ""
+    return closest if closest == NO_WRITES else f"like {closest}"
+
+
+def format_reference(results: Sequence[BenchResult]) -> str:
+    """
+    Side-by-side table of `cp` and reference copiers per workload.
+    """
+    header = (
+        f"{'scenario':<22} {'copier':<20} {'MB/s':>9} {'cpu s/GB':>9} "
+        f"{'vs best':>8} {'reads':>8} {'writes':>8}  path"
+    )
+    lines = [header, "-" * len(header)]
+    best = {}
+    for res in results:
+        if res.extra["copier"] != CP:
+            best[res.scenario] = max(best.get(res.scenario, 0), res.mb_per_s)
+    for res in results:
+        copier = res.extra["copier"]
+        if copier == CP:
+            copier = f"cp {res.flags}".strip()
+        cpu = res.cpu_time / (res.bytes / 1e9) if res.bytes else math.nan
+        fastest = best.get(res.scenario)
+        ratio = res.mb_per_s / fastest if fastest else math.nan
+        lines.append(
+            f"{res.scenario:<22} {copier:<20} {res.mb_per_s:>9.1f} "
+            f"{cpu:>9.2f} {ratio:>7.2f}x "
+            f"{percentile([x.read_calls for x in res.usages], 50):>8g} "
+            f"{percentile([x.write_calls for x in res.usages], 50):>8g}  "
+            f"{_path(res)}"
+        )
+        for label, reason in res.extra.get("unavailable", {}).items():
+            lines.append(
+                f"{res.scenario:<22} {label:<20} unavailable: {reason}"
+            )
+    return os.linesep.join(lines)
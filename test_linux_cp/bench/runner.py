@@ -0,0 +1,271 @@
+"""
+Repeated measurement of `cp` calls on a DirStructure.
+"""
+
+import contextlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from test_linux_cp.bench.stats import Summary, summarize
+from test_linux_cp.dir_structure import DirStructure
+from test_linux_cp.process import (
+    STALL_TIMEOUT,
+    CopyResult,
+    ResourceUsage,
+    run_instrumented,
+)
+from test_linux_cp.storage import Storage
+from test_linux_cp.teardown import remove_tree
+
+# Program spawned in place of `cp` to measure what the harness alone costs.
+BASELINE = "true"
+
+
+class BenchError(RuntimeError):
+    """
+    Raised if a measured `cp` call fails.
+    """
+
+
+@dataclass
+class BenchResult:
+    """
+    Measurements of one scenario: wall times of the measured runs, resources
+    used by them and the summary of the times.
+    """
+
+    scenario: str
+    flags: str
+    bytes: int
+    files: int
+    samples: List[float]
+    summary: Summary
+    usages: List[ResourceUsage] = field(default_factory=list, repr=False)
+    extra: dict = field(default_factory=dict)
+
+    @property
+    def mb_per_s(self) -> float:
+        """
+        Throughput at the median time, 10^6 bytes per second.
+        """
+        if self.summary.p50 <= 0:
+            return 0.0
+        return self.bytes / self.summary.p50 / 1e6
+
+    @property
+    def files_per_s(self) -> float:
+        """
+        Copied entries per second at the median time.
+        """
+        if self.summary.p50 <= 0:
+            return 0.0
+        return self.files / self.summary.p50
+
+    @property
+    def cpu_time(self) -> Optional[float]:
+        """
+        Median CPU time of a run, seconds. None if resources weren't
+        accounted.
+        """
+        if not self.usages:
+            return None
+        cpu = sorted(x.cpu_time for x in self.usages)
+        return cpu[len(cpu) // 2]
+
+    @property
+    def max_rss(self) -> Optional[int]:
+        """
+        Peak RSS over all runs, KiB. None if resources weren't accounted.
+        """
+        if not self.usages:
+            return None
+        return max(x.max_rss for x in self.usages)
+
+    def to_dict(self) -> dict:
+        """
+        Plain dict, suitable for JSON.
+        """
+        return {
+            "scenario": self.scenario,
+            "flags": self.flags,
+            "bytes": self.bytes,
+            "files": self.files,
+            "samples": self.samples,
+            "summary": self.summary.to_dict(),
+            "mb_per_s": self.mb_per_s,
+            "files_per_s": self.files_per_s,
+            "cpu_time": self.cpu_time,
+            "max_rss": self.max_rss,
+            **self.extra,
+        }
+
+
+def remove(path: Path):
+    """
+    Remove a file or a directory tree, if it exists.
+    """
+    if path.is_dir() and not path.is_symlink():
+        remove_tree(path)
+    elif path.exists() or path.is_symlink():
+        path.unlink()
+
+
+def measure(
+    structure: DirStructure,
+    src,
+    dst: Path,
+    flags: str = "",
+    repeat: int = 10,
+    warmup: int = 2,
+    before: Optional[Callable[[], None]] = None,
+    after: Optional[Callable[[], None]] = None,
+) -> List[ResourceUsage]:
+    """
+    Copy <src> to <dst> <warmup> + <repeat> times and return resources used
+    by the last <repeat> runs. <dst> is removed before every run, then the
+    storage backend prepares the structure and <before> is called. <after>
+    is called after every successful measured run, while <dst> is intact.
+    """
+    usages = []
+    for run in range(warmup + repeat):
+        remove(dst)
+        structure.prepare_copy()
+        if before is not None:
+            before()
+        result = structure.call_copy(
+            src=src, dst=dst, flags=flags, timeout=None, instrument=True
+        )
+        if result.returncode != 0:
+            raise BenchError(
+                f"cp {flags} {src} {dst} failed: "
+                f"{result.stderr.decode(errors='replace').strip()}"
+            )
+        if run >= warmup:
+            usages.append(result.usage)
+            if after is not None:
+                after()
+    remove(dst)
+    return usages
+
+
+def isolated(func, *args):
+    """
+    Call <func> in a forked worker, so memory it takes doesn't raise the
+    peak RSS of this process.
+    """
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(func, *args).result()
+
+
+def call_program(
+    structure: DirStructure, program: str, src="", dst="", flags=""
+) -> CopyResult:
+    """
+    Run <program> in place of `cp`: with the arguments, working directory,
+    environment and stall watchdog `call_copy` gives `cp`, w/o a timeout.
+    """
+    argv = [program] + structure.copy_argv(src, dst, flags)[1:]
+    return run_instrumented(
+        argv,
+        cwd=structure.root_dir,
+        env=structure.env,
+        timeout=None,
+        stall=STALL_TIMEOUT,
+    )
+
+
+def rss_floor(structure: DirStructure) -> int:
+    """
+    Peak RSS reported for the BASELINE spawned like `cp` is, KiB.
+    """
+    return call_program(structure, BASELINE).usage.max_rss
+
+
+@contextlib.contextmanager
+def bench_root(
+    storage: Optional[Storage] = None,
+) -> Iterator[Tuple[Storage, Path]]:
+    """
+    The <storage> backend (the default one if None) and a directory on it
+    for structures of a benchmark, removed with them on exit.
+    """
+    storage = storage if storage is not None else Storage()
+    base_dir = storage.make_root(prefix="cp-bench-")
+    try:
+        yield storage, base_dir
+    finally:
+        remove_tree(base_dir)
+
+
+def measure_flag_sets(
+    structure: DirStructure,
+    src,
+    dst: Path,
+    scenario: str,
+    flag_sets: Sequence[str],
+    sizes: Tuple[int, int],
+    repeat: int,
+    warmup: int,
+    **extra,
+) -> List[BenchResult]:
+    """
+    Measure copies of <src> to <dst> with every flag set, a result each.
+    <sizes> are bytes and entries copied, <extra> goes to every result.
+    """
+    results = []
+    for flags in flag_sets:
+        usages = measure(
+            structure, src, dst, flags, repeat=repeat, warmup=warmup
+        )
+        results.append(bench_result(scenario, flags, *sizes, usages, **extra))
+    return results
+
+
+def bench_result(
+    scenario: str,
+    flags: str,
+    nbytes: int,
+    files: int,
+    usages: Sequence[ResourceUsage],
+    **extra,
+) -> BenchResult:
+    """
+    Wrap measured runs into a result with outliers rejected.
+    """
+    samples = [x.wall_time for x in usages]
+    return BenchResult(
+        scenario=scenario,
+        flags=flags,
+        bytes=nbytes,
+        files=files,
+        samples=samples,
+        usages=list(usages),
+        summary=summarize(samples),
+        extra=extra,
+    )
+
+
+def format_table(results: Sequence[BenchResult]) -> str:
+    """
+    Human-readable table of results.
+    """
+    header = (
+        f"{'scenario':<24} {'flags':<26} {'MB/s':>10} {'files/s':>11} "
+        f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'runs':>6}"
+    )
+    lines = [header, "-" * len(header)]
+    for res in results:
+        runs = res.summary.count + res.summary.rejected
+        lines.append(
+            f"{res.scenario:<24} {res.flags or '(none)':<26} "
+            f"{res.mb_per_s:>10.1f} {res.files_per_s:>11.1f} "
+            f"{res.summary.p50 * 1e3:>9.2f} {res.summary.p95 * 1e3:>9.2f} "
+            f"{res.summary.p99 * 1e3:>9.2f} "
+            f"{res.summary.count:>3}/{runs}"
+        )
+    return os.linesep.join(lines)
@@ -0,0 +1,238 @@
+"""
+Scaling of recursive copies with the amount of files, depth and fan-out.
+
+Each axis is swept with the others fixed, and the growth of the median time
+with the amount of copied entries is fitted by `a + b * g(n)` for every
+model g of MODELS. The best fitting model and the empirical exponent of the
+largest points show whether `cp` stays linear, or some per-entry work (e.g.
+hardlink tracking or directory cycle detection) became superlinear.
+
+As in `hardlinks`, trees are generated in a forked worker and the peak RSS
+of `true` is reported as the floor carried over from this process.
+"""
+
+import math
+import os
+import statistics
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from test_linux_cp.bench.runner import (
+    BenchResult,
+    bench_root,
+    isolated,
+    measure_flag_sets,
+    rss_floor,
+)
+from test_linux_cp.bench.throughput import Workload
+from test_linux_cp.dir_structure import DirStructure
+from test_linux_cp.storage import Storage
+from test_linux_cp.tree_spec import TreeSpec, materialize
+
+AXES = ["files", "depth", "fanout"]
+FLAG_SETS = ["-r", "-a"]
+FILE_COUNTS = [10, 100, 1000, 10000, 100000, 1000000]
+DEPTHS = [1, 10, 100, 500, 1000, 2000]
+FANOUTS = [2, 4, 8, 16, 32]
+_FILE_SIZE = ("fixed", 64)
+
+# Growth models; "superlinear" is represented by the quadratic one.
+MODELS: Dict[str, Callable[[float], float]] = {
+    "linear": lambda n: n,
+    "n log n": lambda n: n * math.log2(max(n, 2)),
+    "superlinear": lambda n: n * n,
+}
+
+
+def axis_spec(axis: str, value: int) -> TreeSpec:
+    """
+    Tree of the sweep point <value> of the <axis>:
+        files   a flat tree of 16 directories with <value> files
+        depth   a chain of <value> directories with a file in each
+        fanout  a tree 2 levels deep with <value> subdirectories each, and a
+                file per directory
+    """
+    if axis == "files":
+        return TreeSpec(depth=1, fanout=16, files=value, sizes=_FILE_SIZE)
+    if axis == "depth":
+        return TreeSpec(depth=value, fanout=1, files=value, sizes=_FILE_SIZE)
+    if axis == "fanout":
+        dirs = 1 + value + value * value
+        return TreeSpec(depth=2, fanout=value, files=dirs, sizes=_FILE_SIZE)
+    raise ValueError(f"Unknown axis '{axis}', choose from {AXES}")
+
+
+def sweep(
+    axes: Sequence[str] = tuple(AXES),
+    max_files: int = 100000,
+    max_depth: int = 2000,
+    max_fanout: int = 32,
+) -> List[Tuple[str, int, Workload]]:
+    """
+    Sweep points of <axes>, limited by the maximums: (axis, value, workload).
+    """
+    values = {
+        "files": [x for x in FILE_COUNTS if x <= max_files],
+        "depth": [x for x in DEPTHS if x <= max_depth],
+        "fanout": [x for x in FANOUTS if x <= max_fanout],
+    }
+    points = []
+    for axis in axes:
+        if axis not in values:
+            raise ValueError(f"Unknown axis '{axis}', choose from {AXES}")
+        for value in values[axis]:
+            workload = Workload(
+                f"scaling-{axis}-{value}", spec=axis_spec(axis, value)
+            )
+            points.append((axis, value, workload))
+    return points
+
+
+def run_scaling(
+    points: Sequence[Tuple[str, int, Workload]],
+    flag_sets: Sequence[str] = tuple(FLAG_SETS),
+    repeat: int = 3,
+    warmup: int = 1,
+    storage: Optional[Storage] = None,
+) -> List[BenchResult]:
+    """
+    Measure every sweep point with every flag set, on the <storage> backend.
+    """
+    results = []
+    with bench_root(storage) as (backend, base_dir):
+        for idx, (axis, value, workload) in enumerate(points):
+            structure = DirStructure(base_dir / str(idx), storage=backend)
+            stats = isolated(materialize, workload.spec, structure.tree_root)
+            results.extend(
+                measure_flag_sets(
+                    structure,
+                    structure.tree_root,
+                    structure.root_dir / "DstCopy",
+                    f"scaling-{axis}",
+                    [workload.flags(x) for x in flag_sets],
+                    (stats.bytes, stats.entries),
+                    repeat,
+                    warmup,
+                    axis=axis,
+                    value=value,
+                    rss_floor=rss_floor(structure),
+                    tree_spec=workload.describe(),
+                    storage=backend.name,
+                )
+            )
+            structure.clean()
+    return results
+
+
+@dataclass(frozen=True)
+class CurveFit:
+    """
+    Growth of the median time of a sweep with the amount of entries.
+
+    <model> fits best among MODELS, with relative RMS error <error>.
+    <exponent> is the slope of log(time) over log(entries) on the upper half
+    of points, where the startup cost no longer dominates.
+    """
+
+    axis: str
+    flags: str
+    model: str
+    exponent: float
+    error: float
+    points: int
+
+
+def _fit_error(sizes: Sequence[float], times: Sequence[float], model) -> float:
+    """
+    Relative RMS error of the fit `time = a + b * model(n)` with
+    non-negative <b>, which minimizes relative errors: weights of points
+    are 1 / time^2, so the startup dominated small points count as much as
+    large ones.
+    """
+    xs = [model(x) for x in sizes]
+    weights = [1 / (t * t) for t in times]
+    total = sum(weights)
+    mean_x = sum(w * x for w, x in zip(weights, xs)) / total
+    mean_t = sum(w * t for w, t in zip(weights, times)) / total
+    var_x = sum(w * (x - mean_x) ** 2 for w, x in zip(weights, xs))
+    cov = sum(
+        w * (x - mean_x) * (t - mean_t) for w, x, t in zip(weights, xs, times)
+    )
+    slope = max(cov / var_x, 0.0) if var_x > 0 else 0.0
+    intercept = mean_t - slope * mean_x
+    errors = [(intercept + slope * x - t) / t for x, t in zip(xs, times)]
+    return math.sqrt(statistics.fmean(x * x for x in errors))
+
+
+def fit_curve(
+    sizes: Sequence[int], times: Sequence[float]
+) -> Tuple[str, float, float]:
+    """
+    Best model name, its error and the empirical exponent of the growth of
+    <times> with <sizes>.
+    """
+    errors = {
+        name: _fit_error(sizes, times, model) for name, model in MODELS.items()
+    }
+    model = min(errors, key=errors.get)
+    ordered = sorted(zip(sizes, times))
+    upper = ordered[len(ordered) // 2 :] if len(ordered) > 3 else ordered
+    if len({x for x, _ in upper}) < 2:
+        exponent = math.nan
+    else:
+        exponent, _ = statistics.linear_regression(
+            [math.log(x) for x, _ in upper], [math.log(t) for _, t in upper]
+        )
+    return model, errors[model], exponent
+
+
+def fit_curves(results: Sequence[BenchResult]) -> List[CurveFit]:
+    """
+    Fit every sweep of <results>, a sweep per axis and flag set.
+    """
+    sweeps: Dict[Tuple[str, str], List[BenchResult]] = {}
+    for res in results:
+        sweeps.setdefault((res.extra["axis"], res.flags), []).append(res)
+    fits = []
+    for (axis, flags), sweep_results in sweeps.items():
+        if len(sweep_results) < 3:
+            continue
+        model, error, exponent = fit_curve(
+            [x.files for x in sweep_results],
+            [x.summary.p50 for x in sweep_results],
+        )
+        fits.append(
+            CurveFit(axis, flags, model, exponent, error, len(sweep_results))
+        )
+    return fits
+
+
+def format_scaling(results: Sequence[BenchResult]) -> str:
+    """
+    Human-readable table of sweep points followed by their fitted curves.
+    """
+    header = (
+        f"{'axis':<8} {'value':>8} {'flags':<6} {'entries':>9} "
+        f"{'p50 ms':>10} {'cpu ms':>10} {'rss MiB':>8} {'+floor':>8} "
+        f"{'us/entry':>9}"
+    )
+    lines = [header, "-" * len(header)]
+    for res in results:
+        growth = max(res.max_rss - res.extra["rss_floor"], 0) / 1024
+        lines.append(
+            f"{res.extra['axis']:<8} {res.extra['value']:>8} "
+            f"{res.flags:<6} {res.files:>9} {res.summary.p50 * 1e3:>10.2f} "
+            f"{res.cpu_time * 1e3:>10.2f} {res.max_rss / 1024:>8.1f} "
+            f"{growth:>8.1f} {res.summary.p50 / res.files * 1e6:>9.2f}"
+        )
+    header = (
+        f"{'axis':<8} {'flags':<6} {'model':<12} {'exponent':>9} "
+        f"{'error':>7} {'points':>7}"
+    )
+    lines.extend(["", header, "-" * len(header)])
+    for fit in fit_curves(results):
+        lines.append(
+            f"{fit.axis:<8} {fit.flags:<6} {fit.model:<12} "
+            f"{fit.exponent:>9.2f} {fit.error:>7.1%} {fit.points:>7}"
+        )
+    return os.linesep.join(lines)
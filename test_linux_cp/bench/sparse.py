@@ -0,0 +1,186 @@
+"""
+Efficiency of `cp --sparse=auto|always|never` on files with holes.
+
+Every layout of `sparse.LAYOUTS` is copied from a sparse source, and from a
+materialized one (the same content with holes written out as zeros). Besides
+time, runs record the bytes `cp` read (`rchar` of `/proc/<pid>/io`) and the
+bytes allocated for the destination, which are checked against what the
+mode should achieve:
+
+    holes-materialized  the destination takes more space than the source
+                        (auto), or than the data of the layout (always)
+    excess-read         `cp` read more than the data actually stored in the
+                        source, i.e. it read holes
+"""
+
+import os
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+from test_linux_cp.bench.runner import (
+    BenchResult,
+    bench_result,
+    bench_root,
+    measure,
+)
+from test_linux_cp.bench.throughput import format_size
+from test_linux_cp.dir_structure import DirStructure
+from test_linux_cp.sparse import (
+    BLOCK_SIZE,
+    LAYOUTS,
+    SparseLayout,
+    allocated_bytes,
+    make_layout,
+)
+from test_linux_cp.storage import Storage
+
+MODES = ["auto", "always", "never"]
+DEFAULT_SIZES = [64 << 20, 1 << 30]
+# Bytes `cp` may read or allocate besides the file data: locale files,
+# filesystem metadata, preallocation.
+READ_SLACK = 64 << 10
+ALLOC_SLACK = 1 << 20
+
+
+@dataclass(frozen=True)
+class SparseSource:
+    """
+    Source file of a scenario: the <layout> written sparse, or with holes
+    written out as zeros if <materialized>.
+    """
+
+    name: str
+    layout: SparseLayout
+    materialized: bool = False
+
+    @property
+    def stored_bytes(self) -> int:
+        """
+        Bytes a hole-aware reader finds in the source.
+        """
+        if self.materialized:
+            return self.layout.size
+        return self.layout.data_bytes
+
+
+def default_sources(
+    sizes: Sequence[int] = tuple(DEFAULT_SIZES),
+    layouts: Sequence[str] = tuple(LAYOUTS),
+) -> List[SparseSource]:
+    """
+    Sparse and materialized sources of every layout and size.
+    """
+    sources = []
+    for size in sizes:
+        for name in layouts:
+            layout = make_layout(name, size)
+            label = f"{name}-{format_size(size)}"
+            sources.append(SparseSource(label, layout))
+            if layout.hole_bytes:
+                sources.append(SparseSource(f"{label}-zeros", layout, True))
+    return sources
+
+
+def sparse_issues(
+    source: SparseSource,
+    mode: str,
+    src_allocated: int,
+    dst_allocated: int,
+    read: int,
+) -> List[str]:
+    """
+    Inefficiencies of a copy of <source> with --sparse=<mode>.
+    """
+    issues = []
+    if mode == "auto":
+        expected = src_allocated
+    elif mode == "always":
+        expected = source.layout.data_bytes
+        expected += BLOCK_SIZE * len(source.layout.extents)
+    else:
+        expected = None
+    if expected is not None and dst_allocated > expected + ALLOC_SLACK:
+        issues.append("holes-materialized")
+    if read > source.stored_bytes + READ_SLACK:
+        issues.append("excess-read")
+    return issues
+
+
+def run_sparse(
+    sources: Sequence[SparseSource],
+    modes: Sequence[str] = tuple(MODES),
+    repeat: int = 5,
+    warmup: int = 1,
+    storage: Optional[Storage] = None,
+) -> List[BenchResult]:
+    """
+    Measure copies of every source with every mode.
+    """
+    results = []
+    with bench_root(storage) as (backend, base_dir):
+        structure = DirStructure(base_dir / "sparse", storage=backend)
+        dst = structure.root_dir / "DstSparse"
+        for source in sources:
+            src = structure.make_sparse_file(
+                "SrcSparse", source.layout, zeros=source.materialized
+            )
+            src_allocated = allocated_bytes(src)
+            for mode in modes:
+                dst_allocated = []
+                usages = measure(
+                    structure,
+                    src,
+                    dst,
+                    f"--sparse={mode}",
+                    repeat=repeat,
+                    warmup=warmup,
+                    after=lambda out=dst_allocated: out.append(
+                        allocated_bytes(dst)
+                    ),
+                )
+                read = max(x.rchar for x in usages)
+                issues = sparse_issues(
+                    source, mode, src_allocated, max(dst_allocated), read
+                )
+                results.append(
+                    bench_result(
+                        source.name,
+                        f"--sparse={mode}",
+                        source.layout.size,
+                        1,
+                        usages,
+                        extents=len(source.layout.extents),
+                        data_bytes=source.layout.data_bytes,
+                        materialized=source.materialized,
+                        src_allocated=src_allocated,
+                        dst_allocated=max(dst_allocated),
+                        rchar=read,
+                        issues=issues,
+                        storage=backend.name,
+                    )
+                )
+            src.unlink()
+        structure.clean()
+    return results
+
+
+def format_sparse(results: Sequence[BenchResult]) -> str:
+    """
+    Human-readable table of sparse copy results.
+    """
+    header = (
+        f"{'source':<22} {'flags':<16} {'p50 ms':>9} {'data MiB':>9} "
+        f"{'read MiB':>9} {'src MiB':>8} {'dst MiB':>8}  issues"
+    )
+    lines = [header, "-" * len(header)]
+    for res in results:
+        lines.append(
+            f"{res.scenario:<22} {res.flags:<16} "
+            f"{res.summary.p50 * 1e3:>9.2f} "
+            f"{res.extra['data_bytes'] / (1 << 20):>9.1f} "
+            f"{res.extra['rchar'] / (1 << 20):>9.1f} "
+            f"{res.extra['src_allocated'] / (1 << 20):>8.1f} "
+            f"{res.extra['dst_allocated'] / (1 << 20):>8.1f}  "
+            f"{', '.join(res.extra['issues']) or 'ok'}"
+        )
+    return os.linesep.join(lines)
@@ -0,0 +1,167 @@
+"""
+Startup latency of `cp` on tiny files, per locale and flag set.
+
+Every `cp` call is paired with a call of `true` made through the same
+harness right before it, and the latency of the pair's baseline is
+subtracted, so what is left is the cost of `cp` itself: dynamic loading,
+locale initialization, option parsing and the copy of a few bytes.
+"""
+
+import locale
+import os
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from test_linux_cp.bench.runner import (
+    BASELINE,
+    BenchError,
+    BenchResult,
+    bench_root,
+    call_program,
+    remove,
+)
+from test_linux_cp.bench.stats import Summary, summarize
+from test_linux_cp.dir_structure import DirStructure
+from test_linux_cp.storage import Storage
+
+LOCALES = ["C", "C.UTF-8", "en_US.UTF-8"]
+FLAG_SETS = ["", "-a", "--preserve=all", "--backup=numbered"]
+TINY_SIZE = 64
+
+
+def missing_locales(locales: Sequence[str]) -> List[str]:
+    """
+    Locales of <locales> which aren't installed. `cp` silently falls back to
+    "C" in them, so measuring them is pointless.
+    """
+    saved = locale.setlocale(locale.LC_ALL)
+    missing = []
+    try:
+        for name in locales:
+            try:
+                locale.setlocale(locale.LC_ALL, name)
+            except locale.Error:
+                missing.append(name)
+    finally:
+        locale.setlocale(locale.LC_ALL, saved)
+    return missing
+
+
+def _timed_copy(
+    structure: DirStructure, program: str, src: str, dst: str, flags: str
+) -> float:
+    """
+    Wall time of one `call_program`, seconds.
+    """
+    start = time.perf_counter()
+    code, _, stderr = call_program(structure, program, src, dst, flags)
+    elapsed = time.perf_counter() - start
+    if code != 0:
+        raise BenchError(
+            f"{program} {flags} {src} {dst} failed: "
+            f"{stderr.decode(errors='replace').strip()}"
+        )
+    return elapsed
+
+
+def measure_startup(
+    structure: DirStructure,
+    src: str,
+    dst: str,
+    flags: str = "",
+    iterations: int = 2000,
+    warmup: int = 20,
+) -> Tuple[List[float], List[float]]:
+    """
+    Copy <src> over <dst> <warmup> + <iterations> times, each copy right
+    after a call of the baseline, and return latencies of the last
+    <iterations> copies and baselines. Backups made by the copies are
+    removed between iterations, out of the measured time.
+    """
+    copies, baselines = [], []
+    for run in range(warmup + iterations):
+        baseline = _timed_copy(structure, BASELINE, src, dst, flags)
+        copy = _timed_copy(structure, structure.cp, src, dst, flags)
+        for backup in structure.root_dir.glob(f"{dst}.~*~"):
+            remove(backup)
+        if run >= warmup:
+            copies.append(copy)
+            baselines.append(baseline)
+    return copies, baselines
+
+
+def startup_result(
+    lang: str, flags: str, copies: List[float], baselines: List[float]
+) -> BenchResult:
+    """
+    Wrap latencies into a result. Its samples are net latencies: every copy
+    minus the baseline measured right before it.
+    """
+    samples = [x - y for x, y in zip(copies, baselines)]
+    gross, baseline = summarize(copies), summarize(baselines)
+    return BenchResult(
+        scenario=f"startup-{lang}",
+        flags=flags,
+        bytes=TINY_SIZE,
+        files=1,
+        samples=samples,
+        summary=summarize(samples),
+        extra={
+            "locale": lang,
+            "gross": gross.to_dict(),
+            "baseline": baseline.to_dict(),
+        },
+    )
+
+
+def run_startup(
+    locales: Sequence[str] = tuple(LOCALES),
+    flag_sets: Sequence[str] = tuple(FLAG_SETS),
+    iterations: int = 2000,
+    warmup: int = 20,
+    storage: Optional[Storage] = None,
+) -> List[BenchResult]:
+    """
+    Measure startup latency for every locale and flag set.
+    """
+    results = []
+    with bench_root(storage) as (backend, base_dir):
+        structure = DirStructure(base_dir / "startup", storage=backend)
+        structure.make_file("tiny", TINY_SIZE)
+        for lang in locales:
+            structure.update_env(lang)
+            for flags in flag_sets:
+                copies, baselines = measure_startup(
+                    structure,
+                    "tiny",
+                    "tinyCopy",
+                    flags,
+                    iterations=iterations,
+                    warmup=warmup,
+                )
+                results.append(startup_result(lang, flags, copies, baselines))
+        structure.clean()
+    return results
+
+
+def format_startup(results: Sequence[BenchResult]) -> str:
+    """
+    Human-readable table of startup results, microseconds.
+    """
+    header = (
+        f"{'locale':<14} {'flags':<20} {'net p50':>9} {'net p95':>9} "
+        f"{'net p99':>9} {'cp p50':>9} {'true p50':>9} {'runs':>10}"
+    )
+    lines = [header, "-" * len(header)]
+    for res in results:
+        gross = Summary(**res.extra["gross"])
+        baseline = Summary(**res.extra["baseline"])
+        runs = res.summary.count + res.summary.rejected
+        lines.append(
+            f"{res.extra['locale']:<14} {res.flags or '(none)':<20} "
+            f"{res.summary.p50 * 1e6:>9.0f} {res.summary.p95 * 1e6:>9.0f} "
+            f"{res.summary.p99 * 1e6:>9.0f} {gross.p50 * 1e6:>9.0f} "
+            f"{baseline.p50 * 1e6:>9.0f} "
+            f"{res.summary.count:>6}/{runs}"
+        )
+    return os.linesep.join(lines)
@@ -0,0 +1,81 @@
+"""
+Descriptive statistics of benchmark samples.
+"""
+
+import statistics
+from dataclasses import asdict, dataclass
+from typing import List, Sequence, Tuple
+
+# Tukey's fences: samples further than that many IQRs from the quartiles
+# are outliers.
+TUKEY_K = 1.5
+
+
+def percentile(samples: Sequence[float], pct: float) -> float:
+    """
+    Percentile of <samples> with linear interpolation between closest ranks.
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        raise ValueError("No samples")
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def reject_outliers(
+    samples: Sequence[float], k: float = TUKEY_K
+) -> Tuple[List[float], List[float]]:
+    """
+    Split <samples> into kept ones and outliers outside Tukey's fences.
+    """
+    if len(samples) < 4:
+        return list(samples), []
+    q1, q3 = percentile(samples, 25), percentile(samples, 75)
+    low, high = q1 - k * (q3 - q1), q3 + k * (q3 - q1)
+    kept = [x for x in samples if low <= x <= high]
+    return kept, [x for x in samples if not low <= x <= high]
+
+
+@dataclass(frozen=True)
+class Summary:
+    """
+    Summary of samples: <mean>, <stdev> and <p50> describe the ones left
+    after outlier rejection, while <min>, <max>, <p95> and <p99> describe
+    all of them, so stalls show in the tail.
+    """
+
+    count: int
+    rejected: int
+    mean: float
+    stdev: float
+    min: float
+    max: float
+    p50: float
+    p95: float
+    p99: float
+
+    def to_dict(self) -> dict:
+        """
+        Plain dict, suitable for JSON.
+        """
+        return asdict(self)
+
+
+def summarize(samples: Sequence[float], k: float = TUKEY_K) -> Summary:
+    """
+    Describe <samples>, central estimates w/o outliers.
+    """
+    kept, rejected = reject_outliers(samples, k)
+    return Summary(
+        count=len(kept),
+        rejected=len(rejected),
+        mean=statistics.fmean(kept),
+        stdev=statistics.stdev(kept) if len(kept) > 1 else 0.0,
+        min=min(samples),
+        max=max(samples),
+        p50=percentile(kept, 50),
+        p95=percentile(samples, 95),
+        p99=percentile(samples, 99),
+    )
@@ -0,0 +1,264 @@
+"""
+Persistent store of benchmark results and detection of regressions.
+
+Every benchmark run appends its results to a JSON lines file, each record
+keyed by the scenario, flags, workload description, hash of the `cp` binary
+and the kernel version. Comparing two runs flags scenarios whose times grew
+beyond a threshold with a statistically significant Mann-Whitney U test.
+"""
+
+import functools
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from test_linux_cp.tree_diff import file_sha256
+
+DEFAULT_STORE = Path(".cp-bench") / "results.jsonl"
+# Exact distribution of U is used while there are at most that many
+# samples in both sets together, and there are no ties.
+_EXACT_LIMIT = 40
+
+
+def cp_binary() -> str:
+    """
+    Resolved path of the `cp` found in PATH.
+    """
+    path = shutil.which("cp")
+    if path is None:
+        raise FileNotFoundError("cp is not found in PATH")
+    return os.path.realpath(path)
+
+
+def environment() -> dict:
+    """
+    Part of the record key describing the system under test.
+    """
+    binary = cp_binary()
+    return {
+        "cp_path": binary,
+        "cp_sha256": file_sha256(binary),
+        "kernel": platform.release(),
+    }
+
+
+def scenario_key(record: dict) -> Tuple[str, str, str, str]:
+    """
+    Identity of a scenario regardless of the system it was measured on.
+    """
+    return (
+        record["scenario"],
+        record["flags"],
+        json.dumps(record.get("tree_spec"), sort_keys=True),
+        record.get("storage", "tmp"),
+    )
+
+
+class ResultStore:
+    """
+    JSON lines file with a record per measured scenario.
+    """
+
+    def __init__(self, path: Path = DEFAULT_STORE):
+        self.path = Path(path)
+
+    def add_run(self, results: Iterable) -> str:
+        """
+        Append BenchResults of one benchmark run, return the run id.
+        """
+        run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        common = {"run_id": run_id, "timestamp": time.time(), **environment()}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as stream:
+            for result in results:
+                record = {**common, **result.to_dict()}
+                stream.write(json.dumps(record, sort_keys=True) + "\n")
+        return run_id
+
+    def records(self) -> List[dict]:
+        """
+        All stored records, oldest first.
+        """
+        if not self.path.exists():
+            return []
+        with open(self.path, encoding="utf-8") as stream:
+            return [json.loads(line) for line in stream if line.strip()]
+
+    def runs(self) -> List[str]:
+        """
+        Ids of stored runs, oldest first.
+        """
+        return list(dict.fromkeys(x["run_id"] for x in self.records()))
+
+
+def mann_whitney_greater(
+    candidate: Sequence[float], baseline: Sequence[float]
+) -> float:
+    """
+    One-sided Mann-Whitney U test: p-value of the hypothesis that values in
+    <candidate> tend to be greater than in <baseline>.
+    """
+    n_cand, n_base = len(candidate), len(baseline)
+    if not n_cand or not n_base:
+        raise ValueError("Both sample sets must be non-empty")
+
+    pooled = sorted([(x, 0) for x in candidate] + [(x, 1) for x in baseline])
+    ranks = [0.0] * len(pooled)
+    ties = []
+    start = 0
+    while start < len(pooled):
+        end = start
+        while end + 1 < len(pooled) and pooled[end + 1][0] == pooled[start][0]:
+            end += 1
+        for idx in range(start, end + 1):
+            ranks[idx] = (start + end) / 2 + 1
+        if end > start:
+            ties.append(end - start + 1)
+        start = end + 1
+    rank_sum = sum(r for r, (_, group) in zip(ranks, pooled) if group == 0)
+    u_stat = rank_sum - n_cand * (n_cand + 1) / 2
+
+    if not ties and n_cand + n_base <= _EXACT_LIMIT:
+        counts = _u_distribution(n_cand, n_base)
+        return sum(counts[math.ceil(u_stat) :]) / sum(counts)
+
+    total = n_cand + n_base
+    mean = n_cand * n_base / 2
+    tie_term = sum(t**3 - t for t in ties) / (total * (total - 1))
+    var = n_cand * n_base / 12 * (total + 1 - tie_term)
+    if var == 0:
+        return 1.0
+    z_score = (u_stat - mean - 0.5) / math.sqrt(var)
+    return 0.5 * math.erfc(z_score / math.sqrt(2))
+
+
+@functools.lru_cache(maxsize=None)
+def _u_distribution(n_first: int, n_second: int) -> Tuple[int, ...]:
+    """
+    Amount of arrangements yielding every value of U, w/o ties.
+    """
+    if not n_first or not n_second:
+        return (1,)
+    # An arrangement ends either with an element of the first set, which
+    # exceeds all <n_second> elements, or with one of the second set.
+    with_first = _u_distribution(n_first - 1, n_second)
+    with_second = _u_distribution(n_first, n_second - 1)
+    counts = [0] * (n_first * n_second + 1)
+    for u_val, count in enumerate(with_first):
+        counts[u_val + n_second] += count
+    for u_val, count in enumerate(with_second):
+        counts[u_val] += count
+    return tuple(counts)
+
+
+@dataclass(frozen=True)
+class Comparison:
+    """
+    Verdict on a scenario measured in both runs.
+    """
+
+    scenario: str
+    flags: str
+    baseline_p50: float
+    candidate_p50: float
+    p_value: float
+    regression: bool
+
+    @property
+    def change(self) -> float:
+        """
+        Relative change of the median time, positive if slower.
+        """
+        return self.candidate_p50 / self.baseline_p50 - 1
+
+
+def compare_runs(
+    store: ResultStore,
+    baseline: Optional[str] = None,
+    candidate: Optional[str] = None,
+    threshold: float = 0.05,
+    alpha: float = 0.05,
+) -> List[Comparison]:
+    """
+    Compare scenarios of two runs. The <candidate> is the last stored run
+    by default, and the <baseline> the latest run before it which measured
+    any of its scenarios. Raises ValueError if the runs have no scenario in
+    common.
+
+    A scenario regressed if its median time grew by more than <threshold>
+    and the growth is significant at level <alpha>.
+    """
+    by_run: Dict[str, Dict[tuple, dict]] = {}
+    for record in store.records():
+        by_run.setdefault(record["run_id"], {})[scenario_key(record)] = record
+    runs = list(by_run)
+    if not runs:
+        raise ValueError("Two runs are needed for comparison")
+    candidate = candidate or runs[-1]
+    if candidate not in by_run:
+        raise ValueError(f"No run {candidate!r} stored")
+    if baseline is None:
+        earlier = runs[: runs.index(candidate)]
+        overlapping = [
+            x for x in earlier if by_run[x].keys() & by_run[candidate].keys()
+        ]
+        if not overlapping:
+            raise ValueError(
+                f"No run before {candidate!r} measured any of its scenarios"
+            )
+        baseline = overlapping[-1]
+    if baseline not in by_run:
+        raise ValueError(f"No run {baseline!r} stored")
+    if not by_run[baseline].keys() & by_run[candidate].keys():
+        raise ValueError(
+            f"Runs {baseline!r} and {candidate!r} have no scenario in common"
+        )
+
+    comparisons = []
+    for key, cand in by_run[candidate].items():
+        base = by_run[baseline].get(key)
+        if base is None:
+            continue
+        base_p50 = statistics.median(base["samples"])
+        cand_p50 = statistics.median(cand["samples"])
+        p_value = mann_whitney_greater(cand["samples"], base["samples"])
+        comparisons.append(
+            Comparison(
+                scenario=cand["scenario"],
+                flags=cand["flags"],
+                baseline_p50=base_p50,
+                candidate_p50=cand_p50,
+                p_value=p_value,
+                regression=(
+                    p_value < alpha and cand_p50 / base_p50 - 1 > threshold
+                ),
+            )
+        )
+    return comparisons
+
+
+def format_comparisons(comparisons: Sequence[Comparison]) -> str:
+    """
+    Human-readable table of comparisons.
+    """
+    header = (
+        f"{'scenario':<24} {'flags':<26} {'base ms':>9} {'cand ms':>9} "
+        f"{'change':>8} {'p-value':>8}  verdict"
+    )
+    lines = [header, "-" * len(header)]
+    for cmp in comparisons:
+        lines.append(
+            f"{cmp.scenario:<24} {cmp.flags or '(none)':<26} "
+            f"{cmp.baseline_p50 * 1e3:>9.2f} {cmp.candidate_p50 * 1e3:>9.2f} "
+            f"{cmp.change:>+8.1%} {cmp.p_value:>8.4f}  "
+            f"{'REGRESSION' if cmp.regression else 'ok'}"
+        )
+    return os.linesep.join(lines)
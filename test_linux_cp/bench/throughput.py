@@ -0,0 +1,184 @@
+"""
+Throughput of `cp` on single large files, many small files and deep trees.
+"""
+
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+from test_linux_cp.bench.runner import (
+    BenchResult,
+    bench_root,
+    measure_flag_sets,
+)
+from test_linux_cp.dir_structure import DirStructure
+from test_linux_cp.storage import Storage
+from test_linux_cp.tree_spec import TreeSpec
+
+FLAG_SETS = ["", "-r", "-a", "--sparse=always", "--reflink=auto"]
+DEFAULT_SIZES = [1 << 20, 64 << 20]
+
+
+@dataclass(frozen=True)
+class Workload:
+    """
+    Source of a throughput scenario: either a single file of <size> bytes
+    (dense or a hole), or a tree generated from <spec>.
+    """
+
+    name: str
+    size: int = 0
+    sparse: bool = False
+    spec: Optional[TreeSpec] = None
+
+    @property
+    def is_tree(self) -> bool:
+        """
+        Whether the workload has to be copied recursively.
+        """
+        return self.spec is not None
+
+    def deploy(
+        self, root: Path, storage: Optional[Storage] = None
+    ) -> Tuple[DirStructure, Path, int, int]:
+        """
+        Create the workload under <root> made by <storage>.
+
+        Returns the structure, the source path, and amounts of bytes and
+        entries to copy.
+        """
+        if self.is_tree:
+            structure = DirStructure(root, spec=self.spec, storage=storage)
+            stats = structure.stats
+            return (
+                structure,
+                structure.tree_root,
+                stats.bytes,
+                stats.entries,
+            )
+        structure = DirStructure(root, storage=storage)
+        src = structure.make_file("SrcFile", self.size, sparse=self.sparse)
+        return structure, src, self.size, 1
+
+    def describe(self) -> dict:
+        """
+        Parameters of the workload, as stored with its results.
+        """
+        if self.is_tree:
+            return asdict(self.spec)
+        return {"size": self.size, "sparse": self.sparse}
+
+    def flags(self, flags: str) -> str:
+        """
+        Adapt <flags> to the workload: trees need a recursive copy.
+        """
+        if self.is_tree and not {"-r", "-a"} & set(flags.split()):
+            return f"-r {flags}".strip()
+        return flags
+
+
+def format_size(size: int) -> str:
+    """
+    Short binary representation of <size>: 64M, 8G, etc.
+    """
+    for suffix in ["", "K", "M", "G"]:
+        if size < 1024 or size % 1024:
+            return f"{size}{suffix}"
+        size //= 1024
+    return f"{size}T"
+
+
+def parse_size(value: str) -> int:
+    """
+    Inverse of `format_size`.
+    """
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    value = value.strip().upper().removesuffix("B").removesuffix("I")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def default_workloads(
+    sizes: Sequence[int] = tuple(DEFAULT_SIZES),
+    small_files: int = 10000,
+    deep_depth: int = 500,
+) -> List[Workload]:
+    """
+    Dense and sparse files of <sizes>, a flat tree of <small_files> 4 KiB
+    files and a chain of <deep_depth> directories.
+    """
+    workloads = []
+    for size in sizes:
+        workloads.append(Workload(f"dense-{format_size(size)}", size=size))
+        workloads.append(
+            Workload(f"sparse-{format_size(size)}", size=size, sparse=True)
+        )
+    if small_files:
+        workloads.append(
+            Workload(
+                f"small-files-{small_files}",
+                spec=TreeSpec(depth=1, fanout=16, files=small_files),
+            )
+        )
+    if deep_depth:
+        workloads.append(
+            Workload(
+                f"deep-tree-{deep_depth}",
+                spec=TreeSpec(
+                    depth=deep_depth,
+                    fanout=1,
+                    files=deep_depth,
+                    sizes=("fixed", 512),
+                ),
+            )
+        )
+    return workloads
+
+
+def deploy_each(
+    workloads: Sequence[Workload], storage: Optional[Storage] = None
+) -> Iterator[Tuple[Workload, Storage, Tuple[DirStructure, Path, int, int]]]:
+    """
+    Deploy <workloads> one at a time on the <storage> backend (the default
+    one if None): yields every workload, the backend and what
+    `Workload.deploy` returned. A structure is cleaned before the next one
+    is deployed.
+    """
+    with bench_root(storage) as (backend, base_dir):
+        for idx, workload in enumerate(workloads):
+            deployed = workload.deploy(base_dir / str(idx), backend)
+            yield workload, backend, deployed
+            deployed[0].clean()
+
+
+def run_throughput(
+    workloads: Sequence[Workload],
+    flag_sets: Sequence[str] = tuple(FLAG_SETS),
+    repeat: int = 10,
+    warmup: int = 2,
+    storage: Optional[Storage] = None,
+) -> List[BenchResult]:
+    """
+    Measure every workload with every flag set, on the <storage> backend.
+    """
+    results = []
+    for workload, backend, deployed in deploy_each(workloads, storage):
+        structure, src, nbytes, files = deployed
+        results.extend(
+            measure_flag_sets(
+                structure,
+                src,
+                structure.root_dir / "DstCopy",
+                workload.name,
+                # Flag sets the workload adapts to the same are measured
+                # once.
+                list(dict.fromkeys(map(workload.flags, flag_sets))),
+                (nbytes, files),
+                repeat,
+                warmup,
+                tree_spec=workload.describe(),
+                storage=backend.name,
+            )
+        )
+    return results
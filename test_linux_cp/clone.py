@@ -0,0 +1,136 @@
+"""
+Cheap cloning of a prebuilt ("golden") directory tree.
+
+Building a test structure writes every file anew, which is slow for large
+trees. Cloning a template built once per session costs a `link` per shared
+file and an in-kernel `copy_file_range` per private one.
+"""
+
+import errno
+import hashlib
+import os
+import shutil
+import stat
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+# Errors on which hardlinking or in-kernel copying is not possible and
+# a plain copy has to be done instead.
+_FALLBACK_ERRNOS = {errno.EXDEV, errno.EPERM, errno.ENOSYS, errno.EOPNOTSUPP}
+
+
+def copy_file(src: Union[str, Path], dst: Union[str, Path]) -> None:
+    """
+    Copy regular file content with `copy_file_range`, keeping the mode bits.
+
+    Falls back to a userspace copy if the kernel or filesystem can't do it.
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        src_stat = os.fstat(fsrc.fileno())
+        try:
+            remaining = src_stat.st_size
+            while remaining > 0:
+                copied = os.copy_file_range(
+                    fsrc.fileno(), fdst.fileno(), remaining
+                )
+                if copied == 0:
+                    break
+                remaining -= copied
+        except OSError as err:
+            if err.errno not in _FALLBACK_ERRNOS:
+                raise
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+            shutil.copyfileobj(fsrc, fdst)
+        os.fchmod(fdst.fileno(), stat.S_IMODE(src_stat.st_mode))
+
+
+def clone_tree(
+    src: Union[str, Path],
+    dst: Union[str, Path],
+    shared: Iterable[str] = (),
+) -> None:
+    """
+    Clone the <src> tree into <dst>.
+
+    Files listed in <shared> (paths relative to <src>) are hardlinked to the
+    template, so they must never be modified in place by a test. All other
+    files get their own copy, hardlinks between them are kept. Absolute
+    symlinks pointing into <src> are retargeted into <dst>.
+    """
+    src_root = os.path.abspath(src)
+    dst_root = os.path.abspath(dst)
+    shared = {os.path.normpath(x) for x in shared}
+    os.makedirs(dst_root, exist_ok=True)
+    # First clone of every multiply-linked file, to keep the link topology.
+    linked = {}
+
+    pending = [""]
+    while pending:
+        rel_dir = pending.pop()
+        with os.scandir(os.path.join(src_root, rel_dir)) as entries:
+            for entry in entries:
+                rel_path = os.path.join(rel_dir, entry.name)
+                target = os.path.join(dst_root, rel_path)
+                if entry.is_symlink():
+                    link = _retarget(entry.path, src_root, dst_root)
+                    os.symlink(link, target)
+                elif entry.is_dir():
+                    os.mkdir(target)
+                    pending.append(rel_path)
+                elif rel_path in shared:
+                    _link_or_copy(entry.path, target)
+                elif entry.stat(follow_symlinks=False).st_nlink > 1:
+                    key = entry.inode()
+                    if key in linked:
+                        os.link(linked[key], target)
+                    else:
+                        copy_file(entry.path, target)
+                        linked[key] = target
+                else:
+                    copy_file(entry.path, target)
+
+
+def shared_state(
+    root: Union[str, Path], shared: Iterable[str]
+) -> Dict[str, Optional[Tuple[int, int, str]]]:
+    """
+    Mode, modification time and content hash of every file in <shared>
+    (paths relative to <root>), None for missing ones. The amount of links
+    is left out: it changes as clones come and go.
+
+    Clones share these files with the template, so a test modifying one in
+    place changes it for all later tests. Comparing the state of the
+    template before and after a test catches that.
+    """
+    state = {}
+    for rel_path in shared:
+        path = os.path.join(root, rel_path)
+        try:
+            info = os.lstat(path)
+            with open(path, "rb") as stream:
+                digest = hashlib.file_digest(stream, "sha256").hexdigest()
+        except FileNotFoundError:
+            state[rel_path] = None
+            continue
+        state[rel_path] = (info.st_mode, info.st_mtime_ns, digest)
+    return state
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    try:
+        os.link(src, dst)
+    except OSError as err:
+        if err.errno not in _FALLBACK_ERRNOS:
+            raise
+        copy_file(src, dst)
+
+
+def _retarget(link: str, src_root: str, dst_root: str) -> str:
+    target = os.readlink(link)
+    if os.path.isabs(target) and (
+        target == src_root or target.startswith(src_root + os.sep)
+    ):
+        return dst_root + target[len(src_root) :]
+    return target
@@ -4,10 +4,39 @@ This should be (ideally a separate) package, but for the demo purpose let's
 stop here.
 """
 
+import asyncio
+import glob
 import os
+import shlex
 import subprocess
+import tempfile
 from pathlib import Path
-from typing import Union
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from test_linux_cp.attrs import run_chattr
+from test_linux_cp.clone import clone_tree
+from test_linux_cp.manifest import Manifest
+from test_linux_cp.process import (
+    STALL_TIMEOUT,
+    Watchdog,
+    locale_env,
+    run_instrumented,
+)
+from test_linux_cp.result_cache import ResultCache
+from test_linux_cp.snapshot import Snapshot, restore_snapshot, take_snapshot
+from test_linux_cp.sparse import SparseLayout, write_sparse_file
+from test_linux_cp.storage import Storage
+from test_linux_cp.stream import RAW_LIMIT, CopyStream
+from test_linux_cp.teardown import remove_tree, remove_tree_in_background
+from test_linux_cp.timeouts import (
+    AUTO,
+    adaptive_timeout,
+    source_size,
+    storage_baseline,
+)
+from test_linux_cp.tree_diff import ALL_CHECKS, Difference, diff_trees
+from test_linux_cp.tree_spec import TreeSpec, materialize, write_random_file
+from test_linux_cp.verify import first_mismatch
 
 
 class DirStructure:
@@ -22,96 +51,558 @@ class DirStructure:
         ("SrcDir/SrcSubDir/srcD", "bar"),
     ]
     links = [("srcLink", "srcA")]
+    # Extra names of files: (name, file). Targets must not be shared_files,
+    # or clones lose the link.
+    hardlinks: List[Tuple[str, str]] = []
+    # Files no test modifies in place. Structures cloned from a template
+    # share them with it through hardlinks instead of copying.
+    shared_files = ["srcB", "SrcDir/srcC", "SrcDir/SrcSubDir/srcD"]
+    # Directory under the root, where trees generated from a spec are placed.
+    tree_dir = "SrcTree"
+    # Program run by `call_copy`.
+    cp = "cp"
+    # Cache of `call_copy` results, see `result_cache.ResultCache`. None
+    # runs every call.
+    result_cache: Optional[ResultCache] = None
+
+    def __init__(
+        self,
+        root_dir: Path,
+        template: Optional[Path] = None,
+        spec: Optional[TreeSpec] = None,
+        storage: Optional[Storage] = None,
+    ):
+        """
+        Build the structure under <root_dir>, or clone it from <template> -
+        a root of the structure built earlier.
 
-    def __init__(self, root_dir: Path):
+        If <spec> is given, the structure is a tree generated from it under
+        <tree_dir>, rather than `files_and_content` and `links`. <storage>
+        is the backend <root_dir> was made by.
+        """
         self.root_dir = root_dir
+        self.storage = storage if storage is not None else Storage()
+        self.spec = spec
+        self.stats = None
+        self.tree_root = Path(self.root_dir) / self.tree_dir
+        # Files with attributes set by `set_attrs`: attribute letters.
+        self.attr_files: Dict[Path, Set[str]] = {}
+        self.last_snapshot: Optional[Snapshot] = None
+
+        if template is not None:
+            clone_tree(template, self.root_dir, shared=self.shared_files)
+        elif spec is not None:
+            self.stats = materialize(spec, self.tree_root)
+        else:
+            self.build()
+
+        # Index of entries, see `manifest`. Built at once for the default
+        # structure, on the first access to `manifest` for generated trees.
+        self._manifest: Optional[Manifest] = None
+        if spec is None:
+            self._manifest = Manifest.scan(self.root_dir)
+
+        self.update_env()
 
+    @property
+    def manifest(self) -> Manifest:
+        """
+        Index of entries of the structure, to look them up by name or by
+        path relative to <root_dir>. It lists the entries as of the scan:
+        call `refresh_manifest` after adding or removing some.
+        """
+        if self._manifest is None:
+            self.refresh_manifest()
+        return self._manifest
+
+    def refresh_manifest(self) -> Manifest:
+        """
+        Scan the structure again for `manifest`.
+        """
+        self._manifest = Manifest.scan(self.root_dir)
+        return self._manifest
+
+    def __getattr__(self, name: str) -> Path:
+        """
+        Path of the entry named <name>, e.g. `self.srcA`, made on access.
+        Names of several entries are ambiguous: look them up by path with
+        `manifest.index` instead. Generated trees are not scanned for it:
+        access `manifest` first.
+        """
+        manifest = self.__dict__.get("_manifest")
+        if name.startswith("_") or manifest is None:
+            raise AttributeError(name)
+        found = manifest.find(name)
+        if len(found) != 1:
+            paths = [manifest.relpath(x) for x in found]
+            raise AttributeError(
+                f"{type(self).__name__} has no single entry {name!r}: "
+                f"{paths or 'none'}"
+            )
+        return manifest.path(found[0])
+
+    def build(self):
+        """
+        Write all files and links of the structure from scratch.
+        """
         for file, cnt in self.files_and_content:
             f_path = Path(self.root_dir) / file
             f_path.parent.mkdir(parents=True, exist_ok=True)
             f_path.write_text(cnt)
-            self.__setattr__(f_path.name, f_path)
 
         for src, dst in self.links:
             src_path = Path(self.root_dir) / src
             dst_path = Path(self.root_dir) / dst
             src_path.symlink_to(dst_path.absolute())
-            self.__setattr__(dst_path.name, dst_path)
 
-        self.update_env()
+        for name, file in self.hardlinks:
+            f_path = Path(self.root_dir) / name
+            f_path.parent.mkdir(parents=True, exist_ok=True)
+            os.link(Path(self.root_dir) / file, f_path)
+
+    def make_file(
+        self, name: Union[str, Path], size: int, sparse=False, seed=0
+    ) -> Path:
+        """
+        Create a file of <size> bytes under <root_dir>: seeded random data,
+        or a single hole if <sparse> is set.
+        """
+        f_path = Path(self.root_dir) / name
+        f_path.parent.mkdir(parents=True, exist_ok=True)
+        if sparse:
+            with open(f_path, "wb") as stream:
+                stream.truncate(size)
+        else:
+            write_random_file(f_path, size, seed=seed)
+        return f_path
 
-    def call_cmd(self, cmd, timeout=10):
+    def make_sparse_file(
+        self,
+        name: Union[str, Path],
+        layout: SparseLayout,
+        seed=0,
+        zeros=False,
+    ) -> Path:
+        """
+        Create a file of the <layout> under <root_dir>: seeded random data
+        in its extents and holes elsewhere, written out as zeros if <zeros>
+        is set.
+        """
+        f_path = Path(self.root_dir) / name
+        f_path.parent.mkdir(parents=True, exist_ok=True)
+        write_sparse_file(f_path, layout, seed=seed, materialize=zeros)
+        return f_path
+
+    def make_backups(
+        self, name: Union[str, Path], count: int, start: int = 1
+    ) -> List[Path]:
+        """
+        Create <count> empty numbered backups of the file <name> under
+        <root_dir>: `<name>.~<start>~` and onwards.
+        """
+        f_path = Path(self.root_dir) / name
+        f_path.parent.mkdir(parents=True, exist_ok=True)
+        dir_fd = os.open(f_path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            names = [
+                f"{f_path.name}.~{idx}~" for idx in range(start, start + count)
+            ]
+            for backup in names:
+                fd = os.open(backup, os.O_WRONLY | os.O_CREAT, dir_fd=dir_fd)
+                os.close(fd)
+        finally:
+            os.close(dir_fd)
+        return [f_path.parent / x for x in names]
+
+    def first_mismatch(
+        self, first: Union[str, Path], second: Union[str, Path]
+    ) -> Optional[int]:
+        """
+        Offset of the first byte where two files differ, None if their
+        content is the same. Relative paths are taken from <root_dir>.
+
+        Files are compared by chunks, so memory use doesn't depend on their
+        size.
+        """
+        return first_mismatch(
+            Path(self.root_dir) / first, Path(self.root_dir) / second
+        )
+
+    def same_content(
+        self, first: Union[str, Path], second: Union[str, Path]
+    ) -> bool:
+        """
+        Whether two files have the same content.
+        """
+        return self.first_mismatch(first, second) is None
+
+    def diff_tree(
+        self,
+        src: Union[str, Path],
+        dst: Union[str, Path],
+        checks: Iterable[str] = ALL_CHECKS,
+    ) -> List[Difference]:
+        """
+        Differences of the <dst> tree from the <src> one in terms of
+        <checks>, see `tree_diff.diff_trees`. Relative paths are taken from
+        <root_dir>.
+        """
+        return diff_trees(
+            Path(self.root_dir) / src, Path(self.root_dir) / dst, checks
+        )
+
+    def prepare_copy(self):
+        """
+        Let the storage backend prepare <root_dir> for a measured copy, e.g.
+        evict its files from the page cache.
+        """
+        self.storage.before_copy(Path(self.root_dir))
+
+    def copy_timeout(self, src=None) -> float:
+        """
+        Timeout of a copy of <src> (the whole structure by default): the
+        time it is expected to take on the storage, with slack, see
+        `timeouts.adaptive_timeout`.
+
+        A generated tree isn't walked: a copy of it or of any part of it is
+        sized by its <stats>, only the rest of <src> is walked.
+        """
+        if src is None:
+            paths = [Path(self.root_dir)]
+        else:
+            paths = [Path(self.root_dir) / x for x in self._operands(src)]
+        nbytes, files = 0, 0
+        skip = []
+        if self.stats is not None:
+            skip = [self.tree_root]
+            in_tree = [x for x in paths if x.is_relative_to(self.tree_root)]
+            if in_tree or any(self.tree_root.is_relative_to(x) for x in paths):
+                nbytes, files = self.stats.bytes, self.stats.entries
+            paths = [x for x in paths if x not in in_tree]
+        more_bytes, more_files = source_size(paths, skip=skip)
+        baseline = storage_baseline(self.storage, self.root_dir)
+        return adaptive_timeout(
+            nbytes + more_bytes, files + more_files, baseline
+        )
+
+    def _timeout(self, timeout, src=None) -> Optional[float]:
+        return self.copy_timeout(src) if timeout == AUTO else timeout
+
+    def call_cmd(self, cmd, timeout=AUTO, stall=STALL_TIMEOUT):
         """
         Run any system command.
+
+        A string <cmd> is run through the shell, a list of arguments is
+        executed directly.
+
+        The command is killed past the <timeout> seconds, by default the
+        one of a copy of the whole structure, or once it makes no progress
+        for <stall> seconds (`process.CopyStalled` is raised then). None
+        disables either.
         """
-        subp = subprocess.run(
-            cmd, capture_output=True, shell=True, check=False, timeout=timeout
+        argv = ["/bin/sh", "-c", cmd] if isinstance(cmd, str) else cmd
+        return tuple(
+            run_instrumented(
+                argv,
+                env=self.env,
+                timeout=self._timeout(timeout),
+                stall=stall,
+            )
         )
-        return subp.returncode, subp.stdout, subp.stderr
 
-    def call_copy(self, src="", dst="", flags="", timeout=10):
+    def call_copy(
+        self,
+        src="",
+        dst="",
+        flags="",
+        timeout=AUTO,
+        shell=False,
+        instrument=False,
+        stall=STALL_TIMEOUT,
+    ):
         """
         Run system `cp` app.
+
+        `cp` is executed directly from <root_dir>, w/o a shell in between.
+        Set <shell> to run it through `/bin/sh` instead.
+
+        By default the <timeout> is derived from the size of <src>, see
+        `copy_timeout`. Besides, `cp` is killed once it makes no progress
+        for <stall> seconds, see `call_cmd`.
+
+        If <instrument> is set, the result is a `CopyResult`: it unpacks to
+        the same 3-tuple, and its <usage> attribute holds time, CPU, memory
+        and I/O consumed by the call. Otherwise the result may be replayed
+        from the <result_cache>.
         """
-        if not isinstance(src, str):
-            src = str(src)
-        if not isinstance(dst, str):
-            dst = str(dst)
-        cmd = " ".join(
-            [f"cd {self.root_dir.absolute()};cp", flags, src, dst]
-        ).strip()
-        subp = subprocess.run(
-            cmd,
-            capture_output=True,
-            shell=True,
-            check=False,
+        if shell:
+            argv = ["/bin/sh", "-c", self._shell_copy_cmd(src, dst, flags)]
+            cwd = None
+        else:
+            argv = self.copy_argv(src, dst, flags)
+            cwd = self.root_dir
+
+        def run():
+            result = run_instrumented(
+                argv,
+                cwd=cwd,
+                env=self.env,
+                timeout=self._timeout(timeout, src),
+                stall=stall,
+            )
+            return result if instrument else tuple(result)
+
+        if instrument or self.result_cache is None:
+            return run()
+        return self.result_cache.call(self, argv, run)
+
+    def stream_copy(
+        self,
+        src="",
+        dst="",
+        flags="",
+        timeout=AUTO,
+        raw_limit=RAW_LIMIT,
+        stall=STALL_TIMEOUT,
+    ) -> CopyStream:
+        """
+        Run `cp` like `call_copy` does, but consume its output as it comes.
+
+        `cp` starts once the result is iterated, which yields a `CopyEvent`
+        per line of output, e.g. per file copied with "-v"; only the last
+        <raw_limit> bytes of raw output are retained.
+        """
+        return CopyStream(
+            self.copy_argv(src, dst, flags),
+            cwd=self.root_dir,
+            env=self.env,
+            timeout=self._timeout(timeout, src),
+            raw_limit=raw_limit,
+            stall=stall,
+        )
+
+    async def acall_cmd(self, cmd, timeout=AUTO, stall=STALL_TIMEOUT):
+        """
+        Asynchronous counterpart of `call_cmd`.
+        """
+        argv = ["/bin/sh", "-c", cmd] if isinstance(cmd, str) else cmd
+        return await self._acall(
+            argv, timeout=self._timeout(timeout), stall=stall
+        )
+
+    async def acall_copy(
+        self,
+        src="",
+        dst="",
+        flags="",
+        timeout=AUTO,
+        shell=False,
+        stall=STALL_TIMEOUT,
+    ):
+        """
+        Asynchronous counterpart of `call_copy`.
+        """
+        timeout = self._timeout(timeout, src)
+        if shell:
+            cmd = self._shell_copy_cmd(src, dst, flags)
+            return await self.acall_cmd(cmd, timeout=timeout, stall=stall)
+        return await self._acall(
+            self.copy_argv(src, dst, flags),
             timeout=timeout,
+            stall=stall,
+            cwd=self.root_dir,
+        )
+
+    async def _acall(self, argv, timeout=None, stall=None, cwd=None):
+        proc = await asyncio.create_subprocess_exec(
+            *argv,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=cwd,
+            env=self.env,
         )
-        return subp.returncode, subp.stdout, subp.stderr
+        watchdog = Watchdog(argv, proc.pid, timeout=timeout, stall=stall)
+        communicate = asyncio.ensure_future(proc.communicate())
+        try:
+            while not communicate.done():
+                wait = watchdog.wait_time()
+                await asyncio.wait({communicate}, timeout=wait)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            await communicate
+            raise
+        stdout, stderr = communicate.result()
+        return proc.returncode, stdout, stderr
+
+    def run_copies(self, scenarios, concurrency=None):
+        """
+        Run independent `cp` calls concurrently.
+
+        Every scenario is a dict of `call_copy` keyword arguments. Results
+        are `(returncode, stdout, stderr)` tuples in the order of
+        <scenarios>. At most <concurrency> (CPU count by default) copies run
+        at a time, so scenarios must not touch the same files.
+        """
+        return asyncio.run(self.arun_copies(scenarios, concurrency))
+
+    async def arun_copies(self, scenarios, concurrency=None):
+        """
+        Asynchronous counterpart of `run_copies`.
+        """
+        limit = asyncio.Semaphore(concurrency or os.cpu_count() or 1)
+
+        async def run(scenario):
+            async with limit:
+                return await self.acall_copy(**scenario)
+
+        return list(await asyncio.gather(*(run(x) for x in scenarios)))
+
+    def copy_argv(self, src="", dst="", flags="") -> List[str]:
+        """
+        Build argument list of the `cp` call.
+
+        Strings are split into words as the shell does, and masks in <src>
+        and <dst> are expanded relative to <root_dir>.
+        Path objects and lists are taken as they are, so they are safe for
+        names with spaces or mask characters.
+        """
+        argv = [self.cp] + self._words(flags)
+        for operand in (src, dst):
+            argv.extend(self._operands(operand))
+        return argv
+
+    def _shell_copy_cmd(self, src="", dst="", flags="") -> str:
+        words = [
+            x if isinstance(x, str) else shlex.join(self._words(x))
+            for x in (flags, src, dst)
+        ]
+        cmd = f"cd {self.root_dir.absolute()};{self.cp}"
+        return " ".join([cmd] + words).strip()
+
+    def _operands(self, value) -> List[str]:
+        """
+        Words of a <src> or <dst> operand, as `copy_argv` passes them.
+        """
+        if not isinstance(value, str):
+            return self._words(value)
+        return [y for x in self._words(value) for y in self._expand(x)]
+
+    @staticmethod
+    def _words(value) -> List[str]:
+        if isinstance(value, str):
+            return shlex.split(value)
+        if isinstance(value, (list, tuple)):
+            return [str(x) for x in value]
+        return [str(value)]
+
+    def _expand(self, word: str) -> List[str]:
+        """
+        Expand mask the way `sh` does: left as is if nothing matches.
+        """
+        if not glob.has_magic(word):
+            return [word]
+        return sorted(glob.glob(word, root_dir=self.root_dir)) or [word]
 
     def update_env(self, lang: str = "C"):
         """
         Sets forcibly environment to <lang>, to test correctly messages.
+
+        The environment is passed to every subprocess explicitly, the one of
+        the process stays intact.
         """
-        self._original_env = os.environ.copy()
-        os.putenv("LANG", lang)
-        os.putenv("LC_ALL", lang)
+        self.env = locale_env(lang)
 
     def set_attr(self, file: Union[str, Path] = "", attr: str = ""):
         """
-        Set attribute to the file, using chattr command.
+        Set attribute to the file, using chattr command, see `set_attrs`.
+        """
+        return self.set_attrs([file], attr)
+
+    def set_attrs(
+        self, files: Iterable[Union[str, Path]], attr: str
+    ) -> subprocess.CompletedProcess:
+        """
+        Apply <attr> (e.g. "+i", "-a") to all <files> in one privileged
+        `chattr` call. Relative paths are taken from <root_dir>.
 
         This functionality requires either running tests from root user, or
         adding NOPASSWD option to /etc/sudoers. See README.md for more details.
+        Attributes set this way are cleared by `reset_attrs` on `clean`.
+        """
+        paths = [Path(self.root_dir) / x for x in files]
+        result = run_chattr(attr, paths, env=self.env)
+        letters = set(attr.lstrip("+-="))
+        for path in paths:
+            kept = self.attr_files.get(path, set())
+            if attr.startswith("+"):
+                kept = kept | letters
+            elif attr.startswith("-"):
+                kept = kept - letters
+            else:
+                kept = letters
+            if kept:
+                self.attr_files[path] = kept
+            else:
+                self.attr_files.pop(path, None)
+        return result
+
+    def reset_attrs(self) -> Optional[subprocess.CompletedProcess]:
         """
-        if isinstance(file, str):
-            file = Path(file).resolve()
+        Clear all attributes set with `set_attrs` at once, so the files can
+        be modified and removed again.
+        """
+        if not self.attr_files:
+            return None
+        letters = "".join(sorted(set().union(*self.attr_files.values())))
+        existing = [x for x in self.attr_files if os.path.lexists(x)]
+        self.attr_files.clear()
+        if not existing:
+            return None
+        return run_chattr(f"-{letters}", existing, env=self.env)
 
-        cmd = f"sudo chattr {attr} {file}"
-        subp = subprocess.run(
-            cmd,
-            shell=True,
-            capture_output=True,
-            check=False,
+    def snapshot(self) -> Snapshot:
+        """
+        Remember the state of the tree, to bring it back with `restore`.
+        Files are stashed in a directory next to <root_dir>.
+        """
+        self.discard_snapshot()
+        stash = tempfile.mkdtemp(
+            prefix=".snapshot-", dir=Path(self.root_dir).parent
+        )
+        self.last_snapshot = take_snapshot(
+            self.root_dir, stash, self.shared_files
         )
-        return subp
-
-    def clean(self):
-        """
-        Reset and clean directories and files.
-        """
-        dirs_to_drop = []
-        for dirpath, _, files in os.walk(self.root_dir, topdown=True):
-            for file in files:
-                target_file = Path(dirpath) / file
-                if target_file.exists() and not target_file.is_symlink:
-                    target_file.chmod(0o666)  # Reset permissions if any
-                target_file.unlink(missing_ok=True)
-            if dirpath not in dirs_to_drop:
-                dirs_to_drop.append(dirpath)
-
-        for dirname in dirs_to_drop[::-1]:
-            drop_dir = Path(dirname)
-            if drop_dir.exists():
-                drop_dir.chmod(0o777)
-                drop_dir.rmdir()
+        return self.last_snapshot
+
+    def restore(self) -> int:
+        """
+        Bring the tree back to the last `snapshot`, rewriting only entries
+        changed since then and removing new ones. Returns the amount of
+        entries restored or removed.
+        """
+        if self.last_snapshot is None:
+            raise RuntimeError("no snapshot to restore, call snapshot()")
+        self.reset_attrs()
+        return restore_snapshot(self.last_snapshot)
+
+    def discard_snapshot(self):
+        """
+        Forget the last `snapshot` and remove its stash.
+        """
+        if self.last_snapshot is not None:
+            self.last_snapshot.discard()
+            self.last_snapshot = None
+
+    def clean(self, background=False):
+        """
+        Reset attributes of files, and clean directories and files.
+
+        If <background> is set, the tree is only moved aside at once and
+        removed by a background thread, see `teardown.wait_for_removals`.
+        """
+        self.reset_attrs()
+        self.discard_snapshot()
+        if background:
+            remove_tree_in_background(self.root_dir)
+        else:
+            remove_tree(self.root_dir)
@@ -0,0 +1,431 @@
+"""
+Combinations of `cp` flags, generated n-wise and pruned of equivalent ones.
+
+The full cartesian product of a dozen flags is thousands of `cp` calls,
+while most bugs show up with one or two flags set in a certain way. Here
+flags are grouped into dimensions - alternatives of which at most one is
+given - and combinations are generated so that every pair (or n-tuple, for
+a higher strength) of values of different dimensions appears in at least
+one of them.
+
+Many spellings mean the same to `cp`: `-a` is `-dR --preserve=all`,
+`--backup=t` is `--backup=numbered`, `-H` is `-L` unless copying
+recursively. Flags are parsed into `Options`, reduced to a canonical form,
+and only the first combination of every canonical form is kept. Spellings
+which are the same everywhere are pruned from dimensions even before
+combinations are generated.
+
+The canonical form assumes VERSION_CONTROL is not set, as `update_env`
+of test structures leaves it.
+"""
+
+import asyncio
+import functools
+import itertools
+import math
+import os
+import shlex
+from dataclasses import dataclass, field, replace
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    FrozenSet,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+if TYPE_CHECKING:
+    from test_linux_cp.dir_structure import DirStructure
+
+PRESERVE_ALL = "all"
+_PRESERVED_BY_ALL = frozenset(
+    ["mode", "ownership", "timestamps", "links", "xattr"]
+)
+_BACKUP_ALIASES = {
+    "t": "numbered",
+    "numbered": "numbered",
+    "nil": "existing",
+    "existing": "existing",
+    "never": "simple",
+    "simple": "simple",
+    "none": "",
+    "off": "",
+}
+# Words of flags in terms of "-r", "-L", "-P", "-H", "-n", "-u", "-f", "-v"
+# and long flags with a value. Short flags w/o an argument may be
+# clustered: "-dR".
+_ARCHIVE = ["-P", "--preserve=links", "-r", "--preserve=all"]
+_SHORT_EXPANSIONS = {
+    "a": _ARCHIVE,
+    "d": ["-P", "--preserve=links"],
+    "p": ["--preserve=mode,ownership,timestamps"],
+    "b": ["--backup=existing"],
+    "R": ["-r"],
+    "r": ["-r"],
+    "L": ["-L"],
+    "P": ["-P"],
+    "H": ["-H"],
+    "n": ["-n"],
+    "u": ["-u"],
+    "f": ["-f"],
+    "v": ["-v"],
+}
+_LONG_EXPANSIONS = {
+    "--archive": _ARCHIVE,
+    "--recursive": ["-r"],
+    "--dereference": ["-L"],
+    "--no-dereference": ["-P"],
+    "--no-clobber": ["-n"],
+    "--update": ["-u"],
+    "--force": ["-f"],
+    "--verbose": ["-v"],
+    "--backup": ["--backup=existing"],
+    "--preserve": ["--preserve=mode,ownership,timestamps"],
+}
+
+
+@dataclass(frozen=True)
+class Options:
+    """
+    What a set of `cp` flags asks for. <dereference> is "L", "P", "H" or
+    "" for the default, <backup> is the version control, "" for none, and
+    <backup_given> tells whether any "--backup" was given: `cp` refuses it
+    with "-n" even if it makes no backups. Flags the parser doesn't know are
+    kept in <other> as they are.
+    """
+
+    recursive: bool = False
+    dereference: str = ""
+    preserve: FrozenSet[str] = frozenset()
+    backup: str = ""
+    backup_given: bool = False
+    no_clobber: bool = False
+    update: bool = False
+    force: bool = False
+    remove_destination: bool = False
+    verbose: bool = False
+    sparse: str = "auto"
+    other: Tuple[str, ...] = ()
+
+    def preserves(self, attr: str) -> bool:
+        """
+        Whether the attribute <attr> (e.g. "mode") is preserved.
+        """
+        return attr in self.preserve or PRESERVE_ALL in self.preserve
+
+    def flags(self) -> str:
+        """
+        Canonical spelling of the options.
+        """
+        words = ["-r"] if self.recursive else []
+        if self.dereference:
+            words.append(f"-{self.dereference}")
+        if self.preserve:
+            words.append(f"--preserve={','.join(sorted(self.preserve))}")
+        if self.backup_given:
+            words.append(f"--backup={self.backup or 'off'}")
+        switches = [
+            (self.no_clobber, "-n"),
+            (self.update, "-u"),
+            (self.force, "-f"),
+            (self.remove_destination, "--remove-destination"),
+            (self.verbose, "-v"),
+        ]
+        words.extend(word for on, word in switches if on)
+        if self.sparse != "auto":
+            words.append(f"--sparse={self.sparse}")
+        return shlex.join(words + list(self.other))
+
+
+def _expand(word: str) -> List[str]:
+    if word in _LONG_EXPANSIONS:
+        return _LONG_EXPANSIONS[word]
+    letters = word[1:]
+    if (
+        word.startswith("-")
+        and not word.startswith("--")
+        and letters
+        and all(x in _SHORT_EXPANSIONS for x in letters)
+    ):
+        return [y for x in letters for y in _SHORT_EXPANSIONS[x]]
+    return [word]
+
+
+def parse_flags(flags: str) -> Options:
+    """
+    Options the <flags> ask for, as `cp` reads them: in order, the last of
+    conflicting ones wins.
+    """
+    options = Options()
+    words = [y for x in shlex.split(flags) for y in _expand(x)]
+    preserve = set()
+    for word in words:
+        name, _, value = word.partition("=")
+        if word == "-r":
+            options = replace(options, recursive=True)
+        elif word in ("-L", "-P", "-H"):
+            options = replace(options, dereference=word[1])
+        elif name == "--preserve":
+            preserve.update(value.split(","))
+        elif name == "--no-preserve":
+            attrs = set(value.split(","))
+            preserve = set() if PRESERVE_ALL in attrs else preserve - attrs
+        elif name == "--backup" and value in _BACKUP_ALIASES:
+            options = replace(
+                options, backup=_BACKUP_ALIASES[value], backup_given=True
+            )
+        elif word == "-n":
+            options = replace(options, no_clobber=True)
+        elif word == "-u":
+            options = replace(options, update=True)
+        elif word == "-f":
+            options = replace(options, force=True)
+        elif word == "--remove-destination":
+            options = replace(options, remove_destination=True)
+        elif word == "-v":
+            options = replace(options, verbose=True)
+        elif name == "--sparse" and value:
+            options = replace(options, sparse=value)
+        else:
+            options = replace(options, other=options.other + (word,))
+    return replace(options, preserve=frozenset(preserve))
+
+
+def canonical(options: Options) -> Options:
+    """
+    Reduce <options> to the ones `cp` acts the same on: the default
+    dereferencing made explicit, "-H" being "-L" for a copy which is not
+    recursive, where all symlinks to follow are on the command line, and
+    attributes which "all" preserves anyway dropped.
+    """
+    preserve = options.preserve
+    if PRESERVE_ALL in preserve:
+        # "context" stays: given explicitly, failing to preserve it is
+        # an error, while "all" just skips it.
+        preserve = preserve - _PRESERVED_BY_ALL
+    dereference = options.dereference
+    if not dereference:
+        dereference = "P" if options.recursive else "L"
+    elif dereference == "H" and not options.recursive:
+        dereference = "L"
+    return replace(options, dereference=dereference, preserve=preserve)
+
+
+def canonical_flags(flags: str) -> str:
+    """
+    Canonical spelling of <flags>: equal for flags `cp` acts the same on.
+    """
+    return canonical(parse_flags(flags)).flags()
+
+
+@dataclass(frozen=True)
+class Dimension:
+    """
+    Alternative spellings of a flag, "" for not giving it.
+    """
+
+    name: str
+    values: Tuple[str, ...]
+
+    def pruned(self) -> "Dimension":
+        """
+        The dimension w/o values, which ask for the same options as an
+        earlier one.
+        """
+        seen, values = set(), []
+        for value in self.values:
+            options = parse_flags(value)
+            if options not in seen:
+                seen.add(options)
+                values.append(value)
+        return Dimension(self.name, tuple(values))
+
+
+DIMENSIONS = (
+    Dimension("recursion", ("", "-r", "-R", "--recursive")),
+    Dimension(
+        "attributes",
+        (
+            "",
+            "-a",
+            "--archive",
+            "-dR --preserve=all",
+            "-p",
+            "--preserve=mode,ownership,timestamps",
+            "--preserve=all",
+        ),
+    ),
+    Dimension("dereference", ("", "-L", "-P", "-H", "-d")),
+    Dimension(
+        "backup",
+        (
+            "",
+            "--backup=numbered",
+            "--backup=t",
+            "--backup=existing",
+            "--backup=nil",
+            "--backup=simple",
+            "--backup=never",
+            "--backup=none",
+            "--backup=off",
+        ),
+    ),
+    Dimension("overwrite", ("", "-n", "-u", "-f", "--remove-destination")),
+    Dimension("verbose", ("", "-v")),
+    Dimension(
+        "sparse",
+        ("", "--sparse=auto", "--sparse=always", "--sparse=never"),
+    ),
+)
+
+
+def accepted(flags: str) -> bool:
+    """
+    Whether `cp` accepts <flags> together, rather than fails on usage.
+    """
+    options = parse_flags(flags)
+    return not (options.no_clobber and options.backup_given)
+
+
+def covering_rows(
+    sizes: Sequence[int],
+    strength: int = 2,
+    allowed: Optional[Callable[[Dict[int, int]], bool]] = None,
+) -> List[Tuple[int, ...]]:
+    """
+    Rows of value indices for dimensions of <sizes> values, which contain
+    every combination of values of <strength> dimensions at least once.
+
+    <allowed> tells whether a partial row ({dimension: value}) may be
+    extended to a valid one; combinations it rejects aren't required.
+    Rows are built greedily: each starts from a combination not covered yet
+    and takes for every other dimension the value covering most of the
+    rest, so the result is deterministic.
+    """
+    if strength < 1:
+        raise ValueError(f"strength must be positive, got {strength}")
+    allowed = allowed if allowed is not None else (lambda row: True)
+    dims = range(len(sizes))
+    strength = min(strength, len(sizes))
+    uncovered = set()
+    for subset in itertools.combinations(dims, strength):
+        for values in itertools.product(*(range(sizes[x]) for x in subset)):
+            if allowed(dict(zip(subset, values))):
+                uncovered.add((subset, values))
+
+    def covered(row: Dict[int, int], dim: Optional[int] = None):
+        for subset in itertools.combinations(sorted(row), strength):
+            if dim is None or dim in subset:
+                yield subset, tuple(row[x] for x in subset)
+
+    def gain(row: Dict[int, int], dim: int, value: int) -> Tuple[int, int]:
+        # Combinations the <value> of <dim> adds to the <row>, ties going to
+        # the lowest value.
+        extended = {**row, dim: value}
+        return sum(x in uncovered for x in covered(extended, dim)), -value
+
+    rows = []
+    while uncovered:
+        subset, values = min(uncovered)
+        row = dict(zip(subset, values))
+        for dim in dims:
+            if dim in row:
+                continue
+            candidates = [
+                x for x in range(sizes[dim]) if allowed({**row, dim: x})
+            ]
+            if not candidates:
+                raise ValueError(f"no allowed value of dimension {dim}")
+            row[dim] = max(candidates, key=functools.partial(gain, row, dim))
+        uncovered.difference_update(covered(row))
+        rows.append(tuple(row[x] for x in dims))
+    return rows
+
+
+@dataclass(frozen=True)
+class FlagCase:
+    """
+    Flags of a generated combination: <flags> as given to `cp`, its
+    canonical <options> and <equivalents> - combinations pruned as the same.
+    """
+
+    flags: str
+    options: Options
+    equivalents: Tuple[str, ...] = field(default=())
+
+    @property
+    def canonical(self) -> str:
+        """
+        Canonical spelling of the flags.
+        """
+        return self.options.flags()
+
+
+def _join(values: Sequence[str]) -> str:
+    return " ".join(x for x in values if x)
+
+
+def flag_matrix(
+    dimensions: Sequence[Dimension] = DIMENSIONS,
+    strength: int = 2,
+    allowed: Callable[[str], bool] = accepted,
+) -> List[FlagCase]:
+    """
+    Combinations of <dimensions> covering all tuples of values of
+    <strength> dimensions, one per canonical form. <allowed> filters out
+    flags `cp` rejects.
+    """
+    dimensions = [x.pruned() for x in dimensions]
+
+    def allowed_row(row: Dict[int, int]) -> bool:
+        return allowed(
+            _join([dimensions[x].values[row[x]] for x in sorted(row)])
+        )
+
+    cases: Dict[Options, List[str]] = {}
+    for row in covering_rows(
+        [len(x.values) for x in dimensions], strength, allowed_row
+    ):
+        flags = _join([x.values[y] for x, y in zip(dimensions, row)])
+        cases.setdefault(canonical(parse_flags(flags)), []).append(flags)
+    return [
+        FlagCase(flags[0], options, tuple(flags[1:]))
+        for options, flags in cases.items()
+    ]
+
+
+def cartesian_size(dimensions: Sequence[Dimension] = DIMENSIONS) -> int:
+    """
+    Amount of combinations of all values of <dimensions>, the cost of
+    testing them exhaustively.
+    """
+    return math.prod(len(x.values) for x in dimensions)
+
+
+def run_cases(
+    runs: Sequence[Tuple["DirStructure", FlagCase]],
+    src="",
+    dst="",
+    concurrency: Optional[int] = None,
+) -> List[Tuple[int, bytes, bytes]]:
+    """
+    Copy <src> to <dst> in every structure with the flags of its case,
+    concurrently. Every case needs a structure of its own. Results are
+    `(returncode, stdout, stderr)` in the order of <runs>.
+    """
+    return asyncio.run(_arun_cases(runs, src, dst, concurrency))
+
+
+async def _arun_cases(runs, src, dst, concurrency):
+    limit = asyncio.Semaphore(concurrency or os.cpu_count() or 1)
+
+    async def run(structure, case):
+        async with limit:
+            return await structure.acall_copy(
+                src=src, dst=dst, flags=case.flags
+            )
+
+    return list(await asyncio.gather(*(run(*x) for x in runs)))
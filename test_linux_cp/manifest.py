@@ -0,0 +1,140 @@
+"""
+Compact index of the entries of a directory tree.
+
+A `Path` per entry costs a few hundred bytes, which is a lot for trees of
+millions of entries. The manifest keeps entries in columns instead: the
+name of every entry (interned, so repeated names are stored once), and
+`array` columns of the parent index, size, permission bits and type.
+Relative paths and `Path` objects are built from the parent chain only when
+an entry is looked up.
+
+Entries are found by relative path, or by name, which may be shared by
+entries in different directories.
+"""
+
+import os
+import stat
+import sys
+from array import array
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Union
+
+# Parent index of top-level entries.
+NO_PARENT = -1
+
+
+class Entry(NamedTuple):
+    """
+    Entry of a manifest: the relative <path>, <size>, permission bits
+    (<mode>) and file type (`stat.S_IFMT` of the mode).
+    """
+
+    path: str
+    size: int
+    mode: int
+    type: int
+
+
+class Manifest:
+    """
+    Entries of the tree at <root> in columns.
+    """
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+        self.names: List[str] = []
+        self.parents = array("q")
+        self.sizes = array("q")
+        self.modes = array("H")
+        self.types = array("B")
+        # First entry with a name, and all of them for names used more than
+        # once.
+        self._by_name: Dict[str, int] = {}
+        self._shared_names: Dict[str, List[int]] = {}
+
+    @classmethod
+    def scan(cls, root: Union[str, Path]) -> "Manifest":
+        """
+        Index all entries under <root>, parents before their children.
+        """
+        manifest = cls(root)
+        pending = [(os.fspath(root), NO_PARENT)]
+        while pending:
+            directory, parent = pending.pop()
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    info = entry.stat(follow_symlinks=False)
+                    idx = manifest.append(entry.name, parent, info)
+                    if stat.S_ISDIR(info.st_mode):
+                        pending.append((entry.path, idx))
+        return manifest
+
+    def append(self, name: str, parent: int, info: os.stat_result) -> int:
+        """
+        Add the entry <name> in the directory at index <parent>, with the
+        attributes of <info>. Returns its index.
+        """
+        idx = len(self.names)
+        name = sys.intern(name)
+        self.names.append(name)
+        self.parents.append(parent)
+        self.sizes.append(info.st_size)
+        self.modes.append(stat.S_IMODE(info.st_mode))
+        self.types.append(stat.S_IFMT(info.st_mode) >> 12)
+        first = self._by_name.setdefault(name, idx)
+        if first != idx:
+            self._shared_names.setdefault(name, [first]).append(idx)
+        return idx
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def find(self, name: str) -> List[int]:
+        """
+        Indices of entries named <name>.
+        """
+        if name in self._shared_names:
+            return list(self._shared_names[name])
+        idx = self._by_name.get(name)
+        return [] if idx is None else [idx]
+
+    def index(self, path: Union[str, Path]) -> int:
+        """
+        Index of the entry at the relative <path>. Raises KeyError if there
+        is no such entry.
+        """
+        parts = Path(path).parts
+        for idx in self.find(parts[-1]) if parts else []:
+            if self._parts(idx) == list(parts):
+                return idx
+        raise KeyError(os.fspath(path))
+
+    def _parts(self, idx: int) -> List[str]:
+        parts = []
+        while idx != NO_PARENT:
+            parts.append(self.names[idx])
+            idx = self.parents[idx]
+        return parts[::-1]
+
+    def relpath(self, idx: int) -> str:
+        """
+        Path of the entry at <idx> relative to the root.
+        """
+        return os.path.join(*self._parts(idx))
+
+    def path(self, idx: int) -> Path:
+        """
+        Path of the entry at <idx>.
+        """
+        return self.root.joinpath(*self._parts(idx))
+
+    def entry(self, idx: int) -> Entry:
+        """
+        All columns of the entry at <idx>.
+        """
+        return Entry(
+            self.relpath(idx),
+            self.sizes[idx],
+            self.modes[idx],
+            self.types[idx] << 12,
+        )
@@ -0,0 +1,376 @@
+"""
+Running of commands with resource accounting and hang detection.
+
+`subprocess.run` reaps a child with `waitpid`, which throws its resource
+usage away. Here the child is reaped by `os.wait4` instead, and its I/O
+counters are sampled from `/proc/<pid>/io` while it is still a zombie.
+
+While a command runs, a `Watchdog` samples the same counters and CPU time
+of the command and its descendants. A command which makes no progress for
+<stall> seconds is killed, and `CopyStalled` tells what it was doing.
+"""
+
+import functools
+import os
+import selectors
+import subprocess
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+
+# Seconds w/o any I/O or CPU progress, before a command is taken as hung.
+STALL_TIMEOUT = 5.0
+# Seconds between progress samples.
+POLL_INTERVAL = 0.05
+
+
+@dataclass(frozen=True)
+class ResourceUsage:
+    """
+    Resources consumed by a single command call.
+    """
+
+    wall_time: float  # seconds
+    user_time: float  # seconds
+    sys_time: float  # seconds
+    # KiB. Linux carries the high-water mark of the spawning process over
+    # execve, so this is never below the RSS the caller had at spawn time.
+    max_rss: int
+    major_faults: int
+    minor_faults: int
+    block_in: int  # blocks read by the filesystem
+    block_out: int  # blocks written by the filesystem
+    rchar: int  # bytes passed to read-like syscalls
+    wchar: int  # bytes passed to write-like syscalls
+    read_bytes: int  # bytes fetched from the storage
+    write_bytes: int  # bytes sent to the storage
+    read_calls: int = 0  # read-like syscalls
+    write_calls: int = 0  # write-like syscalls
+
+    @property
+    def cpu_time(self) -> float:
+        """
+        User and system CPU time together.
+        """
+        return self.user_time + self.sys_time
+
+
+class CopyResult(tuple):
+    """
+    `(returncode, stdout, stderr)` tuple, which also carries resources used
+    by the call in the <usage> attribute.
+    """
+
+    def __new__(cls, returncode, stdout, stderr, usage: ResourceUsage):
+        result = super().__new__(cls, (returncode, stdout, stderr))
+        result.usage = usage
+        return result
+
+    @property
+    def returncode(self) -> int:
+        """
+        Exit code of the command.
+        """
+        return self[0]
+
+    @property
+    def stdout(self) -> bytes:
+        """
+        Captured standard output.
+        """
+        return self[1]
+
+    @property
+    def stderr(self) -> bytes:
+        """
+        Captured standard error.
+        """
+        return self[2]
+
+
+@functools.lru_cache(maxsize=None)
+def locale_env(lang: str = "C") -> Mapping[str, str]:
+    """
+    Environment for subprocesses: the one of the process at the first call
+    with <lang> locale forced. It is built once per <lang> and read-only, so
+    it is safe to share between structures and threads.
+    """
+    env = dict(os.environ)
+    env["LANG"] = lang
+    env["LC_ALL"] = lang
+    return MappingProxyType(env)
+
+
+def read_proc_io(pid: int) -> Dict[str, int]:
+    """
+    Read I/O counters of the process, empty dict if they are unavailable.
+    """
+    try:
+        with open(f"/proc/{pid}/io", encoding="ascii") as stream:
+            lines = stream.read().splitlines()
+    except OSError:
+        return {}
+    counters = {}
+    for line in lines:
+        name, _, value = line.partition(":")
+        counters[name] = int(value)
+    return counters
+
+
+@dataclass(frozen=True)
+class StallReport:
+    """
+    State of a process, which stopped making progress: its <pid> and
+    <name>, seconds it has been <idle> for, its I/O <counters>, scheduler
+    <state>, the <syscall> it is in, and <files> it has open with the
+    offsets in them.
+    """
+
+    pid: int
+    name: str
+    idle: float
+    counters: Dict[str, int]
+    state: str
+    syscall: str
+    files: List[Tuple[str, int]]
+
+    def describe(self) -> str:
+        """
+        One-line human-readable report.
+        """
+        files = ", ".join(f"{path} at {pos}" for path, pos in self.files)
+        return (
+            f"{self.name} (pid {self.pid}) made no progress for "
+            f"{self.idle:.1f}s: state {self.state}, syscall {self.syscall}, "
+            f"read {self.counters.get('rchar', 0)} B, "
+            f"written {self.counters.get('wchar', 0)} B, "
+            f"open files: {files or 'none'}"
+        )
+
+
+class CopyStalled(subprocess.TimeoutExpired):
+    """
+    Raised when a command is killed for making no progress.
+    """
+
+    def __init__(self, cmd, stall: float, report: StallReport):
+        super().__init__(cmd, stall)
+        self.report = report
+
+    def __str__(self):
+        return f"Command '{self.cmd}' stalled: {self.report.describe()}"
+
+
+def _read_proc(pid: int, name: str) -> str:
+    try:
+        with open(f"/proc/{pid}/{name}", encoding="utf-8") as stream:
+            return stream.read()
+    except OSError:
+        return ""
+
+
+def _descendants(pid: int) -> List[int]:
+    """
+    <pid> and all processes it spawned, which are still alive, parents
+    first.
+    """
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop(0)
+        pids.append(current)
+        children = _read_proc(current, f"task/{current}/children")
+        pending.extend(int(x) for x in children.split())
+    return pids
+
+
+def _cpu_ticks(pid: int) -> int:
+    # Fields after the name in parentheses, which may contain anything.
+    fields = _read_proc(pid, "stat").rpartition(")")[2].split()
+    return int(fields[11]) + int(fields[12]) if len(fields) > 12 else 0
+
+
+def _open_files(pid: int) -> List[Tuple[str, int]]:
+    """
+    Regular files open by the process, with offsets of their descriptors.
+    """
+    files = []
+    try:
+        fds = sorted(os.listdir(f"/proc/{pid}/fd"), key=int)
+    except OSError:
+        return files
+    for fd in fds:
+        try:
+            path = os.readlink(f"/proc/{pid}/fd/{fd}")
+        except OSError:
+            continue
+        if not path.startswith("/") or path.startswith("/dev/"):
+            continue
+        info = _read_proc(pid, f"fdinfo/{fd}").split()
+        pos = int(info[1]) if info[:1] == ["pos:"] else 0
+        files.append((path, pos))
+    return files
+
+
+def stall_report(pid: int, idle: float) -> StallReport:
+    """
+    What the process is doing now.
+    """
+    stat = _read_proc(pid, "stat")
+    name = stat.partition("(")[2].rpartition(")")[0]
+    state = stat.rpartition(")")[2].split()[:1]
+    return StallReport(
+        pid=pid,
+        name=name,
+        idle=idle,
+        counters=read_proc_io(pid),
+        state=state[0] if state else "?",
+        syscall=(_read_proc(pid, "syscall").split() or ["?"])[0],
+        files=_open_files(pid),
+    )
+
+
+class Watchdog:
+    """
+    Deadline and progress tracking of a running process.
+
+    Call `wait_time` whenever the process is to be waited for: it raises
+    `subprocess.TimeoutExpired` past the <timeout>, and `CopyStalled` if
+    neither the process nor any of its descendants did I/O or used CPU for
+    <stall> seconds.
+    """
+
+    def __init__(
+        self,
+        argv,
+        pid: int,
+        timeout: Optional[float] = None,
+        stall: Optional[float] = None,
+    ):
+        self.argv = argv
+        self.pid = pid
+        self.timeout = timeout
+        self.stall = stall
+        now = time.monotonic()
+        self.deadline = None if timeout is None else now + timeout
+        self._progress: Optional[tuple] = None
+        self._progressed = now
+        self._sampled = now
+
+    def wait_time(self) -> Optional[float]:
+        """
+        Seconds to wait for the process before the next check.
+        """
+        now = time.monotonic()
+        if self.deadline is not None and now >= self.deadline:
+            raise subprocess.TimeoutExpired(self.argv, self.timeout)
+        if self.stall is None:
+            return None if self.deadline is None else self.deadline - now
+        if now - self._sampled >= POLL_INTERVAL:
+            self._check(now)
+        wait = POLL_INTERVAL
+        if self.deadline is not None:
+            wait = min(wait, self.deadline - now)
+        return wait
+
+    def _check(self, now: float):
+        self._sampled = now
+        pids = _descendants(self.pid)
+        progress = tuple(
+            (
+                pid,
+                _cpu_ticks(pid),
+                tuple(read_proc_io(pid).values()),
+            )
+            for pid in pids
+        )
+        if progress != self._progress:
+            self._progress = progress
+            self._progressed = now
+        elif now - self._progressed >= self.stall:
+            report = stall_report(pids[-1], now - self._progressed)
+            raise CopyStalled(self.argv, self.stall, report)
+
+
+def run_instrumented(
+    argv,
+    cwd=None,
+    env=None,
+    timeout: Optional[float] = 10,
+    stall: Optional[float] = None,
+) -> CopyResult:
+    """
+    Run <argv>, capture its output and account resources it used.
+
+    The command is killed past the <timeout>, or once it makes no progress
+    for <stall> seconds, see `Watchdog`.
+    """
+    start = time.perf_counter()
+    with subprocess.Popen(
+        argv,
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    ) as proc:
+        watchdog = Watchdog(argv, proc.pid, timeout=timeout, stall=stall)
+        try:
+            stdout, stderr = _drain(proc, watchdog)
+            _wait_exited(proc.pid, watchdog)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            raise
+
+        proc_io = read_proc_io(proc.pid)
+        _, status, rusage = os.wait4(proc.pid, 0)
+        wall_time = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+
+    usage = ResourceUsage(
+        wall_time=wall_time,
+        user_time=rusage.ru_utime,
+        sys_time=rusage.ru_stime,
+        max_rss=rusage.ru_maxrss,
+        major_faults=rusage.ru_majflt,
+        minor_faults=rusage.ru_minflt,
+        block_in=rusage.ru_inblock,
+        block_out=rusage.ru_oublock,
+        rchar=proc_io.get("rchar", 0),
+        wchar=proc_io.get("wchar", 0),
+        read_bytes=proc_io.get("read_bytes", 0),
+        write_bytes=proc_io.get("write_bytes", 0),
+        read_calls=proc_io.get("syscr", 0),
+        write_calls=proc_io.get("syscw", 0),
+    )
+    return CopyResult(proc.returncode, stdout, stderr, usage)
+
+
+def _drain(proc: subprocess.Popen, watchdog: Watchdog):
+    """
+    Read stdout and stderr of <proc> till both are closed.
+    """
+    chunks = {proc.stdout: [], proc.stderr: []}
+    with selectors.DefaultSelector() as selector:
+        for pipe in chunks:
+            selector.register(pipe, selectors.EVENT_READ)
+        while selector.get_map():
+            for key, _ in selector.select(watchdog.wait_time()):
+                data = os.read(key.fd, 65536)
+                if data:
+                    chunks[key.fileobj].append(data)
+                else:
+                    selector.unregister(key.fileobj)
+    return b"".join(chunks[proc.stdout]), b"".join(chunks[proc.stderr])
+
+
+def _wait_exited(pid: int, watchdog: Watchdog):
+    """
+    Wait for the process to exit, but leave it unreaped.
+    """
+    flags = os.WEXITED | os.WNOWAIT | os.WNOHANG
+    delay = 0.0001
+    while os.waitid(os.P_PID, pid, flags) is None:
+        watchdog.wait_time()
+        time.sleep(delay)
+        delay = min(delay * 2, 0.01)
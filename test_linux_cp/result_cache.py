@@ -0,0 +1,536 @@
+"""
+Persistent cache of `cp` scenario results.
+
+A scenario is keyed by everything that decides what `cp` does: the content
+hash of the resolved `cp` binary, the argv with the structure root replaced
+by a placeholder, the variables of the environment `cp` reads, the user and
+umask, the storage backend, and the fingerprint of the tree under the root:
+type, mode, owner, size, data extents and content of every entry, hardlinks
+within the tree, and for `-u` scenarios the order of modification times.
+
+A miss runs `cp` and records its `(returncode, stdout, stderr)` and the
+delta of the tree: entries it removed, and entries it created or changed,
+with content, data extents, hardlinks and modification times taken from
+entries which existed before. A hit replays the delta and checks that the
+tree has the recorded digest (of everything but times); if it doesn't, the
+record is dropped and `ReplayError` is raised.
+
+Scenarios whose effect can't be replayed aren't recorded: ones touching
+paths outside the root, creating special files or files of another owner,
+or writing more than `MAX_RECORDED` bytes.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from test_linux_cp.sparse import data_extents
+from test_linux_cp.tree_diff import file_sha256
+
+# Bump when the format of keys or records changes.
+CACHE_VERSION = 1
+# Environment variables, which change what `cp` does or prints.
+CP_ENV = (
+    "LANG",
+    "LANGUAGE",
+    "LC_ALL",
+    "LC_COLLATE",
+    "LC_CTYPE",
+    "LC_MESSAGES",
+    "LC_NUMERIC",
+    "LC_TIME",
+    "PATH",
+    "POSIXLY_CORRECT",
+    "QUOTING_STYLE",
+    "SIMPLE_BACKUP_SUFFIX",
+    "TZ",
+    "VERSION_CONTROL",
+)
+# Data a scenario may write to be recorded, bytes.
+MAX_RECORDED = 16 << 20
+# Placeholder of the structure root in argv, output and symlink targets.
+ROOT = "<root>"
+_READ_SIZE = 1 << 20
+
+
+class Uncacheable(Exception):
+    """
+    Raised when a scenario can't be keyed or replayed.
+    """
+
+
+class ReplayError(RuntimeError):
+    """
+    Raised when a replayed scenario doesn't leave the recorded tree. The
+    tree is changed by then, so the scenario can't be run instead.
+    """
+
+
+@dataclass(frozen=True)
+class Entry:
+    """
+    State of a path of the tree. <digest> is the hash of the data in
+    <extents> for files, <target> is the one of symlinks.
+    """
+
+    kind: str  # "f", "d", "l" or "o" for anything else
+    mode: int
+    uid: int
+    gid: int
+    size: int
+    mtime: int
+    atime: int
+    inode: Tuple[int, int]
+    extents: Tuple[Tuple[int, int], ...] = ()
+    digest: str = ""
+    target: str = ""
+
+
+def _kind(mode: int) -> str:
+    if stat.S_ISREG(mode):
+        return "f"
+    if stat.S_ISDIR(mode):
+        return "d"
+    if stat.S_ISLNK(mode):
+        return "l"
+    return "o"
+
+
+def _read_extents(path: str, extents) -> List[bytes]:
+    """
+    Data of the file in <extents>, w/o updating its access time where the
+    kernel allows it.
+    """
+    try:
+        fd = os.open(path, os.O_RDONLY | os.O_NOATIME)
+    except PermissionError:
+        fd = os.open(path, os.O_RDONLY)
+    try:
+        chunks = []
+        for offset, length in extents:
+            while length:
+                chunk = os.pread(fd, min(length, _READ_SIZE), offset)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                offset += len(chunk)
+                length -= len(chunk)
+        return chunks
+    finally:
+        os.close(fd)
+
+
+def scan_tree(root: Path) -> Dict[str, Entry]:
+    """
+    Entries under <root> by their relative paths, w/o the root itself.
+    """
+    entries = {}
+    prefix = ROOT.encode()
+    root_bytes = os.fsencode(root)
+    pending = [""]
+    try:
+        while pending:
+            rel_dir = pending.pop()
+            with os.scandir(os.path.join(root, rel_dir)) as items:
+                for item in items:
+                    rel = os.path.join(rel_dir, item.name)
+                    info = item.stat(follow_symlinks=False)
+                    kind = _kind(info.st_mode)
+                    extents, digest, target = (), "", ""
+                    if kind == "f":
+                        extents = tuple(data_extents(item.path))
+                        sha = hashlib.sha256()
+                        for chunk in _read_extents(item.path, extents):
+                            sha.update(chunk)
+                        digest = sha.hexdigest()
+                    elif kind == "l":
+                        raw = os.readlink(os.fsencode(item.path))
+                        target = os.fsdecode(raw.replace(root_bytes, prefix))
+                        if _outside_root(os.path.join(rel_dir, target)):
+                            raise Uncacheable(f"{rel} points out of root")
+                    elif kind == "d":
+                        pending.append(rel)
+                    entries[rel] = Entry(
+                        kind=kind,
+                        mode=info.st_mode,
+                        uid=info.st_uid,
+                        gid=info.st_gid,
+                        size=info.st_size if kind in "fo" else 0,
+                        mtime=info.st_mtime_ns,
+                        atime=info.st_atime_ns,
+                        inode=(info.st_dev, info.st_ino),
+                        extents=extents,
+                        digest=digest,
+                        target=target,
+                    )
+    except OSError as err:
+        raise Uncacheable(f"can't scan {root}: {err}") from None
+    return entries
+
+
+def _link_groups(entries: Dict[str, Entry]) -> Dict[str, str]:
+    """
+    First path (in sorted order) of the hardlink group of every file.
+    """
+    first: Dict[Tuple[int, int], str] = {}
+    groups = {}
+    for rel in sorted(entries):
+        if entries[rel].kind == "f":
+            groups[rel] = first.setdefault(entries[rel].inode, rel)
+    return groups
+
+
+def _digest(items) -> str:
+    return hashlib.sha256(
+        json.dumps(items, sort_keys=True).encode()
+    ).hexdigest()
+
+
+def _static(rel: str, entry: Entry, groups: Dict[str, str]) -> list:
+    return [
+        rel,
+        entry.kind,
+        entry.mode,
+        entry.uid,
+        entry.gid,
+        entry.size,
+        entry.extents,
+        entry.digest,
+        entry.target,
+        groups.get(rel),
+    ]
+
+
+def tree_fingerprint(entries: Dict[str, Entry], times: bool = False) -> str:
+    """
+    Hash of the tree state `cp` may depend on. If <times> are set,
+    modification times enter it by their order: they differ from run to
+    run, and coincide by chance.
+    """
+    mtimes = sorted({x.mtime for x in entries.values()}) if times else []
+    ranks = {x: idx for idx, x in enumerate(mtimes)}
+    groups = _link_groups(entries)
+    return _digest(
+        [
+            _static(rel, entry, groups) + [ranks.get(entry.mtime)]
+            for rel, entry in sorted(entries.items())
+        ]
+    )
+
+
+def compares_times(argv: List[str]) -> bool:
+    """
+    Whether `cp` compares modification times with <argv>: -u/--update.
+    """
+    for word in argv[1:]:
+        for token in word.split():
+            if token.startswith("--update"):
+                return True
+            if token[:1] == "-" and token[1:2] != "-" and "u" in token:
+                return True
+    return False
+
+
+def _time_refs(before: Dict[str, Entry], name: str) -> Dict[int, str]:
+    """
+    First path (in sorted order) of every modification (<name> "mtime") or
+    access ("atime") time in <before>.
+    """
+    refs: Dict[int, str] = {}
+    for rel in sorted(before):
+        refs.setdefault(getattr(before[rel], name), rel)
+    return refs
+
+
+def tree_digest(entries: Dict[str, Entry]) -> str:
+    """
+    Hash of the tree after a scenario, w/o times: replay sets them
+    explicitly, and they may coincide by chance with other ones.
+    """
+    groups = _link_groups(entries)
+    return _digest(
+        [_static(rel, entry, groups) for rel, entry in sorted(entries.items())]
+    )
+
+
+def _encode(data: bytes, root: bytes) -> str:
+    return base64.b64encode(data.replace(root, ROOT.encode())).decode()
+
+
+def _decode(data: str, root: bytes) -> bytes:
+    return base64.b64decode(data).replace(ROOT.encode(), root)
+
+
+def record_delta(
+    root: Path, before: Dict[str, Entry], after: Dict[str, Entry]
+) -> dict:
+    """
+    Changes from <before> to <after> which `replay_delta` can reproduce.
+    """
+    mtimes = _time_refs(before, "mtime")
+    atimes = _time_refs(before, "atime")
+    groups = _link_groups(after)
+    removed = sorted(x for x in before if x not in after)
+    changed = []
+    recorded = 0
+    for rel in sorted(after):
+        entry = after[rel]
+        if before.get(rel) == entry:
+            continue
+        if entry.kind == "o":
+            raise Uncacheable(f"{rel} is a special file")
+        if (entry.uid, entry.gid) != (os.geteuid(), os.getegid()):
+            raise Uncacheable(f"{rel} is owned by another user")
+        item = {
+            "path": rel,
+            "kind": entry.kind,
+            "mode": stat.S_IMODE(entry.mode),
+            "mtime": mtimes.get(entry.mtime),
+            "atime": atimes.get(entry.atime),
+        }
+        if entry.kind == "l":
+            item["target"] = entry.target
+        elif entry.kind == "f" and groups[rel] != rel:
+            item["link"] = groups[rel]
+        elif entry.kind == "f":
+            recorded += sum(length for _, length in entry.extents)
+            if recorded > MAX_RECORDED:
+                raise Uncacheable("too much data written")
+            chunks = _read_extents(os.path.join(root, rel), entry.extents)
+            item["size"] = entry.size
+            old = before.get(rel)
+            item["inplace"] = old is not None and old.inode == entry.inode
+            item["extents"] = entry.extents
+            data = zlib.compress(b"".join(chunks), 1)
+            item["data"] = base64.b64encode(data).decode()
+        changed.append(item)
+    return {"removed": removed, "changed": changed}
+
+
+def _remove(path: str):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.unlink(path)
+
+
+def _write_file(path: str, item: dict):
+    """
+    Write the recorded file: over the existing inode if `cp` wrote it in
+    place, as a new one otherwise.
+    """
+    if item["inplace"]:
+        fd = os.open(path, os.O_WRONLY | os.O_TRUNC)
+    else:
+        _remove(path)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        data = memoryview(zlib.decompress(base64.b64decode(item["data"])))
+        for offset, length in item["extents"]:
+            os.pwrite(fd, data[:length], offset)
+            data = data[length:]
+        os.ftruncate(fd, item["size"])
+        os.fchmod(fd, item["mode"])
+    finally:
+        os.close(fd)
+
+
+def _set_times(path: str, item: dict, before: Dict[str, Entry]):
+    """
+    Set times of <path> taken from entries of the <before> tree, keep
+    fresh ones.
+    """
+    if item["mtime"] is None and item["atime"] is None:
+        return
+    current = os.stat(path, follow_symlinks=False)
+    atime, mtime = current.st_atime_ns, current.st_mtime_ns
+    if item["atime"] is not None:
+        atime = before[item["atime"]].atime
+    if item["mtime"] is not None:
+        mtime = before[item["mtime"]].mtime
+    os.utime(path, ns=(atime, mtime), follow_symlinks=item["kind"] != "l")
+
+
+def replay_delta(root: Path, delta: dict, before: Dict[str, Entry]):
+    """
+    Apply the <delta> recorded by `record_delta` to the tree under <root>,
+    which is in the <before> state.
+    """
+    root_bytes = os.fsencode(root)
+    touched = set()
+    for rel in sorted(delta["removed"], reverse=True):
+        _remove(os.path.join(root, rel))
+        touched.add(os.path.dirname(rel))
+    dirs = []
+    for item in delta["changed"]:
+        rel = item["path"]
+        path = os.path.join(root, rel)
+        touched.add(os.path.dirname(rel))
+        if item["kind"] == "d":
+            if not os.path.isdir(path) or os.path.islink(path):
+                _remove(path)
+                os.mkdir(path)
+            dirs.append((rel, item))
+        elif item["kind"] == "l":
+            _remove(path)
+            target = item["target"].encode()
+            os.symlink(target.replace(ROOT.encode(), root_bytes), path)
+        elif "link" in item:
+            _remove(path)
+            os.link(os.path.join(root, item["link"]), path)
+        else:
+            _write_file(path, item)
+        if "link" not in item:
+            _set_times(path, item, before)
+
+    # Directories get fresh times from the replay itself; restore ones
+    # the scenario didn't change, touch ones it did.
+    changed_dirs = {rel for rel, _ in dirs}
+    for rel in touched - changed_dirs:
+        if rel and before.get(rel) is not None:
+            entry = before[rel]
+            os.utime(os.path.join(root, rel), ns=(entry.atime, entry.mtime))
+    for rel, item in reversed(dirs):
+        path = os.path.join(root, rel)
+        os.chmod(path, item["mode"])
+        if item["mtime"] is None and rel in before:
+            current = os.stat(path).st_mtime_ns
+            if current == before[rel].mtime:
+                os.utime(path)
+        _set_times(path, item, before)
+
+
+def _outside_root(word: str) -> bool:
+    """
+    Whether an argv word (or a shell command) may refer to a path outside
+    of the root, once the root is replaced with the placeholder.
+    """
+    for token in word.split():
+        if token.startswith("-"):
+            token = token.partition("=")[2]
+        path = os.path.normpath(os.path.join(ROOT, token))
+        if token.startswith("/") or not path.startswith(ROOT):
+            return True
+    return False
+
+
+class ResultCache:
+    """
+    Results of `cp` scenarios stored as JSON files in <directory>.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, structure, argv: List[str]) -> str:
+        """
+        Key of the scenario: running <argv> in the <structure> root.
+        """
+        if structure.attr_files:
+            raise Uncacheable("files have attributes set")
+        root = str(Path(structure.root_dir).absolute())
+        words = [x.replace(root, ROOT) for x in argv]
+        if any(_outside_root(x) for x in words[1:]):
+            raise Uncacheable("paths outside of the structure root")
+        binary = shutil.which(structure.cp, path=structure.env.get("PATH"))
+        if binary is None:
+            raise Uncacheable(f"{structure.cp} is not found")
+        umask = os.umask(0)
+        os.umask(umask)
+        return _digest(
+            {
+                "version": CACHE_VERSION,
+                "cp": file_sha256(os.path.realpath(binary)),
+                "argv": words,
+                "env": {x: structure.env.get(x) for x in CP_ENV},
+                "user": [os.geteuid(), os.getegid(), umask],
+                "storage": structure.storage.name,
+            }
+        )
+
+    def call(
+        self, structure, argv: List[str], run: Callable[[], tuple]
+    ) -> tuple:
+        """
+        Result of the scenario: replayed if it is cached, otherwise the
+        one of <run>, recorded for the next time.
+        """
+        root = Path(structure.root_dir).absolute()
+        try:
+            before = scan_tree(root)
+            key = _digest(
+                [
+                    self.key(structure, argv),
+                    tree_fingerprint(before, compares_times(argv)),
+                ]
+            )
+        except Uncacheable:
+            return run()
+
+        record = self._load(key)
+        if record is not None:
+            root_bytes = os.fsencode(root)
+            replay_delta(root, record["delta"], before)
+            if tree_digest(scan_tree(root)) == record["digest"]:
+                self.hits += 1
+                return (
+                    record["returncode"],
+                    _decode(record["stdout"], root_bytes),
+                    _decode(record["stderr"], root_bytes),
+                )
+            self._path(key).unlink(missing_ok=True)
+            raise ReplayError(
+                f"Cached result of {argv} didn't replay, it is dropped: "
+                "rerun the test"
+            )
+
+        self.misses += 1
+        result = run()
+        try:
+            after = scan_tree(root)
+            delta = record_delta(root, before, after)
+        except Uncacheable:
+            return result
+        root_bytes = os.fsencode(root)
+        returncode, stdout, stderr = result
+        self._store(
+            key,
+            {
+                "returncode": returncode,
+                "stdout": _encode(stdout, root_bytes),
+                "stderr": _encode(stderr, root_bytes),
+                "delta": delta,
+                "digest": tree_digest(after),
+            },
+        )
+        return result
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _load(self, key: str) -> Optional[dict]:
+        try:
+            return json.loads(self._path(key).read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _store(self, key: str, record: dict):
+        """
+        Write the record atomically, so concurrent sessions never read a
+        partial one.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as stream:
+            json.dump(record, stream)
+        os.replace(tmp, self._path(key))
@@ -0,0 +1,191 @@
+"""
+Snapshots of a test structure, to reset it between test cases.
+
+Building a structure for every parametrized case costs the whole tree,
+while a case touches a file or two. A snapshot is a manifest of
+`(path, inode, size, mtime, mode)` records of the tree, and a stash of its
+files and symlinks aside of it. Restoring walks the tree once, compares it
+with the manifest, and rewrites only entries which differ from their
+records and removes extra ones, so it costs what the case changed.
+
+Files which no test modifies in place (`DirStructure.shared_files`) are
+stashed and restored as hardlinks, all others as copies.
+"""
+
+import os
+import stat
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, NamedTuple, Set, Union
+
+from test_linux_cp.clone import copy_file
+from test_linux_cp.teardown import remove_tree
+
+
+class Record(NamedTuple):
+    """
+    State of an entry at the relative <path>, "" for the root.
+    """
+
+    path: str
+    inode: int
+    size: int
+    mtime: int
+    mode: int
+
+
+@dataclass
+class Snapshot:
+    """
+    Manifest of the tree at <root>: records by relative path, parents
+    before children, and paths of stashed copies of files and symlinks in
+    <stash>. Names sharing an inode share the stashed copy.
+    """
+
+    root: Path
+    stash: Path
+    records: Dict[str, Record]
+    stashed: Dict[str, Path]
+    shared: Set[str]
+
+    def discard(self):
+        """
+        Remove the stash.
+        """
+        remove_tree(self.stash)
+
+
+def _record(path: str, info: os.stat_result) -> Record:
+    return Record(
+        path, info.st_ino, info.st_size, info.st_mtime_ns, info.st_mode
+    )
+
+
+def _stash_file(src: str, dst: Path, shared: bool):
+    if shared:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    copy_file(src, dst)
+
+
+def take_snapshot(
+    root: Union[str, Path],
+    stash: Union[str, Path],
+    shared: Iterable[str] = (),
+) -> Snapshot:
+    """
+    Record the tree at <root>, stashing its files and symlinks in the
+    existing directory <stash>. Files in <shared> (paths relative to
+    <root>) are stashed as hardlinks.
+    """
+    root, stash = Path(root), Path(stash)
+    shared = {os.path.normpath(x) for x in shared}
+    records = {"": _record("", os.lstat(root))}
+    stashed: Dict[str, Path] = {}
+    by_inode: Dict[int, Path] = {}
+    pending = [""]
+    while pending:
+        rel_dir = pending.pop()
+        with os.scandir(root / rel_dir) as entries:
+            for entry in entries:
+                rel = os.path.join(rel_dir, entry.name)
+                info = entry.stat(follow_symlinks=False)
+                records[rel] = _record(rel, info)
+                if stat.S_ISDIR(info.st_mode):
+                    pending.append(rel)
+                    continue
+                if info.st_ino in by_inode:
+                    stashed[rel] = by_inode[info.st_ino]
+                    continue
+                kept = stash / str(len(by_inode))
+                if stat.S_ISLNK(info.st_mode):
+                    os.symlink(os.readlink(entry.path), kept)
+                elif stat.S_ISREG(info.st_mode):
+                    _stash_file(entry.path, kept, rel in shared)
+                else:
+                    raise ValueError(f"can't snapshot special file {rel}")
+                stashed[rel] = by_inode[info.st_ino] = kept
+    return Snapshot(root, stash, records, stashed, shared)
+
+
+def _remove(path: str, info: os.stat_result):
+    if stat.S_ISDIR(info.st_mode):
+        remove_tree(path)
+    else:
+        os.unlink(path)
+
+
+def restore_snapshot(snapshot: Snapshot) -> int:
+    """
+    Bring the tree back to the <snapshot>. Returns the amount of entries
+    restored or removed.
+    """
+    root, records = snapshot.root, snapshot.records
+    changed = 0
+    # Directories, whose entries were removed or rewritten.
+    touched: Set[str] = set()
+    current: Dict[str, os.stat_result] = {"": os.lstat(root)}
+    pending = [""]
+    while pending:
+        rel_dir = pending.pop()
+        with os.scandir(root / rel_dir) as entries:
+            for entry in entries:
+                rel = os.path.join(rel_dir, entry.name)
+                info = entry.stat(follow_symlinks=False)
+                record = records.get(rel)
+                if record is None or stat.S_IFMT(record.mode) != stat.S_IFMT(
+                    info.st_mode
+                ):
+                    _remove(entry.path, info)
+                    touched.add(rel_dir)
+                    changed += 1
+                    continue
+                current[rel] = info
+                if stat.S_ISDIR(info.st_mode):
+                    pending.append(rel)
+
+    # Names of a hardlinked file left intact, to link restored names to.
+    intact: Dict[Path, str] = {}
+    for rel, kept in snapshot.stashed.items():
+        info = current.get(rel)
+        if info is not None and _record(rel, info) == records[rel]:
+            intact[kept] = rel
+
+    dirs = []
+    for rel, record in list(records.items()):
+        info = current.get(rel)
+        if info is not None and _record(rel, info) == record:
+            continue
+        changed += 1
+        path = root / rel
+        if stat.S_ISDIR(record.mode):
+            if info is None:
+                os.mkdir(path)
+            os.chmod(path, stat.S_IMODE(record.mode))
+            dirs.append(record)
+            continue
+        if info is not None:
+            os.unlink(path)
+        touched.add(os.path.dirname(rel))
+        kept = snapshot.stashed[rel]
+        if stat.S_ISLNK(record.mode):
+            os.symlink(os.readlink(kept), path)
+        elif kept in intact:
+            os.link(root / intact[kept], path)
+        else:
+            _stash_file(kept, path, rel in snapshot.shared)
+            os.chmod(path, stat.S_IMODE(record.mode))
+            intact[kept] = rel
+        times = (record.mtime, record.mtime)
+        os.utime(path, ns=times, follow_symlinks=False)
+        records[rel] = record._replace(inode=os.lstat(path).st_ino)
+
+    # Changes above touched directories, so their times go last.
+    dirs.extend(records[x] for x in sorted(touched))
+    for record in dirs:
+        times = (record.mtime, record.mtime)
+        os.utime(root / record.path, ns=times)
+    return changed
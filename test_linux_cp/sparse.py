@@ -0,0 +1,230 @@
+"""
+Sparse files with a given layout of data and holes, and inspection of the
+layout of existing files.
+
+Data extents are aligned to BLOCK_SIZE (except the end of the one reaching
+the end of file), so every filesystem allocates exactly them and `st_blocks`
+of a file written from a layout is predictable.
+"""
+
+import os
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Tuple, Union
+
+BLOCK_SIZE = 4096
+# Content of data extents is a slice of a pool of random bytes.
+_POOL_SIZE = 1 << 20
+
+
+@dataclass(frozen=True)
+class SparseLayout:
+    """
+    File of <size> bytes, which holds data only in <extents> - sorted,
+    non-overlapping `(offset, length)` pairs - and holes elsewhere.
+    """
+
+    size: int
+    extents: Tuple[Tuple[int, int], ...] = ()
+
+    def __post_init__(self):
+        end = 0
+        for offset, length in self.extents:
+            unaligned = length % BLOCK_SIZE and offset + length != self.size
+            if offset % BLOCK_SIZE or unaligned or length <= 0:
+                raise ValueError(
+                    f"Extent ({offset}, {length}) isn't aligned to "
+                    f"{BLOCK_SIZE} bytes"
+                )
+            if offset < end or offset + length > self.size:
+                raise ValueError(f"Extent ({offset}, {length}) is misplaced")
+            end = offset + length
+
+    @property
+    def data_bytes(self) -> int:
+        """
+        Bytes of data, i.e. what a hole-aware copy has to read and write.
+        """
+        return sum(length for _, length in self.extents)
+
+    @property
+    def hole_bytes(self) -> int:
+        """
+        Bytes of holes.
+        """
+        return self.size - self.data_bytes
+
+
+def _align(value: int) -> int:
+    return value // BLOCK_SIZE * BLOCK_SIZE
+
+
+def hole(size: int) -> SparseLayout:
+    """
+    A single hole.
+    """
+    return SparseLayout(size)
+
+
+def dense(size: int) -> SparseLayout:
+    """
+    No holes at all.
+    """
+    return SparseLayout(size, ((0, size),) if size else ())
+
+
+def head(size: int, data: int = 1 << 20) -> SparseLayout:
+    """
+    <data> bytes at the start, a hole after them.
+    """
+    data = _align(min(data, size))
+    return SparseLayout(size, ((0, data),) if data else ())
+
+
+def tail(size: int, data: int = 1 << 20) -> SparseLayout:
+    """
+    A hole, then <data> bytes at the end.
+    """
+    offset = _align(size - min(data, size))
+    return SparseLayout(size, ((offset, size - offset),) if size else ())
+
+
+def striped(
+    size: int, data: int = BLOCK_SIZE, period: int = 1 << 20
+) -> SparseLayout:
+    """
+    <data> bytes at the start of every <period> bytes.
+    """
+    data = _align(min(data, period))
+    return SparseLayout(
+        size,
+        tuple(
+            (offset, min(data, _align(size - offset)))
+            for offset in range(0, _align(size), period)
+        ),
+    )
+
+
+def vm_image(size: int, density: float = 0.05, seed: int = 0) -> SparseLayout:
+    """
+    Mostly holes, like a freshly installed VM disk image: a boot area at the
+    start, metadata at the end and random runs of 4 KiB..1 MiB in between,
+    <density> of the <size> in total.
+    """
+    boot = max(min(_align(size // 64), 1 << 20), BLOCK_SIZE)
+    metadata = _align(size - boot)
+    if metadata <= boot:
+        return dense(size)
+    rng = random.Random(seed)
+    extents = [(0, boot)]
+    budget = int(size * density) - 2 * boot
+    offset = boot
+    while budget > 0:
+        length = _align(rng.randint(BLOCK_SIZE, 1 << 20))
+        gap = _align(rng.randint(length, 16 * length))
+        if offset + gap + length > metadata:
+            break
+        extents.append((offset + gap, length))
+        offset += gap + length
+        budget -= length
+    extents.append((metadata, size - metadata))
+    return SparseLayout(size, tuple(extents))
+
+
+LAYOUTS = {
+    "hole": hole,
+    "dense": dense,
+    "head": head,
+    "tail": tail,
+    "striped": striped,
+    "vm-image": vm_image,
+}
+
+
+def make_layout(name: str, size: int) -> SparseLayout:
+    """
+    Layout of <size> bytes by its name in LAYOUTS, with default parameters.
+    """
+    try:
+        return LAYOUTS[name](size)
+    except KeyError:
+        raise ValueError(
+            f"Unknown layout '{name}', choose from {sorted(LAYOUTS)}"
+        ) from None
+
+
+def write_sparse_file(
+    path: Union[str, Path],
+    layout: SparseLayout,
+    seed: int = 0,
+    materialize: bool = False,
+):
+    """
+    Write a file of the <layout> with seeded random data. If <materialize>
+    is set, holes are written out as zeros: the content is the same, but
+    nothing is left sparse.
+    """
+    pool = memoryview(random.Random(seed).randbytes(_POOL_SIZE))
+    zeros = memoryview(bytes(_POOL_SIZE))
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        pos = 0
+        for offset, length in layout.extents:
+            if materialize:
+                _pwrite_all(fd, zeros, pos, offset - pos)
+            _pwrite_all(fd, pool, offset, length)
+            pos = offset + length
+        if materialize:
+            _pwrite_all(fd, zeros, pos, layout.size - pos)
+        os.ftruncate(fd, layout.size)
+    finally:
+        os.close(fd)
+
+
+def _pwrite_all(fd: int, content: memoryview, offset: int, length: int):
+    end = offset + length
+    while offset < end:
+        chunk = content[: min(len(content), end - offset)]
+        offset += os.pwrite(fd, chunk, offset)
+
+
+def data_extents(path: Union[str, Path]) -> List[Tuple[int, int]]:
+    """
+    Data extents of an existing file, as reported by SEEK_DATA/SEEK_HOLE.
+    Filesystems w/o hole support report the whole file as data.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        size = os.fstat(fd).st_size
+        extents = []
+        offset = 0
+        while offset < size:
+            try:
+                start = os.lseek(fd, offset, os.SEEK_DATA)
+            except OSError:  # ENXIO: only a hole is left
+                break
+            end = os.lseek(fd, start, os.SEEK_HOLE)
+            extents.append((start, end - start))
+            offset = end
+        return extents
+    finally:
+        os.close(fd)
+
+
+def allocated_bytes(path: Union[str, Path]) -> int:
+    """
+    Bytes the filesystem allocated for the file.
+    """
+    return os.stat(path, follow_symlinks=False).st_blocks * 512
+
+
+def sparse_report(path: Union[str, Path]) -> Dict[str, int]:
+    """
+    Apparent size, allocated and data bytes of the file.
+    """
+    return {
+        "size": os.stat(path).st_size,
+        "allocated": allocated_bytes(path),
+        "data": sum(length for _, length in data_extents(path)),
+    }
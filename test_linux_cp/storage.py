@@ -0,0 +1,123 @@
+"""
+Storage backends for DirStructure roots.
+
+    tmp        the system temp dir, or the root given by the caller (pytest's
+               tmp_path)
+    shm        tmpfs at /dev/shm: no disk latency, for fast functional runs
+    disk       regular disk (/var/tmp), page cache left warm
+    disk-cold  regular disk, file pages evicted from the page cache before
+               every measured copy, for reproducible cold-cache numbers
+"""
+
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional, Type, Union
+
+
+def evict_file(path: Union[str, Path]):
+    """
+    Drop cached pages of the file. Dirty pages are written out first, as
+    POSIX_FADV_DONTNEED drops only clean ones.
+    """
+    fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def evict_tree(root: Union[str, Path]):
+    """
+    Drop cached pages of all regular files under <root>.
+
+    Cached directory entries and inodes stay, there is no per-file way to
+    drop them.
+    """
+    pending = [os.fspath(root)]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    evict_file(entry.path)
+
+
+class Storage:
+    """
+    Backend placing roots in the system temp dir, or in the root given by
+    the caller.
+    """
+
+    name = "tmp"
+    default_base: Optional[Path] = None
+
+    def __init__(self, base: Optional[Path] = None):
+        self.base = base if base is not None else self.default_base
+
+    def make_root(
+        self, default: Optional[Path] = None, prefix: str = "cp-"
+    ) -> Path:
+        """
+        Create an empty directory for a structure. <default> is used as is,
+        if the backend has no place of its own.
+        """
+        if self.base is None and default is not None:
+            return default
+        if self.base is not None:
+            os.makedirs(self.base, exist_ok=True)
+        return Path(tempfile.mkdtemp(prefix=prefix, dir=self.base))
+
+    def before_copy(self, root: Path):
+        """
+        Hook called right before every measured copy in the <root>.
+        """
+
+
+class TmpfsStorage(Storage):
+    """
+    Backend placing roots in the memory-backed /dev/shm.
+    """
+
+    name = "shm"
+    default_base = Path("/dev/shm")
+
+
+class DiskStorage(Storage):
+    """
+    Backend placing roots on a regular disk.
+    """
+
+    name = "disk"
+    default_base = Path("/var/tmp")
+
+
+class ColdDiskStorage(DiskStorage):
+    """
+    Disk backend, which evicts files of the root from the page cache before
+    every measured copy.
+    """
+
+    name = "disk-cold"
+
+    def before_copy(self, root: Path):
+        evict_tree(root)
+
+
+STORAGES: Dict[str, Type[Storage]] = {
+    x.name: x for x in (Storage, TmpfsStorage, DiskStorage, ColdDiskStorage)
+}
+
+
+def get_storage(name: str, base: Optional[Path] = None) -> Storage:
+    """
+    Backend by its name.
+    """
+    try:
+        return STORAGES[name](base)
+    except KeyError:
+        raise ValueError(
+            f"Unknown storage '{name}', choose from {sorted(STORAGES)}"
+        ) from None
@@ -0,0 +1,400 @@
+"""
+Streaming capture of `cp -v` output.
+
+`cp -v` reports every file it handles with a line like
+
+    'src' -> 'dst'
+    'src' -> 'dst' (backup: 'dst~')
+    removed 'dst'
+    created directory 'dst'
+    skipped 'dst'
+
+and errors on stderr as `cp: <message>`. Names are quoted in the shell
+style: '...', "..." and $'...' parts, so a name never spans lines.
+
+`CopyStream` reads both pipes while `cp` runs and turns every line into a
+`CopyEvent` as soon as it is complete. Only a bounded tail of the raw output
+is retained, so a copy of millions of files can be checked event by event
+in constant memory. `CopyIndex` collects the events to look up later.
+"""
+
+import collections
+import os
+import selectors
+import subprocess
+from dataclasses import dataclass
+from typing import (
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from test_linux_cp.process import Watchdog
+
+# Raw output retained by a stream, bytes per pipe.
+RAW_LIMIT = 1 << 20
+_READ_SIZE = 65536
+_OCT_DIGITS = b"01234567"
+_HEX_DIGITS = b"0123456789abcdefABCDEF"
+_C_ESCAPES = {
+    ord("a"): 7,
+    ord("b"): 8,
+    ord("t"): 9,
+    ord("n"): 10,
+    ord("v"): 11,
+    ord("f"): 12,
+    ord("r"): 13,
+    ord("e"): 27,
+}
+
+
+@dataclass(frozen=True)
+class CopyEvent:
+    """
+    A line of `cp` output.
+
+    <kind> is "copy", "remove", "mkdir", "skip", "error" (stderr) or
+    "unknown". <src> and <dst> are names as `cp` reported them, <backup> is
+    the name of the backup made, <message> is the text of an error.
+    """
+
+    kind: str
+    src: Optional[str] = None
+    dst: Optional[str] = None
+    backup: Optional[str] = None
+    message: Optional[str] = None
+
+
+def _parse_word(
+    line: bytes, pos: int, stop: bytes = b" "
+) -> Tuple[Optional[str], int]:
+    """
+    Shell-quoted word of <line> starting at <pos> and ending before any
+    unquoted byte of <stop>: its value and the position after it, or None
+    if there is no word.
+    """
+    value = bytearray()
+    start = pos
+    while pos < len(line) and line[pos] not in stop:
+        char = line[pos]
+        if char == ord("'"):
+            end = line.find(b"'", pos + 1)
+            if end < 0:
+                return None, start
+            value += line[pos + 1 : end]
+            pos = end + 1
+        elif char == ord('"'):
+            pos += 1
+            while pos < len(line) and line[pos] != ord('"'):
+                if line[pos] == ord("\\") and pos + 1 < len(line):
+                    pos += 1
+                value.append(line[pos])
+                pos += 1
+            if pos >= len(line):
+                return None, start
+            pos += 1
+        elif line.startswith(b"$'", pos):
+            pos = _parse_c_string(line, pos + 2, value)
+            if pos < 0:
+                return None, start
+        elif char == ord("\\") and pos + 1 < len(line):
+            # An escaped quote between quoted parts, as in 'it'\''s'.
+            value.append(line[pos + 1])
+            pos += 2
+        else:
+            value.append(char)
+            pos += 1
+    if pos == start:
+        return None, start
+    return os.fsdecode(bytes(value)), pos
+
+
+def _parse_c_string(line: bytes, pos: int, value: bytearray) -> int:
+    """
+    Append the value of a $'...' string, which starts at <pos> right after
+    the opening quote, to <value>. Return the position after the closing
+    quote, -1 if there is none.
+    """
+    while pos < len(line):
+        char = line[pos]
+        if char == ord("'"):
+            return pos + 1
+        if char != ord("\\") or pos + 1 == len(line):
+            value.append(char)
+            pos += 1
+            continue
+        char = line[pos + 1]
+        if char in _OCT_DIGITS:
+            end = _digits_end(line, pos + 1, 3, _OCT_DIGITS)
+            value.append(int(line[pos + 1 : end], 8) & 0xFF)
+            pos = end
+        elif char == ord("x"):
+            end = _digits_end(line, pos + 2, 2, _HEX_DIGITS)
+            value.append(int(line[pos + 2 : end] or b"0", 16))
+            pos = end
+        else:
+            value.append(_C_ESCAPES.get(char, char))
+            pos += 2
+    return -1
+
+
+def _digits_end(line: bytes, pos: int, limit: int, digits: bytes) -> int:
+    end = pos
+    while end < min(pos + limit, len(line)) and line[end] in digits:
+        end += 1
+    return end
+
+
+def parse_line(line: bytes) -> CopyEvent:
+    """
+    Event of a line of `cp -v` stdout, w/o the line break.
+    """
+    for prefix, kind in (
+        (b"removed ", "remove"),
+        (b"created directory ", "mkdir"),
+        (b"skipped ", "skip"),
+    ):
+        if line.startswith(prefix):
+            name, pos = _parse_word(line, len(prefix))
+            if name is not None and pos == len(line):
+                return CopyEvent(kind, dst=name)
+
+    src, pos = _parse_word(line, 0)
+    if src is not None and line.startswith(b" -> ", pos):
+        dst, pos = _parse_word(line, pos + 4)
+        backup = None
+        if dst is not None and line.startswith(b" (backup: ", pos):
+            backup, pos = _parse_word(line, pos + 10, stop=b" )")
+            pos = pos + 1 if line.startswith(b")", pos) else -1
+        if dst is not None and pos == len(line):
+            return CopyEvent("copy", src=src, dst=dst, backup=backup)
+    return CopyEvent("unknown", message=os.fsdecode(line))
+
+
+def parse_error(line: bytes) -> CopyEvent:
+    """
+    Event of a line of `cp` stderr. <dst> is the first quoted name in it.
+    """
+    message = line.partition(b": ")[2] if line.startswith(b"cp: ") else line
+    name = None
+    starts = [x for x in (message.find(b"'"), message.find(b'"')) if x >= 0]
+    if starts:
+        pos = min(starts)
+        name, _ = _parse_word(message, pos, stop=b" :")
+    return CopyEvent("error", dst=name, message=os.fsdecode(message))
+
+
+class _Tail:
+    """
+    Last <limit> bytes of a stream, kept as whole lines where possible.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.lines: Deque[bytes] = collections.deque()
+        self.size = 0
+        self.dropped = 0
+
+    def add(self, line: bytes):
+        """
+        Append the <line>, dropping the oldest ones over the limit.
+        """
+        self.lines.append(line)
+        self.size += len(line)
+        while self.size > self.limit and self.lines:
+            dropped = self.lines.popleft()
+            self.size -= len(dropped)
+            self.dropped += len(dropped)
+
+    def value(self) -> bytes:
+        """
+        Retained bytes.
+        """
+        return b"".join(self.lines)
+
+
+class CopyStream:
+    """
+    Running `cp` whose output is consumed as events.
+
+    Iterate it to get CopyEvents of stdout and stderr lines as they come;
+    it can be iterated only once. `cp` starts with the iteration, and is
+    killed if the iteration is abandoned; <returncode> is set when it is
+    over. Use it as a context manager, so the process is killed also when
+    the iterator is kept alive.
+
+    `cp` is killed past the <timeout>, or once it makes no progress for
+    <stall> seconds, see `process.Watchdog`.
+    """
+
+    def __init__(
+        self,
+        argv,
+        cwd=None,
+        env=None,
+        timeout: Optional[float] = 10,
+        raw_limit: int = RAW_LIMIT,
+        stall: Optional[float] = None,
+    ):
+        self.argv = argv
+        self.cwd = cwd
+        self.env = env
+        self.timeout = timeout
+        self.stall = stall
+        self.returncode: Optional[int] = None
+        self.counts: collections.Counter = collections.Counter()
+        self._stdout = _Tail(raw_limit)
+        self._stderr = _Tail(raw_limit)
+        self._proc: Optional[subprocess.Popen] = None
+        self._watchdog: Optional[Watchdog] = None
+        self._started = False
+
+    @property
+    def stdout(self) -> bytes:
+        """
+        Retained tail of stdout.
+        """
+        return self._stdout.value()
+
+    @property
+    def stderr(self) -> bytes:
+        """
+        Retained tail of stderr.
+        """
+        return self._stderr.value()
+
+    @property
+    def truncated(self) -> bool:
+        """
+        Whether any raw output was dropped from the retained tails.
+        """
+        return bool(self._stdout.dropped or self._stderr.dropped)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Kill `cp`, if it still runs, and release the pipes.
+        """
+        if self._proc is None:
+            return
+        if self._proc.poll() is None:
+            self._proc.kill()
+        self._proc.wait()
+        self._proc.stdout.close()
+        self._proc.stderr.close()
+        if self.returncode is None:
+            self.returncode = self._proc.returncode
+
+    def wait(self) -> int:
+        """
+        Consume the rest of events and return the exit code.
+        """
+        for _ in self:
+            pass
+        return self.returncode
+
+    def __iter__(self) -> Iterator[CopyEvent]:
+        if self._started:
+            raise RuntimeError("CopyStream can be iterated only once")
+        self._started = True
+        with subprocess.Popen(
+            self.argv,
+            cwd=self.cwd,
+            env=self.env,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        ) as self._proc:
+            self._watchdog = Watchdog(
+                self.argv, self._proc.pid, self.timeout, self.stall
+            )
+            try:
+                yield from self._events()
+                while self.returncode is None:
+                    wait = self._remaining()
+                    try:
+                        self.returncode = self._proc.wait(wait)
+                    except subprocess.TimeoutExpired:
+                        pass
+            finally:
+                self.close()
+
+    def _events(self) -> Iterator[CopyEvent]:
+        """
+        Events of output lines, until both pipes are closed.
+        """
+        pipes = {
+            self._proc.stdout: (self._stdout, parse_line),
+            self._proc.stderr: (self._stderr, parse_error),
+        }
+        partial = {pipe: b"" for pipe in pipes}
+        with selectors.DefaultSelector() as selector:
+            for pipe in pipes:
+                selector.register(pipe, selectors.EVENT_READ)
+            while selector.get_map():
+                for key, _ in selector.select(self._remaining()):
+                    tail, parse = pipes[key.fileobj]
+                    data = os.read(key.fd, _READ_SIZE)
+                    if not data:
+                        selector.unregister(key.fileobj)
+                        data = b"\n" if partial[key.fileobj] else b""
+                    lines = (partial[key.fileobj] + data).split(b"\n")
+                    partial[key.fileobj] = lines.pop()
+                    for line in lines:
+                        tail.add(line + b"\n")
+                        event = parse(line)
+                        self.counts[event.kind] += 1
+                        yield event
+
+    def _remaining(self) -> Optional[float]:
+        try:
+            return self._watchdog.wait_time()
+        except subprocess.TimeoutExpired:
+            self.close()
+            raise
+
+
+class CopyIndex:
+    """
+    Events of a stream, indexed by destination name.
+
+    Only events accepted by <keep> are indexed, so memory is bounded by
+    what the caller is going to look up; errors are always kept, and every
+    event is counted.
+    """
+
+    def __init__(self, keep: Optional[Callable[[CopyEvent], bool]] = None):
+        self.keep = keep
+        self.counts: collections.Counter = collections.Counter()
+        self.by_dst: Dict[str, CopyEvent] = {}
+        self.errors: List[CopyEvent] = []
+
+    def feed(self, events: Iterable[CopyEvent]) -> "CopyIndex":
+        """
+        Consume <events>.
+        """
+        for event in events:
+            self.counts[event.kind] += 1
+            if event.kind == "error":
+                self.errors.append(event)
+            elif event.dst is not None and (
+                self.keep is None or self.keep(event)
+            ):
+                self.by_dst[event.dst] = event
+        return self
+
+    def __contains__(self, dst: str) -> bool:
+        return dst in self.by_dst
+
+    def __getitem__(self, dst: str) -> CopyEvent:
+        return self.by_dst[dst]
@@ -0,0 +1,149 @@
+"""
+Fast removal of directory trees.
+
+The tree is walked with `os.scandir` on directory descriptors, holding only
+the descriptor of the current directory, so trees of any depth are removed
+w/o hitting PATH_MAX or the limit of open files. Permissions are fixed only
+where a removal actually fails, and never outside of the tree.
+
+A tree may also be renamed to a trash directory next to it and removed by a
+background thread, so the caller doesn't wait for it.
+"""
+
+import atexit
+import errno
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import List, Union
+
+_DIR_FLAGS = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW
+_RETRY_ERRNOS = {errno.EACCES, errno.EPERM}
+
+_removals: List[threading.Thread] = []
+_removal_errors: List[BaseException] = []
+_lock = threading.Lock()
+
+
+def remove_tree(path: Union[str, Path]):
+    """
+    Remove the directory tree at <path>, if it exists.
+    """
+    try:
+        fd = _open_dir(path)
+    except FileNotFoundError:
+        return
+
+    names = []  # path of the current directory relative to the root
+    todo = [_purge(fd)]  # subdirectories left to remove, per level
+    try:
+        while todo:
+            if todo[-1]:
+                name = todo[-1].pop()
+                child = _open_dir(name, dir_fd=fd)
+                os.close(fd)
+                fd = child
+                names.append(name)
+                todo.append(_purge(fd))
+                continue
+            todo.pop()
+            if not names:
+                break
+            parent = os.open("..", _DIR_FLAGS, dir_fd=fd)
+            os.close(fd)
+            fd = parent
+            _retry(os.rmdir, names.pop(), fd, dir_fd=fd)
+    finally:
+        os.close(fd)
+    # Its parent isn't part of the tree, so its permissions are left alone.
+    os.rmdir(path)
+
+
+def remove_tree_in_background(path: Union[str, Path]):
+    """
+    Move the tree at <path> out of the way at once and remove it in a
+    background thread. See `wait_for_removals`.
+    """
+    path = Path(path)
+    trash = path.parent / f".trash-{path.name}-{uuid.uuid4().hex[:8]}"
+    try:
+        path.rename(trash)
+    except FileNotFoundError:
+        return
+
+    def remove():
+        try:
+            remove_tree(trash)
+        except OSError as err:
+            with _lock:
+                _removal_errors.append(err)
+
+    thread = threading.Thread(target=remove, name=f"rm {trash}", daemon=True)
+    with _lock:
+        _removals.append(thread)
+    thread.start()
+
+
+def wait_for_removals():
+    """
+    Wait until all background removals are finished. Raise the first error
+    any of them met.
+    """
+    with _lock:
+        threads = list(_removals)
+        _removals.clear()
+    for thread in threads:
+        thread.join()
+    with _lock:
+        errors = list(_removal_errors)
+        _removal_errors.clear()
+    if errors:
+        raise errors[0]
+
+
+def _open_dir(path, dir_fd=None) -> int:
+    try:
+        return os.open(path, _DIR_FLAGS, dir_fd=dir_fd)
+    except PermissionError:
+        os.chmod(path, 0o700, dir_fd=dir_fd, follow_symlinks=False)
+        return os.open(path, _DIR_FLAGS, dir_fd=dir_fd)
+
+
+def _retry(func, name, fd, **kwargs):
+    """
+    Call <func> on <name>; if it's denied, make the directory <fd> of the
+    tree writable and try again.
+    """
+    try:
+        func(name, **kwargs)
+    except OSError as err:
+        if err.errno not in _RETRY_ERRNOS:
+            raise
+        os.chmod(fd, 0o700)
+        func(name, **kwargs)
+
+
+def _purge(fd: int) -> List[str]:
+    """
+    Remove all non-directory entries of the directory <fd>, return names of
+    its subdirectories.
+    """
+    subdirs = []
+    with os.scandir(fd) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+            else:
+                _retry(os.unlink, entry.name, fd, dir_fd=fd)
+    return subdirs
+
+
+def _wait_at_exit():
+    try:
+        wait_for_removals()
+    except OSError:
+        pass
+
+
+atexit.register(_wait_at_exit)
@@ -0,0 +1,158 @@
+"""
+Timeouts of `cp` calls sized to the work they do.
+
+A fixed timeout is either far too long for a tiny copy, whose hang then
+wastes the whole of it, or too short for a GiB one. Here the timeout is the
+time the copy is expected to take at the throughput of the storage, with
+a generous slack, but never below `MIN_TIMEOUT`.
+
+The throughput of a storage is measured once per filesystem by copying a
+file and a directory of small files with `cp` itself, in a scratch
+directory of the storage. Sources are evicted from the page cache and
+copies flushed to the storage within the measured time, so the baseline
+doesn't take the speed of the cache for the one of the disk.
+"""
+
+import os
+import stat
+import subprocess
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+from test_linux_cp.storage import Storage, evict_tree
+from test_linux_cp.teardown import remove_tree
+
+# Marker of a timeout derived from the work of the call.
+AUTO = "auto"
+# Seconds any call may take: start of `cp` on a loaded machine. A hang is
+# caught sooner by the stall watchdog, see `process.Watchdog`.
+MIN_TIMEOUT = 30.0
+# Multiple of the expected time a call may take.
+SAFETY = 10.0
+# Work of the baseline copies.
+BASELINE_BYTES = 8 << 20
+BASELINE_FILES = 256
+
+_baselines: Dict[Tuple[str, int], "Baseline"] = {}
+
+
+@dataclass(frozen=True)
+class Baseline:
+    """
+    Throughput of `cp` on a storage: bytes of file data and entries
+    copied per second.
+    """
+
+    bytes_per_s: float
+    files_per_s: float
+
+    def expected(self, nbytes: int, files: int) -> float:
+        """
+        Seconds a copy of <nbytes> in <files> entries is expected to take.
+        """
+        return nbytes / self.bytes_per_s + files / self.files_per_s
+
+
+def _flush_tree(root: Path):
+    """
+    Write out data and entries of the tree at <root> to the storage.
+    """
+    for path in [root, *root.rglob("*")]:
+        fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _timed_cp(argv, work: Path, storage: Storage) -> float:
+    """
+    Seconds `cp` <argv> takes in <work> from cold sources to a copy flushed
+    to the storage, named by the last word of <argv>.
+    """
+    evict_tree(work)
+    storage.before_copy(work)
+    start = time.perf_counter()
+    subprocess.run(argv, cwd=work, check=True, capture_output=True)
+    _flush_tree(work / argv[-1])
+    return max(time.perf_counter() - start, 1e-6)
+
+
+def measure_baseline(storage: Optional[Storage] = None) -> Baseline:
+    """
+    Measure the throughput of `cp` in a scratch directory of the <storage>,
+    removed afterwards.
+    """
+    storage = storage if storage is not None else Storage()
+    work = storage.make_root(prefix="cp-baseline-")
+    try:
+        (work / "files").mkdir()
+        with open(work / "data", "wb") as stream:
+            stream.write(os.urandom(BASELINE_BYTES))
+        for idx in range(BASELINE_FILES):
+            (work / "files" / str(idx)).touch()
+        data_time = _timed_cp(["cp", "data", "data.copy"], work, storage)
+        files_time = _timed_cp(["cp", "-r", "files", "copy"], work, storage)
+    finally:
+        remove_tree(work)
+    return Baseline(BASELINE_BYTES / data_time, BASELINE_FILES / files_time)
+
+
+def storage_baseline(
+    storage: Storage, directory: Union[str, Path]
+) -> Baseline:
+    """
+    Throughput of `cp` on the <storage> used for <directory>, measured once
+    per backend and filesystem.
+    """
+    key = (storage.name, os.stat(directory).st_dev)
+    if key not in _baselines:
+        _baselines[key] = measure_baseline(storage)
+    return _baselines[key]
+
+
+def adaptive_timeout(
+    nbytes: int,
+    files: int,
+    baseline: Baseline,
+    safety: float = SAFETY,
+    minimum: float = MIN_TIMEOUT,
+) -> float:
+    """
+    Timeout of a copy of <nbytes> in <files> entries.
+    """
+    return max(minimum, safety * baseline.expected(nbytes, files))
+
+
+def source_size(
+    paths: Iterable[Union[str, Path]], skip: Iterable[Union[str, Path]] = ()
+) -> Tuple[int, int]:
+    """
+    Bytes of regular files and amount of entries under <paths>, except for
+    trees at <skip>, whose sizes the caller knows. Symlinks are followed
+    only for <paths> themselves, as `cp` does by default. Missing paths
+    count as nothing.
+    """
+    nbytes, files = 0, 0
+    skipped = {os.fspath(x) for x in skip}
+    pending = [(os.fspath(x), True) for x in paths]
+    while pending:
+        path, follow = pending.pop()
+        if path in skipped:
+            continue
+        try:
+            info = os.stat(path, follow_symlinks=follow)
+        except OSError:
+            continue
+        files += 1
+        if stat.S_ISDIR(info.st_mode):
+            try:
+                with os.scandir(path) as entries:
+                    pending.extend((x.path, False) for x in entries)
+            except OSError:
+                pass
+        else:
+            nbytes += info.st_size
+    return nbytes, files
@@ -0,0 +1,337 @@
+"""
+Comparison of a copied directory tree with its source.
+
+Both trees are walked side by side with `os.scandir`. Entries present in
+both are compared attribute by attribute, and regular files of the same size
+by content hash. Hashing runs in a process pool once there are enough files,
+and hashes of source files are cached by `(device, inode, mtime, size)`, so
+repeated comparisons against the same source tree hash only the copies.
+Files with several names are grouped by inode in both trees, and the groups
+are compared to verify the hardlink topology.
+"""
+
+import functools
+import hashlib
+import multiprocessing
+import os
+import stat
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+ALL_CHECKS = (
+    "type",
+    "size",
+    "mode",
+    "owner",
+    "mtime",
+    "xattrs",
+    "link",
+    "hardlinks",
+    "content",
+)
+# Checks which hold for a plain recursive copy (`cp -r`).
+CONTENT_CHECKS = ("type", "size", "link", "content")
+
+# Hashing goes to a process pool only if there are more files than that.
+POOL_THRESHOLD = 256
+_HASH_CHUNK = 1 << 20
+
+_TYPE_NAMES = {
+    stat.S_IFREG: "file",
+    stat.S_IFDIR: "directory",
+    stat.S_IFLNK: "symlink",
+    stat.S_IFIFO: "fifo",
+    stat.S_IFSOCK: "socket",
+    stat.S_IFCHR: "character device",
+    stat.S_IFBLK: "block device",
+}
+
+
+@dataclass(frozen=True)
+class Difference:
+    """
+    Mismatch of the <check> between entries at the relative <path>.
+
+    <check> is one of ALL_CHECKS, or "missing"/"extra" for entries present
+    only in the source/destination tree.
+    """
+
+    path: str
+    check: str
+    src: object = None
+    dst: object = None
+
+
+class HashCache:
+    """
+    Content hashes of files keyed by `(device, inode, mtime_ns, size)`.
+    """
+
+    def __init__(self):
+        self._hashes: Dict[Tuple[int, int, int, int], str] = {}
+
+    @staticmethod
+    def key(st: os.stat_result) -> Tuple[int, int, int, int]:
+        """
+        Cache key of a file with stat result <st>.
+        """
+        return (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def get(self, st: os.stat_result) -> Optional[str]:
+        """
+        Cached hash of the file, if any.
+        """
+        return self._hashes.get(self.key(st))
+
+    def put(self, st: os.stat_result, digest: str):
+        """
+        Remember hash of the file.
+        """
+        self._hashes[self.key(st)] = digest
+
+    def clear(self):
+        """
+        Forget all hashes.
+        """
+        self._hashes.clear()
+
+
+# Cache of source file hashes shared by all comparisons of the process.
+SOURCE_HASHES = HashCache()
+
+
+def hash_file(path: Union[str, Path]) -> str:
+    """
+    Hash of the file content.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb", buffering=0) as stream:
+        for chunk in iter(lambda: stream.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def file_sha256(path: str) -> str:
+    """
+    SHA-256 of the file content, cached per path for the process lifetime,
+    e.g. to identify the `cp` binary.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for chunk in iter(lambda: stream.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_files(paths: Sequence[str], workers: Optional[int] = None) -> list:
+    """
+    Hashes of <paths>, computed in a process pool if there are many.
+    """
+    if len(paths) <= POOL_THRESHOLD or workers == 1:
+        return [hash_file(x) for x in paths]
+    workers = workers or os.cpu_count() or 1
+    # Background removals may run in threads, whose locks a forked child
+    # would inherit held forever, so workers start from a fork server.
+    context = multiprocessing.get_context("forkserver")
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=context
+    ) as executor:
+        chunksize = max(1, len(paths) // (workers * 4))
+        return list(executor.map(hash_file, paths, chunksize=chunksize))
+
+
+def _xattrs(path: str) -> Dict[str, bytes]:
+    try:
+        names = os.listxattr(path, follow_symlinks=False)
+    except OSError:
+        return {}
+    return {
+        x: os.getxattr(path, x, follow_symlinks=False) for x in sorted(names)
+    }
+
+
+def _compare_entries(
+    rel: str,
+    src: str,
+    dst: str,
+    src_st: os.stat_result,
+    dst_st: os.stat_result,
+    checks: Iterable[str],
+) -> List[Difference]:
+    """
+    Compare attributes of two entries of the same type, except content.
+    """
+    diffs = []
+    is_dir = stat.S_ISDIR(src_st.st_mode)
+    if "size" in checks and not is_dir and src_st.st_size != dst_st.st_size:
+        diffs.append(Difference(rel, "size", src_st.st_size, dst_st.st_size))
+    if "mode" in checks:
+        src_mode, dst_mode = (
+            stat.S_IMODE(x.st_mode) for x in (src_st, dst_st)
+        )
+        if src_mode != dst_mode:
+            diffs.append(Difference(rel, "mode", oct(src_mode), oct(dst_mode)))
+    if "owner" in checks:
+        src_owner = (src_st.st_uid, src_st.st_gid)
+        dst_owner = (dst_st.st_uid, dst_st.st_gid)
+        if src_owner != dst_owner:
+            diffs.append(Difference(rel, "owner", src_owner, dst_owner))
+    if "mtime" in checks and src_st.st_mtime_ns != dst_st.st_mtime_ns:
+        diffs.append(
+            Difference(rel, "mtime", src_st.st_mtime_ns, dst_st.st_mtime_ns)
+        )
+    if "xattrs" in checks:
+        src_xattrs, dst_xattrs = _xattrs(src), _xattrs(dst)
+        if src_xattrs != dst_xattrs:
+            diffs.append(Difference(rel, "xattrs", src_xattrs, dst_xattrs))
+    if "link" in checks and stat.S_ISLNK(src_st.st_mode):
+        src_link, dst_link = os.readlink(src), os.readlink(dst)
+        if src_link != dst_link:
+            diffs.append(Difference(rel, "link", src_link, dst_link))
+    return diffs
+
+
+def diff_trees(
+    src: Union[str, Path],
+    dst: Union[str, Path],
+    checks: Iterable[str] = ALL_CHECKS,
+    cache: Optional[HashCache] = SOURCE_HASHES,
+    workers: Optional[int] = None,
+) -> List[Difference]:
+    """
+    Differences of the <dst> tree from the <src> one, empty if <dst> is an
+    exact copy in terms of <checks>.
+
+    Roots are compared as well, with the relative path ".". Source hashes
+    are kept in <cache>; pass None to hash everything anew.
+    """
+    checks = frozenset(checks)
+    unknown = checks - set(ALL_CHECKS)
+    if unknown:
+        raise ValueError(f"Unknown checks: {sorted(unknown)}")
+
+    diffs = []
+    to_hash = []  # (relative path, src path, dst path, src stat)
+    # Relative paths of files with several names, per inode.
+    src_inodes: Dict[Tuple[int, int], List[str]] = defaultdict(list)
+    dst_inodes: Dict[Tuple[int, int], List[str]] = defaultdict(list)
+    src_root, dst_root = os.fspath(src), os.fspath(dst)
+    pending = [
+        (
+            ".",
+            src_root,
+            dst_root,
+            os.lstat(src_root),
+            os.lstat(dst_root),
+        )
+    ]
+    while pending:
+        rel, src_path, dst_path, src_st, dst_st = pending.pop()
+        src_type = stat.S_IFMT(src_st.st_mode)
+        dst_type = stat.S_IFMT(dst_st.st_mode)
+        if src_type != dst_type:
+            if "type" in checks:
+                diffs.append(
+                    Difference(
+                        rel,
+                        "type",
+                        _TYPE_NAMES.get(src_type),
+                        _TYPE_NAMES.get(dst_type),
+                    )
+                )
+            continue
+        diffs.extend(
+            _compare_entries(rel, src_path, dst_path, src_st, dst_st, checks)
+        )
+        if (
+            "content" in checks
+            and src_type == stat.S_IFREG
+            and src_st.st_size == dst_st.st_size
+        ):
+            to_hash.append((rel, src_path, dst_path, src_st))
+        if "hardlinks" in checks and src_type == stat.S_IFREG:
+            for st, inodes in ((src_st, src_inodes), (dst_st, dst_inodes)):
+                if st.st_nlink > 1:
+                    inodes[(st.st_dev, st.st_ino)].append(rel)
+        if src_type != stat.S_IFDIR:
+            continue
+
+        with os.scandir(src_path) as entries:
+            src_entries = {x.name: x for x in entries}
+        with os.scandir(dst_path) as entries:
+            dst_entries = {x.name: x for x in entries}
+        for name in sorted(src_entries.keys() - dst_entries.keys()):
+            diffs.append(Difference(_join(rel, name), "missing"))
+        for name in sorted(dst_entries.keys() - src_entries.keys()):
+            diffs.append(Difference(_join(rel, name), "extra"))
+        for name in src_entries.keys() & dst_entries.keys():
+            pending.append(
+                (
+                    _join(rel, name),
+                    src_entries[name].path,
+                    dst_entries[name].path,
+                    src_entries[name].stat(follow_symlinks=False),
+                    dst_entries[name].stat(follow_symlinks=False),
+                )
+            )
+
+    diffs.extend(_diff_content(to_hash, cache, workers))
+    diffs.extend(_diff_link_groups(src_inodes, dst_inodes))
+    return sorted(diffs, key=lambda x: (x.path, x.check))
+
+
+def _join(rel: str, name: str) -> str:
+    return name if rel == "." else os.path.join(rel, name)
+
+
+def _diff_link_groups(src_inodes: dict, dst_inodes: dict) -> list:
+    """
+    Compare groups of names sharing an inode within each tree. A file w/o
+    other names in its tree is a group of its own.
+    """
+    for inodes in (src_inodes, dst_inodes):
+        for group in inodes.values():
+            group.sort()
+    src_groups, dst_groups = (
+        {x: group for group in inodes.values() for x in group}
+        for inodes in (src_inodes, dst_inodes)
+    )
+    diffs = []
+    for rel in sorted(src_groups.keys() | dst_groups.keys()):
+        src_group = src_groups.get(rel, [rel])
+        dst_group = dst_groups.get(rel, [rel])
+        if src_group != dst_group:
+            diffs.append(Difference(rel, "hardlinks", src_group, dst_group))
+    return diffs
+
+
+def _diff_content(to_hash, cache: Optional[HashCache], workers) -> list:
+    """
+    Compare content hashes of file pairs, hashing what is not cached.
+    """
+    src_hashes = [
+        cache.get(src_st) if cache is not None else None
+        for _, _, _, src_st in to_hash
+    ]
+    paths = [dst for _, _, dst, _ in to_hash]
+    paths.extend(
+        src for (_, src, _, _), known in zip(to_hash, src_hashes) if not known
+    )
+    hashes = iter(hash_files(paths, workers))
+    dst_hashes = [next(hashes) for _ in to_hash]
+
+    diffs = []
+    for idx, (rel, _, _, src_st) in enumerate(to_hash):
+        if src_hashes[idx] is None:
+            src_hashes[idx] = next(hashes)
+            if cache is not None:
+                cache.put(src_st, src_hashes[idx])
+        if src_hashes[idx] != dst_hashes[idx]:
+            diffs.append(
+                Difference(rel, "content", src_hashes[idx], dst_hashes[idx])
+            )
+    return diffs
@@ -0,0 +1,192 @@
+"""
+Declarative description of large directory trees and their generator.
+
+The tree is a complete <fanout>-ary tree of directories <depth> levels deep.
+Files are spread over all its directories evenly; symlinks and hardlinks
+point at random files. All random choices come from <seed>, so the same spec
+always yields the same tree.
+
+Directories are named by a number and files by a letter and a number, to
+keep paths of deep trees short: creation goes through a descriptor of the
+root directory, so a path has to fit into PATH_MAX only relative to it.
+"""
+
+import math
+import os
+import random
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Tuple, Union
+
+# Content of every file is a slice of a pool of random bytes.
+_POOL_SIZE = 1 << 20
+# Amount of files a single writer task creates.
+_WRITE_BATCH = 512
+
+
+@dataclass(frozen=True)
+class TreeSpec:
+    """
+    Parameters of a generated tree.
+
+    <sizes> is a size distribution of files in bytes, one of:
+        ("fixed", size)
+        ("uniform", min_size, max_size)
+        ("lognormal", median_size, sigma)
+    <symlink_ratio> and <hardlink_ratio> are amounts of symlinks and extra
+    hardlinks relative to <files>. Besides, <hardlink_groups> distinct files
+    get <hardlink_group_size> names each, i.e. that many names share an
+    inode.
+    """
+
+    depth: int = 1
+    fanout: int = 2
+    files: int = 10
+    sizes: Tuple = ("fixed", 4096)
+    symlink_ratio: float = 0.0
+    hardlink_ratio: float = 0.0
+    hardlink_groups: int = 0
+    hardlink_group_size: int = 2
+    seed: int = 0
+
+
+@dataclass(frozen=True)
+class TreeStats:
+    """
+    Amount of entries and bytes in the generated tree.
+    """
+
+    dirs: int
+    files: int
+    symlinks: int
+    hardlinks: int  # extra names of files, groups included
+    bytes: int
+
+    @property
+    def entries(self) -> int:
+        """
+        All directory entries besides the root.
+        """
+        return self.dirs + self.files + self.symlinks + self.hardlinks
+
+
+def tree_dirs(spec: TreeSpec) -> List[str]:
+    """
+    Relative paths of all directories of the tree, root ("") first and every
+    parent before its children.
+    """
+    dirs = [""]
+    level = [""]
+    for _ in range(spec.depth):
+        level = [
+            os.path.join(parent, str(child))
+            for parent in level
+            for child in range(spec.fanout)
+        ]
+        dirs.extend(level)
+    return dirs
+
+
+def _size_sampler(spec: TreeSpec, rng: random.Random):
+    kind, *args = spec.sizes
+    if kind == "fixed":
+        return lambda: args[0]
+    if kind == "uniform":
+        return lambda: rng.randint(args[0], args[1])
+    if kind == "lognormal":
+        median, sigma = args
+        return lambda: int(rng.lognormvariate(math.log(median), sigma))
+    raise ValueError(f"Unknown size distribution: {spec.sizes}")
+
+
+def materialize(spec: TreeSpec, root: Union[str, Path]) -> TreeStats:
+    """
+    Create the tree described by <spec> under <root>.
+    """
+    rng = random.Random(spec.seed)
+    dirs = tree_dirs(spec)
+    sample_size = _size_sampler(spec, rng)
+
+    files = []
+    for idx in range(spec.files):
+        path = os.path.join(dirs[idx % len(dirs)], f"f{idx}")
+        files.append((path, sample_size(), rng.randrange(_POOL_SIZE)))
+
+    symlinks = []
+    for idx in range(round(spec.files * spec.symlink_ratio) if files else 0):
+        parent = rng.choice(dirs)
+        target = os.path.relpath(rng.choice(files)[0], parent or ".")
+        symlinks.append((os.path.join(parent, f"l{idx}"), target))
+
+    hardlinks = []
+    for idx in range(round(spec.files * spec.hardlink_ratio) if files else 0):
+        path = os.path.join(rng.choice(dirs), f"h{idx}")
+        hardlinks.append((path, rng.choice(files)[0]))
+
+    if spec.hardlink_groups > len(files):
+        raise ValueError(
+            f"{spec.hardlink_groups} hardlink groups need as many files, "
+            f"there are {len(files)}"
+        )
+    for group, idx in enumerate(
+        rng.sample(range(len(files)), spec.hardlink_groups)
+    ):
+        for member in range(1, spec.hardlink_group_size):
+            path = os.path.join(rng.choice(dirs), f"g{group}_{member}")
+            hardlinks.append((path, files[idx][0]))
+
+    pool = rng.randbytes(_POOL_SIZE)
+    pool = memoryview(pool + pool)
+
+    os.makedirs(root, exist_ok=True)
+    root_fd = os.open(root, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        for path in dirs[1:]:
+            os.mkdir(path, dir_fd=root_fd)
+
+        def write_batch(start):
+            for path, size, offset in files[start : start + _WRITE_BATCH]:
+                _write_file(root_fd, path, size, pool[offset:])
+
+        workers = min(32, (os.cpu_count() or 1) * 4)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(write_batch, range(0, len(files), _WRITE_BATCH)))
+
+        for path, target in symlinks:
+            os.symlink(target, path, dir_fd=root_fd)
+        for path, target in hardlinks:
+            os.link(target, path, src_dir_fd=root_fd, dst_dir_fd=root_fd)
+    finally:
+        os.close(root_fd)
+
+    return TreeStats(
+        dirs=len(dirs) - 1,
+        files=len(files),
+        symlinks=len(symlinks),
+        hardlinks=len(hardlinks),
+        bytes=sum(size for _, size, _ in files),
+    )
+
+
+def write_random_file(path: Union[str, Path], size: int, seed: int = 0):
+    """
+    Write a file of <size> seeded random bytes.
+    """
+    pool = random.Random(seed).randbytes(_POOL_SIZE)
+    _write_file(None, path, size, memoryview(pool))
+
+
+def _write_file(root_fd, path: str, size: int, content: memoryview):
+    """
+    Write <size> bytes of <content> into a new file, repeating it if needed.
+    """
+    fd = os.open(
+        path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644, dir_fd=root_fd
+    )
+    try:
+        chunk = content[:_POOL_SIZE]
+        while size > 0:
+            size -= os.write(fd, chunk[:size])
+    finally:
+        os.close(fd)
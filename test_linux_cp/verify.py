@@ -0,0 +1,77 @@
+"""
+Verification of copied file content in constant memory.
+"""
+
+from pathlib import Path
+from typing import Optional, Union
+
+CHUNK_SIZE = 1 << 20
+# Below that size a differing byte is looked for one by one.
+_SCAN_SIZE = 256
+
+
+def first_mismatch(
+    first: Union[str, Path],
+    second: Union[str, Path],
+    chunk_size: int = CHUNK_SIZE,
+) -> Optional[int]:
+    """
+    Offset of the first byte where the files differ, None if they are equal.
+
+    Files are read by chunks of <chunk_size>, and reading stops at the first
+    differing chunk. If one file is a prefix of the other, the offset is the
+    size of the shorter one.
+    """
+    buf_first = bytearray(chunk_size)
+    buf_second = bytearray(chunk_size)
+    offset = 0
+    with open(first, "rb", buffering=0) as f_first, open(
+        second, "rb", buffering=0
+    ) as f_second:
+        while True:
+            read_first = _read_full(f_first, buf_first)
+            read_second = _read_full(f_second, buf_second)
+            if read_first == read_second == chunk_size:
+                if buf_first != buf_second:
+                    return offset + _mismatch_index(buf_first, buf_second)
+            elif buf_first[:read_first] != buf_second[:read_second]:
+                return offset + _mismatch_index(
+                    buf_first[:read_first], buf_second[:read_second]
+                )
+            else:
+                return None
+            offset += chunk_size
+
+
+def _read_full(stream, buf: bytearray) -> int:
+    """
+    Fill <buf> from <stream> as much as possible, return the amount read.
+    """
+    view = memoryview(buf)
+    total = 0
+    while total < len(buf):
+        read = stream.readinto(view[total:])
+        if not read:
+            break
+        total += read
+    return total
+
+
+def _mismatch_index(first: bytearray, second: bytearray) -> int:
+    """
+    Index of the first differing byte, by bisection over slices.
+    """
+    low, high = 0, min(len(first), len(second))
+    if first[:high] == second[:high]:
+        return high
+    # first[:low] == second[:low] and first[:high] != second[:high]
+    while high - low > _SCAN_SIZE:
+        mid = (low + high) // 2
+        if first[low:mid] == second[low:mid]:
+            low = mid
+        else:
+            high = mid
+    for idx in range(low, high):
+        if first[idx] != second[idx]:
+            return idx
+    return high
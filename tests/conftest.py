@@ -2,16 +2,190 @@
 All fixtures are stored in this place
 """
 
+import os
+
 import pytest
+from test_linux_cp.attrs import probe_attrs
+from test_linux_cp.clone import shared_state
 from test_linux_cp.dir_structure import DirStructure
+from test_linux_cp.result_cache import ResultCache
+from test_linux_cp.storage import STORAGES, get_storage
+from test_linux_cp.teardown import remove_tree, wait_for_removals
+from test_linux_cp.tree_spec import TreeSpec
+
+
+def pytest_addoption(parser):
+    """
+    Options of the suite.
+    """
+    parser.addoption(
+        "--storage",
+        choices=sorted(STORAGES),
+        default="tmp",
+        help="storage backend for test structures: tmp (pytest tmp_path), "
+        "shm (tmpfs), disk or disk-cold",
+    )
+    parser.addoption(
+        "--no-cache",
+        action="store_true",
+        help="run every cp scenario, rather than replay results cached by "
+        "earlier runs",
+    )
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    """
+    Report how many cp scenarios were replayed from the result cache.
+    """
+    cache = getattr(config, "cp_result_cache", None)
+    if cache is not None and cache.hits + cache.misses:
+        terminalreporter.write_line(
+            f"cp result cache: {cache.hits} replayed, {cache.misses} run"
+        )
+
+
+@pytest.fixture(name="worker", scope="session")
+def xdist_worker():
+    """
+    Name of the pytest-xdist worker running the session, "main" w/o xdist.
+    """
+    return os.environ.get("PYTEST_XDIST_WORKER", "main")
+
+
+@pytest.fixture(name="storage", scope="session")
+def select_storage(request, worker):
+    """
+    Storage backend chosen with --storage. Backends with a place of their
+    own get a directory per session (and per xdist worker) there, cleaned up
+    at the end.
+    """
+    storage = get_storage(request.config.getoption("storage"))
+    if storage.base is None:
+        yield storage
+        return
+    session_root = storage.make_root(prefix=f"cp-tests-{worker}-")
+    yield get_storage(storage.name, base=session_root)
+    wait_for_removals()
+    remove_tree(session_root)
+
+
+@pytest.fixture(name="chattr_support", scope="session")
+def probe_chattr_support(tmp_path_factory, storage):
+    """
+    Attributes `chattr` can set on the storage of test structures, probed
+    once per session.
+    """
+    directory = storage.make_root(
+        default=tmp_path_factory.mktemp("chattr-probe"), prefix="chattr-"
+    )
+    yield probe_attrs(directory)
+    remove_tree(directory)
+
+
+@pytest.fixture(autouse=True)
+def skip_unsupported_chattr(request):
+    """
+    Skip tests marked with `chattr("<attrs>")` before they build anything,
+    if the attributes can't be set.
+    """
+    marker = request.node.get_closest_marker("chattr")
+    if marker is None:
+        return
+    support = request.getfixturevalue("chattr_support")
+    reason = support.missing("".join(marker.args))
+    if reason is not None:
+        pytest.skip(reason)
+
+
+@pytest.fixture(name="result_cache", scope="session")
+def load_result_cache(request):
+    """
+    Cache of cp scenario results in pytest's cache dir, None with
+    --no-cache or w/o the cacheprovider plugin.
+    """
+    cache = getattr(request.config, "cache", None)
+    if request.config.getoption("no_cache") or cache is None:
+        return None
+    result_cache = ResultCache(cache.mkdir("cp-results"))
+    request.config.cp_result_cache = result_cache
+    return result_cache
+
+
+@pytest.fixture(name="vfs_template", scope="session")
+def build_template_structure(tmp_path_factory, storage, worker):
+    """
+    Build the "golden" structure once per session. Tests get its clones.
+    Every xdist worker builds a template of its own.
+    """
+    root = storage.make_root(
+        default=tmp_path_factory.mktemp(f"template-{worker}"),
+        prefix=f"template-{worker}-",
+    )
+    template = DirStructure(root, storage=storage)
+    yield template.root_dir
+    template.clean()
+    wait_for_removals()
+
+
+@pytest.fixture(autouse=True)
+def guard_shared_files(request):
+    """
+    Fail tests using the template, which modify its shared files in place:
+    clones of all later tests would get the modified files.
+    """
+    if "vfs_template" not in request.fixturenames:
+        yield
+        return
+    template = request.getfixturevalue("vfs_template")
+    before = shared_state(template, DirStructure.shared_files)
+    yield
+    changed = [
+        path
+        for path, state in shared_state(
+            template, DirStructure.shared_files
+        ).items()
+        if state != before[path]
+    ]
+    if changed:
+        pytest.fail(
+            f"shared files of the template modified in place: {changed}; "
+            "replace them (unlink first) in tests instead"
+        )
 
 
 @pytest.fixture(name="vfs")
-def deploy_single_file_copying_structure(tmp_path):
+def deploy_single_file_copying_structure(
+    tmp_path, vfs_template, storage, result_cache
+):
     """
     Create a directory for tests with all the infrastructure
     """
-    structure = DirStructure(tmp_path)
-    structure.call_cmd(f"cd {tmp_path}")
+    structure = DirStructure(
+        storage.make_root(default=tmp_path),
+        template=vfs_template,
+        storage=storage,
+    )
+    structure.result_cache = result_cache
+    yield structure
+    structure.clean(background=True)
+
+
+@pytest.fixture(name="tree_vfs")
+def deploy_generated_tree_structure(tmp_path, request, storage, result_cache):
+    """
+    Create a directory with a tree generated from the TreeSpec given as an
+    indirect parameter, or from a small default one.
+    """
+    spec = getattr(
+        request,
+        "param",
+        TreeSpec(
+            depth=2, fanout=3, files=60, symlink_ratio=0.1, hardlink_ratio=0.1
+        ),
+    )
+    structure = DirStructure(
+        storage.make_root(default=tmp_path), spec=spec, storage=storage
+    )
+    structure.result_cache = result_cache
     yield structure
     structure.clean()
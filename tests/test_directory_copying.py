@@ -2,6 +2,9 @@
 This suite contains cases described under docs/functional.md -> "No flags" ->
 "Copying directory to directory"
 """
+import pytest
+from test_linux_cp.tree_diff import CONTENT_CHECKS
+from test_linux_cp.tree_spec import TreeSpec
 
 
 def test_code_copy_dir_to_existing_dir_omiting(vfs):
@@ -53,6 +56,19 @@ def test_dst_exists_copy_dir_to_existing_dir(vfs):
     assert (dst_dir / "SrcDir").exists()
 
 
+def test_content_copy_dir_to_existing_dir(vfs):
+    """
+    Verify cp copies complete directory content if copying existing dir into
+    existing dir with flag "-r"
+    """
+    dst_dir = vfs.root_dir / "DstDir"
+    dst_dir.mkdir()
+    vfs.call_copy(src=vfs.root_dir / "SrcDir", dst=dst_dir, flags="-r")
+    assert not vfs.diff_tree(
+        "SrcDir", dst_dir / "SrcDir", checks=CONTENT_CHECKS
+    )
+
+
 def test_code_copy_dir_to_nonexisting_dir_no_flag_r(vfs):
     """
     Verify cp returns code 1 if copying existing dir into non-existing dir w/o
@@ -96,3 +112,23 @@ def test_dst_exists_copy_dir_to_nonexisting_dir_no_flag_r(vfs):
     dst_dir = vfs.root_dir / "DstDir"
     vfs.call_copy(src=vfs.root_dir / "SrcDir", dst=dst_dir, flags="-r")
     assert dst_dir.exists()
+
+
+@pytest.mark.parametrize(
+    "tree_vfs",
+    [TreeSpec(depth=1, fanout=2, files=20, hardlink_groups=5)],
+    ids=["hardlink groups"],
+    indirect=True,
+)
+def test_hardlinks_copy_dir_with_flag_r(tree_vfs):
+    """
+    Verify cp copies every name of a multiply-linked file as a separate file
+    with flag -r
+    """
+    dst_dir = tree_vfs.root_dir / "DstDir"
+    tree_vfs.call_copy(src=tree_vfs.tree_root, dst=dst_dir, flags="-r")
+    diffs = tree_vfs.diff_tree(
+        tree_vfs.tree_root, dst_dir, checks=("hardlinks", "content")
+    )
+    assert {x.check for x in diffs} == {"hardlinks"}
+    assert len(diffs) == 2 * 5
@@ -0,0 +1,252 @@
+"""
+This suite runs combinations of flags from docs/functional.md, generated
+pairwise and pruned of equivalent ones, and verifies every flag still acts
+as it does alone
+"""
+import itertools
+import math
+import os
+import re
+import subprocess
+import time
+
+import pytest
+from test_linux_cp.dir_structure import DirStructure
+from test_linux_cp.flag_matrix import (
+    DIMENSIONS,
+    Dimension,
+    FlagCase,
+    accepted,
+    canonical,
+    canonical_flags,
+    cartesian_size,
+    covering_rows,
+    flag_matrix,
+    parse_flags,
+    run_cases,
+)
+
+# Mode of a source directory, which umask changes unless preserved.
+DIR_MODE = 0o777
+# Modification time of a source directory, kept only if preserved.
+DIR_MTIME = 10**18
+
+
+def cp_version():
+    """
+    (major, minor) version of the coreutils cp under test.
+    """
+    output = subprocess.run(
+        [DirStructure.cp, "--version"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    major, minor = re.search(r"(\d+)\.(\d+)", output).groups()
+    return int(major), int(minor)
+
+
+CP_VERSION = cp_version()
+# cp 9.1 renames the destination of a recursive copy to its simple backup
+# name relative to the working directory rather than to the destination
+# one, so the backup of "DstDir/SrcDir/srcC" lands in "SrcDir".
+MISPLACED_SIMPLE_BACKUP = pytest.mark.xfail(
+    CP_VERSION == (9, 1),
+    reason="cp 9.1 puts simple backups of a recursive copy in the wrong "
+    "directory",
+    strict=True,
+)
+
+
+@pytest.fixture(name="make_structure")
+def deploy_matrix_structures(tmp_path_factory, vfs_template, storage):
+    """
+    Factory of structures cloned from the template, one per flag case: the
+    destination already has an older copy of "SrcDir/srcC" newer than the
+    source one, and "SrcDir" has a symlink and a directory with a mode and
+    a modification time to preserve.
+    """
+    structures = []
+
+    def make():
+        root = storage.make_root(default=tmp_path_factory.mktemp("matrix"))
+        structure = DirStructure(root, template=vfs_template, storage=storage)
+        src_dir, dst_dir = root / "SrcDir", root / "DstDir" / "SrcDir"
+        (src_dir / "srcLnk").symlink_to(os.path.join("..", "srcB"))
+        (src_dir / "SrcSubDir").chmod(DIR_MODE)
+        os.utime(src_dir / "SrcSubDir", ns=(DIR_MTIME, DIR_MTIME))
+        dst_dir.mkdir(parents=True)
+        (dst_dir / "srcC").write_text("old")
+        future = time.time() + 86400
+        os.utime(dst_dir / "srcC", (future, future))
+        structures.append(structure)
+        return structure
+
+    yield make
+    for structure in structures:
+        structure.clean(background=True)
+
+
+def expected_problems(structure: DirStructure, case: FlagCase, result):
+    """
+    How the outcome of copying "SrcDir" into "DstDir" with the flags of
+    <case> differs from what every flag does alone.
+    """
+    code, stdout, stderr = result
+    options = case.options
+    dst_dir = structure.root_dir / "DstDir" / "SrcDir"
+    problems = []
+
+    def expect(condition, message):
+        if not condition:
+            problems.append(f"{case.flags!r}: {message}")
+
+    if not options.recursive:
+        expect(code != 0, "copied a directory w/o -r")
+        expect(not (dst_dir / "SrcSubDir").exists(), "directory copied")
+        return problems
+
+    expect(code == 0 or options.no_clobber, f"code {code}: {stderr}")
+    kept = options.no_clobber or options.update
+    expect(
+        (dst_dir / "srcC").read_text() == ("old" if kept else "foo"),
+        "existing destination " + ("replaced" if kept else "kept"),
+    )
+    backups = sorted(x.name for x in dst_dir.glob("srcC?*"))
+    expected = []
+    if options.backup and not kept:
+        suffix = ".~1~" if options.backup == "numbered" else "~"
+        expected = [f"srcC{suffix}"]
+    expect(backups == expected, f"backups {backups}, expected {expected}")
+    expect(
+        (dst_dir / "SrcSubDir" / "srcD").read_text() == "bar",
+        "nested file not copied",
+    )
+
+    sub_dir = (dst_dir / "SrcSubDir").stat()
+    umask = os.umask(0)
+    os.umask(umask)
+    mode = DIR_MODE if options.preserves("mode") else DIR_MODE & ~umask
+    expect(sub_dir.st_mode & 0o7777 == mode, f"mode {sub_dir.st_mode:o}")
+    expect(
+        (sub_dir.st_mtime_ns == DIR_MTIME) == options.preserves("timestamps"),
+        f"modification time {sub_dir.st_mtime_ns}",
+    )
+
+    link = dst_dir / "srcLnk"
+    if options.dereference == "L":
+        expect(not link.is_symlink(), "symlink not dereferenced")
+        expect(link.read_text() == "ham", "dereferenced content differs")
+    else:
+        expect(link.is_symlink(), "symlink dereferenced")
+
+    expect(bool(stdout) == options.verbose, f"output {stdout!r}")
+    return problems
+
+
+def test_flag_matrix_equivalent_spellings():
+    """
+    Verify spellings cp reads the same way have the same canonical form,
+    and different ones don't
+    """
+    assert canonical_flags("-a") == canonical_flags("-dR --preserve=all")
+    assert canonical_flags("--archive -r") == canonical_flags("-a")
+    assert canonical_flags("--backup=t") == canonical_flags(
+        "--backup=numbered"
+    )
+    assert canonical_flags("--backup=off") == canonical_flags("--backup=none")
+    # Unlike no "--backup", it is refused with "-n".
+    assert canonical_flags("--backup=off") != canonical_flags("")
+    assert canonical_flags("-H") == canonical_flags("-L")
+    assert canonical_flags("-rH") != canonical_flags("-rL")
+    assert canonical_flags("-a -L") != canonical_flags("-a")
+    assert canonical_flags("-p") != canonical_flags("--preserve=all")
+
+
+@pytest.mark.parametrize("strength", [2, 3])
+def test_flag_matrix_covers_all_tuples(strength):
+    """
+    Verify generated rows contain every allowed combination of values of
+    '{strength}' dimensions, in a fraction of the cartesian product
+    """
+    sizes = [len(x.pruned().values) for x in DIMENSIONS]
+    rows = covering_rows(sizes, strength)
+    for dims in itertools.combinations(range(len(sizes)), strength):
+        seen = {tuple(row[x] for x in dims) for row in rows}
+        assert len(seen) == math.prod(sizes[x] for x in dims)
+    assert len(rows) * 10 < cartesian_size()
+
+
+def test_flag_matrix_prunes_equivalent_combinations():
+    """
+    Verify combinations with the same canonical form run once
+    """
+    dimensions = [
+        Dimension("recursion", ("", "-r", "-R")),
+        Dimension("attributes", ("-a", "--archive", "-dR --preserve=all")),
+    ]
+    cases = flag_matrix(dimensions)
+    assert [x.flags for x in cases] == ["-a"]
+    assert cases[0].equivalents == ("-r -a",)
+
+
+def test_flag_matrix_skips_rejected_combinations():
+    """
+    Verify combinations cp rejects on usage ('-n' with any '--backup',
+    even '--backup=off') are not generated
+    """
+    assert not accepted("-n --backup=off")
+    for case in flag_matrix():
+        assert not (case.options.no_clobber and case.options.backup_given)
+
+
+@pytest.mark.parametrize(
+    "simple_backup",
+    [False, pytest.param(True, marks=MISPLACED_SIMPLE_BACKUP)],
+    ids=["other backups", "simple backup"],
+)
+def test_flag_matrix_pairwise_copy(make_structure, simple_backup):
+    """
+    Verify every flag of the pairwise combinations acts as it does alone on
+    copying a directory with an existing destination, either for the
+    combinations with simple backups ('{simple_backup}') or for the rest
+    """
+    cases = [
+        x
+        for x in flag_matrix()
+        if (x.options.backup == "simple") == simple_backup
+    ]
+    assert cases
+    runs = [(make_structure(), x) for x in cases]
+    results = run_cases(runs, src="SrcDir", dst="DstDir")
+    problems = []
+    for (structure, case), result in zip(runs, results):
+        problems.extend(expected_problems(structure, case, result))
+    assert not problems
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        ("-a", "-dR --preserve=all"),
+        ("-r --backup=t", "-R --backup=numbered"),
+        ("-r --backup=never", "--recursive --backup=simple"),
+        ("-rL", "-rH -L"),
+    ],
+)
+def test_flag_matrix_pruned_spellings_copy_same(make_structure, first, second):
+    """
+    Verify a combination pruned as equivalent ('{second}') copies the same
+    as the one run ('{first}')
+    """
+    assert canonical(parse_flags(first)) == canonical(parse_flags(second))
+    runs = [
+        (make_structure(), FlagCase(x, canonical(parse_flags(x))))
+        for x in (first, second)
+    ]
+    results = run_cases(runs, src="SrcDir", dst="DstDir")
+    assert results[0][0] == results[1][0]
+    (one, _), (other, _) = runs
+    checks = ["type", "mode", "owner", "link", "content"]
+    diff = one.diff_tree("DstDir", other.root_dir / "DstDir", checks)
+    assert not diff
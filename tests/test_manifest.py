@@ -0,0 +1,69 @@
+"""
+This suite verifies lookups of entries of test structures in their manifest
+"""
+import os
+import stat
+
+import pytest
+from test_linux_cp.manifest import Manifest
+
+
+def test_manifest_entries_as_attributes(vfs):
+    """
+    Verify entries of the default structure are found by name, w/o paths
+    kept in the structure itself
+    """
+    assert vfs.srcA == vfs.root_dir / "srcA"
+    assert vfs.srcD == vfs.root_dir / "SrcDir" / "SrcSubDir" / "srcD"
+    assert vfs.srcLink.is_symlink()
+    assert "srcA" not in vars(vfs)
+    with pytest.raises(AttributeError):
+        _ = vfs.srcMissing
+
+
+def test_manifest_lookup_by_path(tmp_path):
+    """
+    Verify entries sharing a name are told apart by their relative paths
+    """
+    for directory in ["one", "two", "two/one"]:
+        (tmp_path / directory).mkdir()
+        (tmp_path / directory / "same").write_text(directory, encoding="utf-8")
+    umask = os.umask(0)
+    os.umask(umask)
+    manifest = Manifest.scan(tmp_path)
+    assert len(manifest.find("same")) == 3
+    idx = manifest.index("two/one/same")
+    assert manifest.path(idx).read_text(encoding="utf-8") == "two/one"
+    mode = 0o666 & ~umask
+    assert manifest.entry(idx) == ("two/one/same", 7, mode, stat.S_IFREG)
+    assert manifest.entry(manifest.index("two/one")).type == stat.S_IFDIR
+    with pytest.raises(KeyError):
+        manifest.index("one/one/same")
+
+
+def test_manifest_of_generated_tree(tree_vfs):
+    """
+    Verify the manifest of a generated tree has every entry of it
+    """
+    paths = []
+    for parent, dirnames, filenames in os.walk(tree_vfs.root_dir):
+        for name in dirnames + filenames:
+            paths.append(
+                os.path.relpath(os.path.join(parent, name), tree_vfs.root_dir)
+            )
+    assert not hasattr(tree_vfs, "SrcTree")
+    manifest = tree_vfs.manifest
+    assert tree_vfs.SrcTree == tree_vfs.tree_root
+    indexed = [manifest.relpath(x) for x in range(len(manifest))]
+    assert sorted(indexed) == sorted(paths)
+    assert all(manifest.relpath(manifest.index(x)) == x for x in paths)
+
+
+def test_manifest_refresh(vfs):
+    """
+    Verify entries made after the scan are found once it is refreshed
+    """
+    (vfs.root_dir / "srcNew").write_text("new", encoding="utf-8")
+    assert not hasattr(vfs, "srcNew")
+    vfs.refresh_manifest()
+    assert vfs.srcNew == vfs.root_dir / "srcNew"
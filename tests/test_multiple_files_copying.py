@@ -91,47 +91,51 @@ def test_msg_multiple_files_second_is_missing(vfs, src_file_1, src_file_2):
     )
 
 
-def test_code_multiple_files_mask_applies(vfs):
+@pytest.mark.parametrize("shell", [False, True], ids=["exec", "shell"])
+def test_code_multiple_files_mask_applies(vfs, shell):
     """
     Verify cp returns code 0 if there are any files that correspond to the
     mask, and are copied
     """
     dst_dir = vfs.root_dir / "DstDir"
     dst_dir.mkdir()
-    code, *_ = vfs.call_copy(src="src*", dst=dst_dir)
+    code, *_ = vfs.call_copy(src="src*", dst=dst_dir, shell=shell)
     assert code == 0
 
 
-def test_dst_exists_multiple_files_mask_applies(vfs):
+@pytest.mark.parametrize("shell", [False, True], ids=["exec", "shell"])
+def test_dst_exists_multiple_files_mask_applies(vfs, shell):
     """
     Verify files that correspond to mask were copied to the destination.
     """
     dst_dir = vfs.root_dir / "DstDir"
     dst_dir.mkdir()
-    vfs.call_copy(src="src*", dst=dst_dir)
+    vfs.call_copy(src="src*", dst=dst_dir, shell=shell)
     source_files = [
         Path(x) for x in os.listdir(vfs.root_dir) if Path(x).is_file()
     ]
     assert all((dst_dir / x.name).exists() for x in source_files)
 
 
-def test_code_multiple_files_mask_doesnt_apply(vfs):
+@pytest.mark.parametrize("shell", [False, True], ids=["exec", "shell"])
+def test_code_multiple_files_mask_doesnt_apply(vfs, shell):
     """
     Verify cp returns code 1 if there are no files that correspond to the mask.
     """
     dst_dir = vfs.root_dir / "DstDir"
     dst_dir.mkdir()
-    code, *_ = vfs.call_copy(src="spam*", dst=dst_dir)
+    code, *_ = vfs.call_copy(src="spam*", dst=dst_dir, shell=shell)
     assert code == 1
 
 
-def test_msg_multiple_files_mask_doesnt_apply(vfs):
+@pytest.mark.parametrize("shell", [False, True], ids=["exec", "shell"])
+def test_msg_multiple_files_mask_doesnt_apply(vfs, shell):
     """
     Verify cp report an error if mask coudn't be applied to the files
     """
     dst_dir = vfs.root_dir / "DstDir"
     dst_dir.mkdir()
-    *_, stderr = vfs.call_copy(src="spam*", dst=dst_dir)
+    *_, stderr = vfs.call_copy(src="spam*", dst=dst_dir, shell=shell)
     assert stderr == bytes(
         "cp: cannot stat 'spam*': No such file or directory\n",
         encoding="utf-8",
@@ -0,0 +1,70 @@
+"""
+This suite verifies that cp scenarios replayed from the result cache leave
+the same results as cp itself
+"""
+import pytest
+from test_linux_cp.dir_structure import DirStructure
+from test_linux_cp.result_cache import ResultCache
+
+
+@pytest.fixture(name="twin")
+def deploy_twin_structure(tmp_path_factory, vfs, vfs_template, storage):
+    """
+    Second structure cloned from the same template as <vfs> on its storage,
+    and a result cache shared by both.
+    """
+    cache = ResultCache(tmp_path_factory.mktemp("cp-results"))
+    twin = DirStructure(
+        storage.make_root(default=tmp_path_factory.mktemp("twin")),
+        template=vfs_template,
+        storage=storage,
+    )
+    vfs.result_cache = twin.result_cache = cache
+    yield twin
+    twin.clean()
+
+
+@pytest.mark.parametrize(
+    "src, dst, flags",
+    [
+        ("SrcDir", "DstDir", "-r"),
+        ("SrcDir", "DstDir", "-a"),
+        ("srcA", "srcB", "--backup=numbered"),
+        ("srcMissing", "dstA", ""),
+    ],
+    ids=["recursive", "archive", "backup", "error"],
+)
+def test_result_cache_replay_same_as_run(vfs, twin, src, dst, flags):
+    """
+    Verify a replayed scenario gives the same output and tree as cp did
+    """
+    ran = vfs.call_copy(src=src, dst=dst, flags=flags)
+    replayed = twin.call_copy(src=src, dst=dst, flags=flags)
+    assert (twin.result_cache.hits, twin.result_cache.misses) == (1, 1)
+    assert replayed == ran
+    checks = ["type", "mode", "content", "hardlinks"]
+    assert twin.diff_tree(vfs.root_dir, twin.root_dir, checks) == []
+
+
+def test_result_cache_times_replayed(vfs, twin):
+    """
+    Verify a replayed "-a" scenario preserves modification times
+    """
+    vfs.call_copy(src="SrcDir", dst="DstDir", flags="-a")
+    twin.call_copy(src="SrcDir", dst="DstDir", flags="-a")
+    assert twin.result_cache.hits == 1
+    assert twin.diff_tree("SrcDir", "DstDir", ["mtime"]) == []
+
+
+def test_result_cache_miss_on_changed_tree(vfs, twin):
+    """
+    Verify a scenario is run again once a source file changes
+    """
+    vfs.call_copy(src="SrcDir", dst="DstDir", flags="-r")
+    # srcC is shared with the template, so it is replaced, not rewritten.
+    changed = twin.root_dir / "SrcDir" / "srcC"
+    changed.unlink()
+    changed.write_text("changed")
+    twin.call_copy(src="SrcDir", dst="DstDir", flags="-r")
+    assert twin.result_cache.hits == 0
+    assert (twin.root_dir / "DstDir" / "srcC").read_text() == "changed"
@@ -11,6 +11,10 @@ import os
 import time
 
 import pytest
+from test_linux_cp.process import CopyStalled
+
+# Attributes, which forbid to overwrite a file.
+CHATTR_ATTRS = [pytest.param(x, marks=pytest.mark.chattr(x)) for x in "ia"]
 
 
 def test_src_exists_dst_missing_same_dir(vfs):
@@ -28,7 +32,7 @@ def test_src_exists_dst_missing_same_dir_same_file(vfs):
     """
     dst_file = vfs.root_dir / "dstA"
     vfs.call_copy(src=vfs.srcA.name, dst=dst_file.name)
-    assert vfs.srcA.read_text() == dst_file.read_text()
+    assert vfs.same_content(vfs.srcA, dst_file)
 
 
 def test_code_if_src_not_readable_dst_missing(vfs):
@@ -56,9 +60,16 @@ def test_src_replaces_existing_dst(vfs):
     dst_file = vfs.root_dir / "dstA"
     dst_file.write_text("Goodbye!")
     vfs.call_copy(src=vfs.srcA.name, dst=dst_file.name)
-    src_content = vfs.srcA.read_text()
-    dst_content = dst_file.read_text()
-    assert src_content == dst_content
+    assert vfs.same_content(vfs.srcA, dst_file)
+
+
+def test_dst_content_if_src_is_large_binary(vfs):
+    """
+    Verify cp copies large binary file byte by byte
+    """
+    src_file = vfs.make_file("srcBig", (8 << 20) + 7)
+    vfs.call_copy(src=src_file, dst="dstBig")
+    assert vfs.first_mismatch(src_file, "dstBig") is None
 
 
 def test_code_if_src_doesnt_replace_not_writeable_dst(vfs):
@@ -121,6 +132,19 @@ def test_dst_exists_if_src_copied_as_relative(vfs, path_prefix):
     assert (vfs.root_dir / "dstA").exists()
 
 
+def test_dst_exists_if_copied_concurrently(vfs):
+    """
+    Verify independent cp calls run concurrently all create their
+    destination files.
+    """
+    dst_files = [vfs.root_dir / f"dst{x}" for x in range(8)]
+    results = vfs.run_copies(
+        [{"src": vfs.srcA, "dst": x} for x in dst_files], concurrency=4
+    )
+    assert all(code == 0 for code, *_ in results)
+    assert all(vfs.same_content(vfs.srcA, x) for x in dst_files)
+
+
 def test_code_if_src_copied_as_absolute(vfs):
     """
     Verify cp returns code 0 on success if src is copied as absolute path
@@ -168,6 +192,18 @@ def test_dst_exists_if_dst_copied_as_relative(vfs, relative_path):
     assert (vfs.root_dir / relative_path / "dstA").exists()
 
 
+def test_dst_exists_if_names_have_spaces_and_masks(vfs):
+    """
+    Verify cp copies a file whose source and destination names contain spaces
+    and mask characters.
+    """
+    src_file = vfs.root_dir / "src [A] *"
+    src_file.write_text("Don't panic")
+    dst_file = vfs.root_dir / "dst A?"
+    vfs.call_copy(src=src_file, dst=dst_file)
+    assert vfs.same_content(src_file, dst_file)
+
+
 def test_code_if_dst_copied_as_absolute(vfs):
     """
     Verify cp returns code 0 on success if destination is absolute path
@@ -274,8 +310,7 @@ def test_msg_error_on_missing_dst_dir(vfs):
     )
 
 
-@pytest.mark.chattr
-@pytest.mark.parametrize("attr", ["i", "a"])
+@pytest.mark.parametrize("attr", CHATTR_ATTRS)
 def test_code_on_dst_file_has_attr(vfs, attr):
     """
     Verify cp returns status code 1, if destination file exists and has
@@ -285,12 +320,10 @@ def test_code_on_dst_file_has_attr(vfs, attr):
     dst_file.write_text("Autobots, roll out!")
     vfs.set_attr(file=dst_file, attr=f"+{attr}")
     code, *_ = vfs.call_copy(src=vfs.srcA, dst=dst_file)
-    vfs.set_attr(file=dst_file, attr=f"-{attr}")
     assert code == 1
 
 
-@pytest.mark.chattr
-@pytest.mark.parametrize("attr", ["i", "a"])
+@pytest.mark.parametrize("attr", CHATTR_ATTRS)
 def test_msg_on_dst_file_has_attr(vfs, attr):
     """
     Verify cp reports an error if destination file exists and has attribute
@@ -300,7 +333,6 @@ def test_msg_on_dst_file_has_attr(vfs, attr):
     dst_file.write_text("Autobots, roll out!")
     vfs.set_attr(file=dst_file, attr=f"+{attr}")
     *_, stderr = vfs.call_copy(src=vfs.srcA, dst=dst_file)
-    vfs.set_attr(file=dst_file, attr=f"-{attr}")
     assert stderr == bytes(
         f"cp: cannot create regular file '{dst_file}': "
         "Operation not permitted\n",
@@ -308,8 +340,7 @@ def test_msg_on_dst_file_has_attr(vfs, attr):
     )
 
 
-@pytest.mark.chattr
-@pytest.mark.parametrize("attr", ["i", "a"])
+@pytest.mark.parametrize("attr", CHATTR_ATTRS)
 def test_dst_remains_on_dst_file_has_attr(vfs, attr):
     """
     Verify dst content remains as initial, if cp failed tocopy over a file with
@@ -320,12 +351,11 @@ def test_dst_remains_on_dst_file_has_attr(vfs, attr):
     dst_file.write_text(reference_content)
     vfs.set_attr(file=dst_file, attr=f"+{attr}")
     vfs.call_copy(src=vfs.srcA, dst=dst_file)
-    vfs.set_attr(file=dst_file, attr=f"-{attr}")
     dst_content = dst_file.read_text()
     assert dst_content == reference_content
 
 
-@pytest.mark.chattr
+@pytest.mark.chattr("A")
 def test_src_atime_remains_on_attr_A(vfs):  # pylint: disable=invalid-name
     """
     Verify cp won't change atime if src file has "A" attibute set.
@@ -335,6 +365,19 @@ def test_src_atime_remains_on_attr_A(vfs):  # pylint: disable=invalid-name
     time.sleep(0.1)
     vfs.set_attr(file=vfs.srcA, attr="+A")
     vfs.call_copy(src=vfs.srcA, dst="dstA")
-    vfs.set_attr(file=vfs.srcA, attr="-A")
     final_stat = os.stat(vfs.srcA)
     assert init_stat.st_atime_ns == final_stat.st_atime_ns
+
+
+def test_stall_on_fifo_src_wo_writer(vfs):
+    """
+    Verify cp blocks on a FIFO source nobody writes to, and is killed as
+    stalled long before the timeout.
+    """
+    os.mkfifo(vfs.root_dir / "srcFifo")
+    start = time.monotonic()
+    with pytest.raises(CopyStalled) as stalled:
+        vfs.call_copy(src="srcFifo", dst="dstA", timeout=60, stall=0.5)
+    assert time.monotonic() - start < 10
+    assert stalled.value.report.name == "cp"
+    assert not (vfs.root_dir / "dstA").exists()
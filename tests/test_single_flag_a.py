@@ -5,6 +5,7 @@ This suite contains tests for section docs/functional.md -> single-flag cases
 import os
 
 import pytest
+from test_linux_cp.tree_spec import TreeSpec
 
 
 @pytest.mark.parametrize(
@@ -40,3 +41,109 @@ def test_content_copy_all_dir_as_archive(vfs, flag):
     for _, dirnames, filenames in os.walk(dst_dir):
         dst_content.append([dirnames, filenames])
     assert src_content == dst_content
+
+
+@pytest.mark.parametrize(
+    "flag", ["-a", "--archive"], ids=["short flag", "long flag"]
+)
+def test_attrs_copy_all_dir_as_archive(vfs, flag):
+    """
+    Verify cp preserves content, modes, owners, timestamps and extended
+    attributes of the complete directory if called with flag '{flag}'.
+    """
+    src_dir = vfs.root_dir / "SrcDir"
+    dst_dir = vfs.root_dir / "DstDir"
+    # srcC is shared with the template: give it an inode of its own first.
+    src_file = src_dir / "srcC"
+    content = src_file.read_bytes()
+    src_file.unlink()
+    src_file.write_bytes(content)
+    src_file.chmod(0o640)
+    os.utime(src_dir / "SrcSubDir", ns=(0, 10**18))
+    vfs.call_copy(src=src_dir, dst=dst_dir, flags=flag)
+    assert not vfs.diff_tree(src_dir, dst_dir)
+
+
+@pytest.mark.parametrize(
+    "tree_vfs",
+    [
+        TreeSpec(depth=1, fanout=4, files=100, symlink_ratio=0.2),
+        TreeSpec(depth=40, fanout=1, files=40, hardlink_ratio=0.5),
+    ],
+    ids=["wide tree", "deep tree"],
+    indirect=True,
+)
+def test_content_copy_generated_tree_as_archive(tree_vfs):
+    """
+    Verify cp copies complete generated tree if called with flag '-a'.
+    """
+    dst_dir = tree_vfs.root_dir / "DstDir"
+    tree_vfs.call_copy(src=tree_vfs.tree_root, dst=dst_dir, flags="-a")
+
+    src_content = []
+    for _, dirnames, filenames in os.walk(tree_vfs.tree_root):
+        dirnames.sort()
+        src_content.append([list(dirnames), sorted(filenames)])
+    dst_content = []
+    for _, dirnames, filenames in os.walk(dst_dir):
+        dirnames.sort()
+        dst_content.append([list(dirnames), sorted(filenames)])
+    assert src_content == dst_content
+
+
+@pytest.mark.parametrize(
+    "tree_vfs",
+    [
+        TreeSpec(
+            depth=2,
+            fanout=4,
+            files=400,
+            sizes=("lognormal", 4096, 1.5),
+            symlink_ratio=0.1,
+        ),
+    ],
+    ids=["random sizes"],
+    indirect=True,
+)
+def test_attrs_copy_generated_tree_as_archive(tree_vfs):
+    """
+    Verify cp preserves content and attributes of the complete generated tree
+    if called with flag '-a'.
+    """
+    dst_dir = tree_vfs.root_dir / "DstDir"
+    tree_vfs.call_copy(src=tree_vfs.tree_root, dst=dst_dir, flags="-a")
+    assert not tree_vfs.diff_tree(tree_vfs.tree_root, dst_dir)
+
+
+@pytest.mark.parametrize(
+    "tree_vfs",
+    [
+        TreeSpec(
+            depth=2,
+            fanout=3,
+            files=200,
+            hardlink_groups=50,
+            hardlink_group_size=4,
+        ),
+    ],
+    ids=["hardlink groups"],
+    indirect=True,
+)
+@pytest.mark.parametrize(
+    "flag",
+    ["-a", "-r --preserve=links"],
+    ids=["archive", "preserve links"],
+)
+def test_hardlinks_copy_generated_tree_as_archive(tree_vfs, flag):
+    """
+    Verify cp keeps names sharing an inode linked in the copy if called
+    with flag '{flag}'.
+    """
+    dst_dir = tree_vfs.root_dir / "DstDir"
+    code, _, msg = tree_vfs.call_copy(
+        src=tree_vfs.tree_root, dst=dst_dir, flags=flag
+    )
+    assert code == 0, msg
+    assert not tree_vfs.diff_tree(
+        tree_vfs.tree_root, dst_dir, checks=("type", "hardlinks")
+    )
@@ -5,6 +5,36 @@ This suite contains tests ftom the docs/functional.md -> "Single-flag cases" ->
 import os
 
 import pytest
+from test_linux_cp.dir_structure import DirStructure
+
+
+@pytest.fixture(name="backup_vfs", scope="module")
+def deploy_module_structure(
+    tmp_path_factory, vfs_template, storage, result_cache
+):
+    """
+    Structure shared by all tests of the suite, with a snapshot of its
+    initial state.
+    """
+    structure = DirStructure(
+        storage.make_root(default=tmp_path_factory.mktemp("backup")),
+        template=vfs_template,
+        storage=storage,
+    )
+    structure.result_cache = result_cache
+    structure.snapshot()
+    yield structure
+    structure.clean(background=True)
+
+
+@pytest.fixture(name="vfs")
+def restore_module_structure(backup_vfs):
+    """
+    The structure of the suite, restored to its initial state: only files
+    the previous test changed are rewritten, rather than the whole tree.
+    """
+    backup_vfs.restore()
+    return backup_vfs
 
 
 @pytest.mark.parametrize("opt", ["none", "off"])
@@ -35,7 +65,7 @@ def test_backup_none_dst_content_option(vfs, opt, backup_exists):
     if backup_exists:
         (vfs.root_dir / "dstA~").write_text("This is faked backup")
     vfs.call_copy(src=vfs.srcA, dst="dstA", flags=f"--backup={opt}")
-    assert (vfs.root_dir / "dstA").read_text() == vfs.srcA.read_text()
+    assert vfs.same_content("dstA", vfs.srcA)
 
 
 @pytest.mark.parametrize(
@@ -84,7 +114,7 @@ def test_cp_ignores_backups_if_no_dest_file_dst_content(vfs, opt):
     (vfs.root_dir / "dstA~").write_text("Faked simple backup")
     (vfs.root_dir / "dstA.~1~").write_text("Faked numbered backup")
     vfs.call_copy(vfs.srcA, dst="dstA", flags=f"--backup={opt}")
-    assert (vfs.root_dir / "dstA").read_text() == vfs.srcA.read_text()
+    assert vfs.same_content("dstA", vfs.srcA)
 
 
 @pytest.mark.parametrize("opt", ["numbered", "t"])
@@ -116,7 +146,25 @@ def test_backup_numbered_backup_option_dst_content(vfs, opt, backups):
     if backups > 0:
         (vfs.root_dir / "dstA.~1~").write_text("Faked destination")
     vfs.call_copy(src=vfs.srcA, dst="dstA", flags=f"--backup={opt}")
-    assert (vfs.root_dir / "dstA").read_text() == vfs.srcA.read_text()
+    assert vfs.same_content("dstA", vfs.srcA)
+
+
+@pytest.mark.parametrize("backups", [1000, 10000])
+def test_backup_numbered_many_backups(vfs, backups):
+    """
+    Verify 'cp --backup=numbered' picks the next number if '{backups}'
+    backups are in destination.
+    """
+    (vfs.root_dir / "dstA").write_text("Faked destination")
+    vfs.make_backups("dstA", backups)
+    code, _, msg = vfs.call_copy(
+        src=vfs.srcA, dst="dstA", flags="--backup=numbered"
+    )
+    assert code == 0, msg
+    assert (vfs.root_dir / f"dstA.~{backups + 1}~").read_text() == (
+        "Faked destination"
+    )
+    assert vfs.same_content("dstA", vfs.srcA)
 
 
 @pytest.mark.parametrize("opt", ["existing", "nil"])
@@ -193,7 +241,7 @@ def test_backup_existing_backup_option_dst_content(
         (vfs.root_dir / "dstA.~1~").write_text("Faked numbered backup")
 
     vfs.call_copy(src=vfs.srcA, dst="dstA", flags=f"--backup={opt}")
-    assert (vfs.root_dir / "dstA").read_text() == vfs.srcA.read_text()
+    assert vfs.same_content("dstA", vfs.srcA)
 
 
 @pytest.mark.parametrize("opt", ["existing", "nil"])
@@ -231,4 +279,4 @@ def test_backup_simple_backup_option_dst_content(vfs, opt, s_backups):
         (vfs.root_dir / "dstA~").write_text("Faked simple backup")
 
     vfs.call_copy(src=vfs.srcA, dst="dstA", flags=f"--backup={opt}")
-    assert (vfs.root_dir / "dstA").read_text() == vfs.srcA.read_text()
+    assert vfs.same_content("dstA", vfs.srcA)
@@ -17,7 +17,7 @@ def test_dst_content_flag_n_destination_is_missing(vfs):
     Verify cp copies file if destination is missing
     """
     vfs.call_copy(src=vfs.srcA, dst="dstA", flags="-n")
-    assert (vfs.root_dir / "dstA").read_text() == vfs.srcA.read_text()
+    assert vfs.same_content("dstA", vfs.srcA)
 
 
 def test_code_flag_n_destination_is_present(vfs):
@@ -0,0 +1,92 @@
+"""
+This suite contains tests for section docs/functional.md -> single-flag cases
+-> "--sparse"
+"""
+import pytest
+from test_linux_cp.sparse import (
+    BLOCK_SIZE,
+    LAYOUTS,
+    allocated_bytes,
+    make_layout,
+)
+
+FILE_SIZE = 8 << 20
+# Bytes cp reads besides the file itself: locale data, etc.
+READ_SLACK = 64 << 10
+SPARSE_LAYOUTS = [x for x in LAYOUTS if x != "dense"]
+
+
+def allocation_bound(layout) -> int:
+    """
+    Bytes a file of the <layout> takes w/o materialized holes.
+    """
+    return layout.data_bytes + BLOCK_SIZE * len(layout.extents)
+
+
+@pytest.mark.parametrize("mode", ["auto", "always", "never"])
+@pytest.mark.parametrize("layout", list(LAYOUTS))
+def test_dst_content_sparse(vfs, mode, layout):
+    """
+    Verify cp copies content of a '{layout}' file with '--sparse={mode}'.
+    """
+    vfs.make_sparse_file("srcSparse", make_layout(layout, FILE_SIZE))
+    code, _, msg = vfs.call_copy(
+        src="srcSparse", dst="dstSparse", flags=f"--sparse={mode}"
+    )
+    assert code == 0, msg
+    assert vfs.same_content("dstSparse", "srcSparse")
+
+
+@pytest.mark.parametrize("mode", ["auto", "always"])
+@pytest.mark.parametrize("layout", SPARSE_LAYOUTS)
+def test_holes_kept_sparse(vfs, mode, layout):
+    """
+    Verify cp doesn't materialize holes of a '{layout}' file with
+    '--sparse={mode}'.
+    """
+    src = vfs.make_sparse_file("srcSparse", make_layout(layout, FILE_SIZE))
+    vfs.call_copy(src="srcSparse", dst="dstSparse", flags=f"--sparse={mode}")
+    dst_allocated = allocated_bytes(vfs.root_dir / "dstSparse")
+    assert dst_allocated <= allocated_bytes(src)
+
+
+@pytest.mark.parametrize("layout", SPARSE_LAYOUTS)
+def test_zeros_punched_sparse_always(vfs, layout):
+    """
+    Verify cp turns zeros of a dense '{layout}' file into holes with
+    '--sparse=always'.
+    """
+    spec = make_layout(layout, FILE_SIZE)
+    vfs.make_sparse_file("srcSparse", spec, zeros=True)
+    vfs.call_copy(src="srcSparse", dst="dstSparse", flags="--sparse=always")
+    dst_allocated = allocated_bytes(vfs.root_dir / "dstSparse")
+    assert dst_allocated <= allocation_bound(spec)
+    assert vfs.same_content("dstSparse", "srcSparse")
+
+
+def test_holes_materialized_sparse_never(vfs):
+    """
+    Verify cp writes holes out as zeros with '--sparse=never'.
+    """
+    vfs.make_sparse_file("srcSparse", make_layout("hole", FILE_SIZE))
+    vfs.call_copy(src="srcSparse", dst="dstSparse", flags="--sparse=never")
+    assert allocated_bytes(vfs.root_dir / "dstSparse") >= FILE_SIZE
+
+
+@pytest.mark.parametrize("mode", ["auto", "always", "never"])
+@pytest.mark.parametrize("layout", SPARSE_LAYOUTS)
+def test_holes_not_read_sparse(vfs, mode, layout):
+    """
+    Verify cp reads only data regions of a '{layout}' file with
+    '--sparse={mode}'.
+    """
+    spec = make_layout(layout, FILE_SIZE)
+    vfs.make_sparse_file("srcSparse", spec)
+    result = vfs.call_copy(
+        src="srcSparse",
+        dst="dstSparse",
+        flags=f"--sparse={mode}",
+        instrument=True,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.usage.rchar <= spec.data_bytes + READ_SLACK
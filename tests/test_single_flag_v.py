@@ -0,0 +1,113 @@
+"""
+This suite contains tests for section docs/functional.md -> single-flag cases
+-> "-v"
+"""
+import pytest
+from test_linux_cp.stream import CopyIndex, parse_line
+from test_linux_cp.tree_spec import TreeSpec
+
+
+def test_event_flag_v_single_file(vfs):
+    """
+    Verify cp reports the copied file with flag -v
+    """
+    with vfs.stream_copy(src="srcA", dst="dstA", flags="-v") as stream:
+        events = list(stream)
+    assert stream.returncode == 0
+    assert [(x.kind, x.src, x.dst) for x in events] == [
+        ("copy", "srcA", "dstA")
+    ]
+
+
+@pytest.mark.parametrize(
+    "name",
+    ["it's", 'say "hi"', 'it\'s "hi"', "new\nline", "tab\there", "ünicode"],
+    ids=[
+        "single quote",
+        "double quotes",
+        "both quotes",
+        "newline",
+        "tab",
+        "non-ascii",
+    ],
+)
+def test_event_flag_v_quoted_name(vfs, name):
+    """
+    Verify names cp quotes in -v output are parsed back
+    """
+    (vfs.root_dir / name).write_text("quoted")
+    (vfs.root_dir / "DstDir").mkdir()
+    with vfs.stream_copy(src=[name], dst="DstDir", flags="-v") as stream:
+        events = list(stream)
+    assert [(x.src, x.dst) for x in events] == [(name, f"DstDir/{name}")]
+
+
+def test_event_flag_v_parse_escaped_quote():
+    """
+    Verify a quote escaped between quoted parts of a name is parsed as
+    a literal one
+    """
+    event = parse_line(b"'a'\\''b\"c' -> 'd'")
+    assert (event.kind, event.src, event.dst) == ("copy", "a'b\"c", "d")
+
+
+@pytest.mark.parametrize("opt", ["numbered", "simple"])
+def test_event_flag_v_backup(vfs, opt):
+    """
+    Verify cp reports the backup made with flags -v --backup={opt}
+    """
+    (vfs.root_dir / "dstA").write_text("Faked destination")
+    backup = "dstA.~1~" if opt == "numbered" else "dstA~"
+    with vfs.stream_copy(
+        src="srcA", dst="dstA", flags=f"-v --backup={opt}"
+    ) as stream:
+        (event,) = stream
+    assert event.backup == backup
+    assert (vfs.root_dir / backup).read_text() == "Faked destination"
+
+
+def test_event_flag_v_remove_destination(vfs):
+    """
+    Verify cp reports the removed destination with flag -v
+    """
+    (vfs.root_dir / "dstA").write_text("Faked destination")
+    with vfs.stream_copy(
+        src="srcA", dst="dstA", flags="-v --remove-destination"
+    ) as stream:
+        kinds = [(x.kind, x.dst) for x in stream]
+    assert kinds == [("remove", "dstA"), ("copy", "dstA")]
+
+
+def test_event_flag_v_error(vfs):
+    """
+    Verify cp errors come as events naming the file
+    """
+    with vfs.stream_copy(src="srcMissing", dst="dstA", flags="-v") as stream:
+        index = CopyIndex().feed(stream)
+    assert stream.returncode == 1
+    assert [x.dst for x in index.errors] == ["srcMissing"]
+
+
+@pytest.mark.parametrize(
+    "tree_vfs",
+    [TreeSpec(depth=2, fanout=4, files=2000, sizes=("fixed", 16))],
+    ids=["2000 files"],
+    indirect=True,
+)
+def test_events_flag_v_recursive_bounded(tree_vfs):
+    """
+    Verify cp reports every entry of a tree with flags -rv, while only
+    a bounded tail of the output is retained
+    """
+    seen = 0
+    with tree_vfs.stream_copy(
+        src=tree_vfs.tree_dir, dst="DstDir", flags="-rv", raw_limit=4096
+    ) as stream:
+        for event in stream:
+            assert event.kind == "copy"
+            assert (tree_vfs.root_dir / event.dst).exists()
+            seen += 1
+    assert stream.returncode == 0
+    assert seen == tree_vfs.stats.entries + 1
+    assert stream.truncated
+    assert len(stream.stdout) <= 4096
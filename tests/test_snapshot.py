@@ -0,0 +1,83 @@
+"""
+This suite verifies that a structure restored from its snapshot is the same
+as before, and that restoring rewrites only what changed
+"""
+import os
+from pathlib import Path
+
+
+def tree_state(root: Path) -> dict:
+    """
+    Type, mode, size, modification time and content (target for symlinks)
+    of every entry under <root>, and of <root> itself.
+    """
+    state = {}
+    for path in [root, *root.rglob("*")]:
+        info = path.lstat()
+        if path.is_symlink():
+            content = os.readlink(path)
+        elif path.is_file():
+            content = path.read_bytes()
+        else:
+            content = None
+        state[str(path.relative_to(root))] = (
+            info.st_mode,
+            info.st_size,
+            info.st_mtime_ns,
+            content,
+        )
+    return state
+
+
+def test_restore_undoes_changes(vfs):
+    """
+    Verify restore brings back files changed in place, replaced, removed,
+    and removes new files and directories
+    """
+    link = vfs.root_dir / "srcLink"
+    vfs.snapshot()
+    before = tree_state(vfs.root_dir)
+    vfs.srcA.write_text("changed in place")
+    link.unlink()
+    link.symlink_to(vfs.srcB)
+    (vfs.root_dir / "SrcDir" / "srcC").unlink()
+    (vfs.root_dir / "SrcDir" / "SrcSubDir").chmod(0o700)
+    (vfs.root_dir / "dstA").write_text("new")
+    (vfs.root_dir / "DstDir" / "deep").mkdir(parents=True)
+    vfs.make_backups("srcB", 10)
+
+    assert vfs.restore() > 0
+    assert tree_state(vfs.root_dir) == before
+
+
+def test_restore_rewrites_only_changes(vfs):
+    """
+    Verify restore of an untouched structure changes nothing, and of a
+    structure with one changed file rewrites just that file
+    """
+    vfs.snapshot()
+    assert vfs.restore() == 0
+    inode = vfs.srcB.stat().st_ino
+    vfs.srcA.write_text("changed in place")
+    assert vfs.restore() == 1
+    assert vfs.srcA.read_text() == "spam"
+    assert vfs.srcB.stat().st_ino == inode
+    assert vfs.restore() == 0
+
+
+def test_restore_keeps_hardlinks(tree_vfs):
+    """
+    Verify names sharing an inode stay linked after one of them is
+    replaced and restored
+    """
+    linked = {}
+    for path in sorted(tree_vfs.tree_root.rglob("*")):
+        if path.is_file() and not path.is_symlink():
+            linked.setdefault(path.stat().st_ino, []).append(path)
+    group = next(x for x in linked.values() if len(x) > 1)
+    tree_vfs.snapshot()
+    group[0].unlink()
+    group[0].write_text("replaced")
+    tree_vfs.restore()
+    assert len({x.stat().st_ino for x in group}) == 1
+    assert group[0].read_bytes() == group[1].read_bytes()